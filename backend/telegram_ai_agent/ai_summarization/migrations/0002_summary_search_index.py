@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# Full-text index over the content of the summaries.
+# The statements are frozen here rather than generated by
+# telegram_integration.search, so later changes to that module do not change
+# what this migration does.
+INSTALL = {
+    # Stored generated tsvector column with a GIN index
+    'postgresql': [
+        "ALTER TABLE ai_summarization_summary ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(content, '')), 'A')) STORED",
+        'CREATE INDEX IF NOT EXISTS ai_summarization_summary_search_idx ON ai_summarization_summary USING GIN (search_vector)',
+    ],
+    # External-content FTS5 table kept in sync by triggers
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS ai_summarization_summary_fts_insert',
+        'DROP TRIGGER IF EXISTS ai_summarization_summary_fts_delete',
+        'DROP TRIGGER IF EXISTS ai_summarization_summary_fts_update',
+        'DROP TABLE IF EXISTS ai_summarization_summary_fts',
+        "CREATE VIRTUAL TABLE ai_summarization_summary_fts USING fts5(content, content='ai_summarization_summary', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO ai_summarization_summary_fts(ai_summarization_summary_fts) VALUES ('rebuild')",
+        'CREATE TRIGGER ai_summarization_summary_fts_insert AFTER INSERT ON ai_summarization_summary BEGIN INSERT INTO ai_summarization_summary_fts(rowid, content) VALUES (new.id, new.content); END',
+        "CREATE TRIGGER ai_summarization_summary_fts_delete AFTER DELETE ON ai_summarization_summary BEGIN INSERT INTO ai_summarization_summary_fts(ai_summarization_summary_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        "CREATE TRIGGER ai_summarization_summary_fts_update AFTER UPDATE OF content ON ai_summarization_summary BEGIN INSERT INTO ai_summarization_summary_fts(ai_summarization_summary_fts, rowid, content) VALUES ('delete', old.id, old.content); INSERT INTO ai_summarization_summary_fts(rowid, content) VALUES (new.id, new.content); END",
+    ],
+}
+
+UNINSTALL = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS ai_summarization_summary_search_idx',
+        'ALTER TABLE ai_summarization_summary DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS ai_summarization_summary_fts_insert',
+        'DROP TRIGGER IF EXISTS ai_summarization_summary_fts_delete',
+        'DROP TRIGGER IF EXISTS ai_summarization_summary_fts_update',
+        'DROP TABLE IF EXISTS ai_summarization_summary_fts',
+    ],
+}
+
+
+def install(apps, schema_editor):
+    # Other backends have no index, search scans the table
+    for statement in INSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def uninstall(apps, schema_editor):
+    for statement in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_summarization', '0001_initial'),
+        ('telegram_integration', '0014_message_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -11,6 +11,10 @@ class SummarySerializer(serializers.ModelSerializer):
         fields = ['id', 'group', 'start_date', 'end_date', 'content', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+class FlatSummarySerializer(SummarySerializer):
+    """Summary with the id of its group, for flat lists"""
+    group = serializers.PrimaryKeyRelatedField(read_only=True)
+
 class SummaryFeedbackSerializer(serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         read_only=True,
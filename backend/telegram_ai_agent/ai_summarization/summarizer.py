@@ -1,14 +1,26 @@
 import google.generativeai as genai
 from django.conf import settings
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
 logger = logging.getLogger(__name__)
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, about four characters per token"""
+    return len(text) // 4 + 1
+
 class GeminiSummarizer:
     """
     Class to handle summarization of messages using Google's Gemini 2.0 Flash model
+
+    Windows too large for one prompt are summarized map-reduce style: the
+    messages are split into chunks of about SUMMARY_CHUNK_TOKENS tokens,
+    the chunks are summarized concurrently (at most SUMMARY_MAX_CONCURRENCY
+    calls at a time) and the partial summaries are combined into the final
+    one, in several rounds if they do not fit one prompt either. Every call
+    is retried on its own, so a failing chunk does not restart the others.
     """
     def __init__(self):
         # Configure the Gemini API with the API key from settings
@@ -30,18 +42,17 @@ class GeminiSummarizer:
         Returns:
             str: Formatted text ready for summarization
         """
-        formatted_messages = []
-        
-        for msg in messages:
-            # Format date to readable string
-            date_str = msg['date'].strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Format message
-            formatted_msg = f"[{date_str}] {msg['sender_name']}: {msg['text']}"
-            formatted_messages.append(formatted_msg)
+        formatted_messages = [self._format_message(msg) for msg in messages]
         
         return "\n".join(formatted_messages)
     
+    def _format_message(self, msg: Dict[str, Any], text: str = None) -> str:
+        """One message as `[date] sender: text`, with `text` in place of its own when given"""
+        # Format date to readable string
+        date_str = msg['date'].strftime('%Y-%m-%d %H:%M:%S')
+        
+        return f"[{date_str}] {msg['sender_name']}: {msg['text'] if text is None else text}"
+    
     def _create_summarization_prompt(self, formatted_messages: str, group_name: str, 
                                     start_date: datetime, end_date: datetime) -> str:
         """
@@ -82,6 +93,135 @@ class GeminiSummarizer:
         
         return prompt
     
+    def _chunk_messages(self, messages: List[Dict[str, Any]], budget: int) -> List[str]:
+        """
+        Format messages into consecutive chunks of at most `budget` tokens.
+        Messages are never split between chunks, except a single message
+        over the budget, whose pieces each keep its date and sender.
+        """
+        chunks, current, size = [], [], 0
+        for msg in messages:
+            formatted = self._format_message(msg)
+            pieces = [formatted]
+            if estimate_tokens(formatted) > budget:
+                length = max(1, (budget - estimate_tokens(self._format_message(msg, ''))) * 4)
+                pieces = [
+                    self._format_message(msg, msg['text'][start:start + length])
+                    for start in range(0, len(msg['text']), length)
+                ]
+            for piece in pieces:
+                tokens = estimate_tokens(piece)
+                if current and size + tokens > budget:
+                    chunks.append("\n".join(current))
+                    current, size = [], 0
+                current.append(piece)
+                size += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+    
+    def _create_chunk_prompt(self, chunk: str, part: int, parts: int, group_name: str) -> str:
+        """Prompt summarizing one chunk of a window, to be combined later"""
+        return f"""
+        You are an AI assistant summarizing part {part} of {parts} of the messages of the Telegram group "{group_name}".
+        
+        Write detailed notes on this part only: the topics discussed, key information and announcements,
+        decisions or conclusions reached, and who contributed what. Keep names, dates and figures.
+        These notes will be merged with the notes on the other parts into one summary.
+        
+        Here are the messages:
+        
+        {chunk}
+        
+        Please provide only the notes without any introductory text.
+        """
+    
+    def _create_reduce_prompt(self, partials: List[str], group_name: str,
+                              start_date: datetime, end_date: datetime, final: bool) -> str:
+        """Prompt combining partial summaries, into the final summary when `final`"""
+        notes = "\n\n".join(f"Notes {i}:\n{partial}" for i, partial in enumerate(partials, start=1))
+        if not final:
+            return f"""
+        You are an AI assistant merging notes on consecutive parts of the messages of the Telegram group "{group_name}".
+        
+        Merge the following notes into one set of detailed notes, in chronological order, removing repetitions
+        but keeping names, dates, figures, decisions and contributions.
+        
+        {notes}
+        
+        Please provide only the merged notes without any introductory text.
+        """
+        
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
+        return f"""
+        You are an AI assistant tasked with summarizing Telegram group chat messages.
+        
+        The messages of the Telegram group "{group_name}" for the period from {start_date_str} to {end_date_str}
+        were summarized in consecutive parts. Please combine the notes on those parts into one comprehensive summary.
+        
+        The summary should:
+        1. Identify the main topics and themes discussed
+        2. Highlight key information and important announcements
+        3. Note any significant decisions or conclusions reached
+        4. Mention active participants and their main contributions
+        5. Organize information in a clear, structured format
+        6. Be comprehensive yet concise
+        
+        Here are the notes on each part, in chronological order:
+        
+        {notes}
+        
+        Please provide only the summary without any introductory text or explanations about the summarization process.
+        """
+    
+    async def _generate(self, prompt: str, semaphore: asyncio.Semaphore, label: str) -> str:
+        """One model call, retried with exponential backoff"""
+        retries = getattr(settings, 'SUMMARY_CALL_RETRIES', 3)
+        timeout = getattr(settings, 'SUMMARY_CALL_TIMEOUT', 120)
+        for attempt in range(retries + 1):
+            try:
+                async with semaphore:
+                    response = await asyncio.wait_for(self.model.generate_content_async(prompt), timeout)
+                return response.text
+            except Exception as e:
+                if attempt == retries:
+                    logger.error(f"Error summarizing {label}, giving up after {attempt + 1} attempts: {str(e)}")
+                    raise
+                delay = 2 ** attempt
+                logger.info(f"Error summarizing {label}, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+    
+    async def _reduce(self, partials: List[str], group_name: str, start_date: datetime,
+                      end_date: datetime, semaphore: asyncio.Semaphore, budget: int) -> str:
+        """Combine partial summaries, merging them in batches first while they exceed the budget"""
+        level = 1
+        while sum(estimate_tokens(partial) for partial in partials) > budget and len(partials) > 1:
+            # Batches of at least two partials, so that every round shrinks them
+            batches, current, size = [], [], 0
+            for partial in partials:
+                tokens = estimate_tokens(partial)
+                if len(current) >= 2 and size + tokens > budget:
+                    batches.append(current)
+                    current, size = [], 0
+                current.append(partial)
+                size += tokens
+            batches.append(current)
+            logger.info(f"Merging {len(partials)} partial summaries of {group_name} into {len(batches)}")
+            partials = await asyncio.gather(*(
+                self._generate(
+                    self._create_reduce_prompt(batch, group_name, start_date, end_date, final=False),
+                    semaphore, f"merge {i} of level {level} for {group_name}"
+                )
+                for i, batch in enumerate(batches, start=1)
+            ))
+            level += 1
+        
+        return await self._generate(
+            self._create_reduce_prompt(partials, group_name, start_date, end_date, final=True),
+            semaphore, f"final summary of {group_name}"
+        )
+    
     async def generate_summary(self, messages: List[Dict[str, Any]], group_name: str, 
                               start_date: datetime, end_date: datetime) -> str:
         """
@@ -97,19 +237,31 @@ class GeminiSummarizer:
             str: Generated summary
         """
         try:
+            budget = getattr(settings, 'SUMMARY_CHUNK_TOKENS', 30000)
+            semaphore = asyncio.Semaphore(getattr(settings, 'SUMMARY_MAX_CONCURRENCY', 4))
+            
             # Prepare messages
             formatted_messages = self._prepare_messages_for_summarization(messages)
+            chunks = self._chunk_messages(messages, budget) if messages else ['']
             
-            # Create prompt
-            prompt = self._create_summarization_prompt(
-                formatted_messages, group_name, start_date, end_date
-            )
-            
-            # Generate summary
-            response = await self.model.generate_content_async(prompt)
-            
-            # Extract and return the summary text
-            summary = response.text
+            if len(chunks) == 1:
+                # Create prompt
+                prompt = self._create_summarization_prompt(
+                    formatted_messages, group_name, start_date, end_date
+                )
+                
+                # Generate summary
+                summary = await self._generate(prompt, semaphore, f"summary of {group_name}")
+            else:
+                logger.info(f"Summarizing {len(messages)} messages of {group_name} in {len(chunks)} chunks")
+                partials = await asyncio.gather(*(
+                    self._generate(
+                        self._create_chunk_prompt(chunk, i, len(chunks), group_name),
+                        semaphore, f"chunk {i} of {len(chunks)} for {group_name}"
+                    )
+                    for i, chunk in enumerate(chunks, start=1)
+                ))
+                summary = await self._reduce(list(partials), group_name, start_date, end_date, semaphore, budget)
             
             logger.info(f"Successfully generated summary for {group_name} from {start_date} to {end_date}")
             return summary
@@ -1,4 +1,5 @@
 from celery import shared_task
+from asgiref.sync import async_to_sync
 import asyncio
 import logging
 from django.utils import timezone
@@ -6,6 +7,7 @@ from datetime import timedelta
 
 from .models import Summary
 from .summarizer import GeminiSummarizer
+from telegram_integration.jobs import JobCancelled, run_job, update_progress
 from telegram_integration.models import TelegramGroup, TelegramMessage, AccountGroupAssociation
 
 logger = logging.getLogger(__name__)
@@ -42,7 +44,8 @@ def generate_weekly_summaries():
                 group=group,
                 date__gte=start_date,
                 date__lte=end_date,
-                is_processed=False
+                is_processed=False,
+                is_deleted=False
             ).order_by('date')
             
             if not messages:
@@ -109,3 +112,48 @@ def cleanup_old_summaries():
     
     logger.info(f"Completed old summaries cleanup task. Deleted {deleted_count} summaries")
     return deleted_count
+
+@shared_task
+def generate_summary_job(job_id):
+    """
+    Celery task running a `generate_summary` Job: summarize the messages of
+    a group over the last `days` days
+    """
+    return run_job(job_id, _generate_summary)
+
+def _generate_summary(job):
+    group = TelegramGroup.objects.get(pk=job.params['group_id'])
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=job.params.get('days', 7))
+    
+    update_progress(job, phase='loading messages')
+    messages = TelegramMessage.objects.filter(
+        group=group,
+        date__gte=start_date,
+        date__lte=end_date,
+        is_deleted=False
+    ).order_by('date')
+    message_list = [
+        {'sender_name': msg.sender_name, 'date': msg.date, 'text': msg.text}
+        for msg in messages
+    ]
+    if not message_list:
+        raise ValueError('No messages found for the specified period')
+    
+    if not update_progress(job, processed=len(message_list), phase='summarizing'):
+        raise JobCancelled()
+    summary_text = async_to_sync(GeminiSummarizer().generate_summary)(
+        message_list, group.name, start_date, end_date
+    )
+    
+    if not update_progress(job, phase='saving'):
+        raise JobCancelled()
+    summary = Summary.objects.create(
+        group=group,
+        start_date=start_date,
+        end_date=end_date,
+        content=summary_text
+    )
+    messages.update(is_processed=True)
+    logger.info(f"Generated summary {summary.pk} for group {group.name}")
+    return {'summary_id': summary.pk}
@@ -1,39 +1,38 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from datetime import timedelta
-import asyncio
+from asgiref.sync import sync_to_async
 import logging
 
 from .models import Summary, SummaryFeedback
-from .serializers import SummarySerializer, SummaryFeedbackSerializer
-from .summarizer import GeminiSummarizer
-from telegram_integration.models import TelegramGroup, TelegramMessage
+from .serializers import SummarySerializer, FlatSummarySerializer, SummaryFeedbackSerializer
+from .tasks import generate_summary_job
+from telegram_integration.access import aaccessible_group_ids, accessible_group_ids
+from telegram_integration.async_views import AsyncViewSetMixin
+from telegram_integration.flat import FlatGroupsMixin
+from telegram_integration.jobs import enqueue_job, job_accepted
+from telegram_integration.models import TelegramGroup
 
 logger = logging.getLogger(__name__)
 
-class SummaryViewSet(viewsets.ModelViewSet):
+class SummaryViewSet(AsyncViewSetMixin, FlatGroupsMixin, viewsets.ModelViewSet):
     """ViewSet for managing summaries"""
     serializer_class = SummarySerializer
+    flat_serializer_class = FlatSummarySerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         # Return summaries for groups associated with the user's accounts
-        from telegram_integration.models import TelegramAccount, AccountGroupAssociation
-        
-        user_accounts = TelegramAccount.objects.filter(user=self.request.user)
-        group_ids = AccountGroupAssociation.objects.filter(
-            account__in=user_accounts
-        ).values_list('group_id', flat=True)
-        
-        return Summary.objects.filter(group_id__in=group_ids)
+        return Summary.objects.filter(
+            group_id__in=accessible_group_ids(self.request.user)
+        ).select_related('group')
     
     @action(detail=False, methods=['post'])
-    def generate(self, request):
+    async def generate(self, request):
         """
         Endpoint to manually generate a summary for a specific group and time period
+        Runs in the background, answers 202 with the job to poll; its result
+        holds the id of the new summary.
         """
         group_id = request.data.get('group_id')
         days = int(request.data.get('days', 7))
@@ -45,87 +44,27 @@ class SummaryViewSet(viewsets.ModelViewSet):
         
         # Get the group
         try:
-            from telegram_integration.models import TelegramAccount, AccountGroupAssociation
-            
             # Check if the user has access to this group
-            user_accounts = TelegramAccount.objects.filter(user=request.user)
-            has_access = AccountGroupAssociation.objects.filter(
-                account__in=user_accounts,
-                group_id=group_id
-            ).exists()
+            try:
+                has_access = int(group_id) in await aaccessible_group_ids(request.user)
+            except (TypeError, ValueError):
+                has_access = False
             
             if not has_access:
                 return Response({
                     'error': 'You do not have access to this group'
                 }, status=status.HTTP_403_FORBIDDEN)
             
-            group = TelegramGroup.objects.get(id=group_id)
+            group = await TelegramGroup.objects.aget(id=group_id)
         except TelegramGroup.DoesNotExist:
             return Response({
                 'error': 'Group not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Calculate time period
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # Get messages for the period
-        messages = TelegramMessage.objects.filter(
-            group=group,
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('date')
-        
-        if not messages:
-            return Response({
-                'error': 'No messages found for the specified period'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Format messages for summarization
-        message_list = []
-        for msg in messages:
-            message_list.append({
-                'sender_name': msg.sender_name,
-                'date': msg.date,
-                'text': msg.text
-            })
-        
-        # Generate summary
-        try:
-            # Create summarizer
-            summarizer = GeminiSummarizer()
-            
-            # Run in event loop
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Generate summary
-            summary_text = loop.run_until_complete(
-                summarizer.generate_summary(message_list, group.name, start_date, end_date)
-            )
-            
-            loop.close()
-            
-            # Create summary object
-            summary = Summary.objects.create(
-                group=group,
-                start_date=start_date,
-                end_date=end_date,
-                content=summary_text
-            )
-            
-            # Mark messages as processed
-            messages.update(is_processed=True)
-            
-            return Response({
-                'message': 'Summary generated successfully',
-                'summary': SummarySerializer(summary).data
-            })
-        except Exception as e:
-            logger.error(f"Error generating summary: {str(e)}")
-            return Response({
-                'error': f'Error generating summary: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        job = await sync_to_async(enqueue_job)(
+            request.user, 'generate_summary', {'group_id': group.pk, 'days': days}, generate_summary_job
+        )
+        return job_accepted(request, job)
 
 class SummaryFeedbackViewSet(viewsets.ModelViewSet):
     """ViewSet for managing summary feedback"""
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from api.views import UserViewSet
+from api.views import SearchViewSet, UserViewSet
 from telegram_integration.views import (
     TelegramAccountViewSet,
     TelegramGroupViewSet,
     TelegramMessageViewSet,
-    AccountGroupAssociationViewSet
+    AccountGroupAssociationViewSet,
+    JobViewSet
 )
 
 router = DefaultRouter()
@@ -14,6 +15,8 @@ router.register(r'telegram/accounts', TelegramAccountViewSet, basename='telegram
 router.register(r'telegram/groups', TelegramGroupViewSet, basename='telegram-group')
 router.register(r'telegram/messages', TelegramMessageViewSet, basename='telegram-message')
 router.register(r'telegram/associations', AccountGroupAssociationViewSet, basename='account-group-association')
+router.register(r'telegram/jobs', JobViewSet, basename='telegram-job')
+router.register(r'search', SearchViewSet, basename='search')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -4,7 +4,12 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import authenticate, login, logout
 from rest_framework import status
-from telegram_integration.serializers import UserSerializer
+from telegram_integration.access import accessible_group_ids
+from telegram_integration.models import TelegramMessage
+from telegram_integration.search import MESSAGE_INDEX, SUMMARY_INDEX
+from telegram_integration.serializers import SearchQuerySerializer, TelegramMessageSerializer, UserSerializer
+from ai_summarization.models import Summary
+from ai_summarization.serializers import SummarySerializer
 
 class UserViewSet(viewsets.ModelViewSet):
     """ViewSet for managing users"""
@@ -91,3 +96,58 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response({
             'message': 'Logout successful'
         })
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    Full-text search over the messages and summaries of the user's groups.
+    Results are ranked best first and carry a `snippet` of the matching
+    text, HTML-escaped, with the terms wrapped in <mark> tags.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def list(self, request):
+        serializer = SearchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        group_ids = accessible_group_ids(request.user)
+        if 'group_id' in params:
+            group_ids = group_ids & {params['group_id']}
+        
+        results = {'query': params['q']}
+        if params['type'] in ('all', 'messages'):
+            messages = TelegramMessage.objects.filter(group_id__in=group_ids, is_deleted=False)
+            if 'since' in params:
+                messages = messages.filter(date__gte=params['since'])
+            if 'until' in params:
+                messages = messages.filter(date__lt=params['until'])
+            results['messages'] = self._hits(
+                MESSAGE_INDEX.search(params['q'], messages, params['limit']),
+                messages.select_related('group', 'sender_profile'),
+                TelegramMessageSerializer
+            )
+        
+        if params['type'] in ('all', 'summaries'):
+            summaries = Summary.objects.filter(group_id__in=group_ids)
+            # Summaries overlapping the period
+            if 'since' in params:
+                summaries = summaries.filter(end_date__gte=params['since'])
+            if 'until' in params:
+                summaries = summaries.filter(start_date__lt=params['until'])
+            results['summaries'] = self._hits(
+                SUMMARY_INDEX.search(params['q'], summaries, params['limit']),
+                summaries.select_related('group'),
+                SummarySerializer
+            )
+        
+        return Response(results)
+    
+    def _hits(self, matches, queryset, serializer_class):
+        objects = queryset.in_bulk([row_id for row_id, _, _ in matches])
+        hits = []
+        for row_id, rank, snippet in matches:
+            if row_id in objects:
+                data = serializer_class(objects[row_id], context={'request': self.request}).data
+                data.update(rank=rank, snippet=snippet)
+                hits.append(data)
+        return hits
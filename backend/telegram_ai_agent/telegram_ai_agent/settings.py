@@ -144,10 +144,106 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# With TELEGRAM_SCHEDULED_COLLECTION, collection is dispatched every minute for
+# the groups whose adaptive poll interval has elapsed. Off by default: the
+# collector service (run_collector --listen) already keeps every group current,
+# and polling through Celery as well would fetch each group twice
+TELEGRAM_SCHEDULED_COLLECTION = os.getenv('TELEGRAM_SCHEDULED_COLLECTION', 'False') == 'True'
+CELERY_BEAT_SCHEDULE = {}
+if TELEGRAM_SCHEDULED_COLLECTION:
+    CELERY_BEAT_SCHEDULE['dispatch-due-collections'] = {
+        'task': 'telegram_integration.tasks.dispatch_due_collections',
+        'schedule': 60.0,
+    }
+
+# Cache, which also holds the collection locks. Point it at Redis whenever more
+# than one process collects, a local memory cache only locks within a process
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds the groups a user can access stay cached. Changes are invalidated by
+# signals, this only bounds staleness in processes that do not share the cache
+TELEGRAM_GROUP_ACCESS_CACHE_TTL = int(os.getenv('TELEGRAM_GROUP_ACCESS_CACHE_TTL', '300'))
 
 # Telegram settings
 TELEGRAM_API_ID = os.getenv('TELEGRAM_API_ID')
 TELEGRAM_API_HASH = os.getenv('TELEGRAM_API_HASH')
 
+# Sender cache kept per account by the collectors
+TELEGRAM_SENDER_CACHE_SIZE = int(os.getenv('TELEGRAM_SENDER_CACHE_SIZE', '5000'))
+TELEGRAM_SENDER_CACHE_TTL = int(os.getenv('TELEGRAM_SENDER_CACHE_TTL', '3600'))
+
+# Telegram calls of the API views run on a background event loop that keeps the
+# clients of recently used accounts connected: seconds before an unused client
+# is disconnected, and the longest a request waits for its call
+TELEGRAM_BRIDGE_IDLE_TIMEOUT = int(os.getenv('TELEGRAM_BRIDGE_IDLE_TIMEOUT', '600'))
+TELEGRAM_BRIDGE_TIMEOUT = int(os.getenv('TELEGRAM_BRIDGE_TIMEOUT', '300'))
+
+# Page size of the message API, by default and at most
+TELEGRAM_MESSAGES_PAGE_SIZE = int(os.getenv('TELEGRAM_MESSAGES_PAGE_SIZE', '50'))
+TELEGRAM_MESSAGES_MAX_PAGE_SIZE = int(os.getenv('TELEGRAM_MESSAGES_MAX_PAGE_SIZE', '200'))
+
+# Local semantic index of the messages of each group ("related" endpoint):
+# directory of the on-disk indexes (empty to turn indexing off), dimensions of
+# the message vectors, and indexes kept loaded per process
+TELEGRAM_VECTOR_INDEX_DIR = os.getenv('TELEGRAM_VECTOR_INDEX_DIR', str(BASE_DIR / 'vector_index'))
+TELEGRAM_VECTOR_DIMENSIONS = int(os.getenv('TELEGRAM_VECTOR_DIMENSIONS', '64'))
+TELEGRAM_VECTOR_INDEX_CACHE_SIZE = int(os.getenv('TELEGRAM_VECTOR_INDEX_CACHE_SIZE', '8'))
+
+# Seconds between collection cycles of the run_collector daemon
+TELEGRAM_COLLECTOR_INTERVAL = int(os.getenv('TELEGRAM_COLLECTOR_INTERVAL', '60'))
+
+# Real-time listener of run_collector --listen: batch size and seconds between
+# flushes, and the interval of the polling resync that runs alongside it
+TELEGRAM_LISTENER_FLUSH_SIZE = int(os.getenv('TELEGRAM_LISTENER_FLUSH_SIZE', '100'))
+TELEGRAM_LISTENER_FLUSH_INTERVAL = float(os.getenv('TELEGRAM_LISTENER_FLUSH_INTERVAL', '2'))
+TELEGRAM_LISTENER_RESYNC_INTERVAL = int(os.getenv('TELEGRAM_LISTENER_RESYNC_INTERVAL', '900'))
+# Seconds between checkpoints of the update state used to catch up after restarts
+TELEGRAM_UPDATE_STATE_INTERVAL = int(os.getenv('TELEGRAM_UPDATE_STATE_INTERVAL', '30'))
+
+# Concurrency of scheduled collection: groups in flight overall and per account,
+# and the time a single group collection may take
+TELEGRAM_COLLECTION_MAX_CONCURRENCY = int(os.getenv('TELEGRAM_COLLECTION_MAX_CONCURRENCY', '10'))
+TELEGRAM_COLLECTION_PER_ACCOUNT_CONCURRENCY = int(os.getenv('TELEGRAM_COLLECTION_PER_ACCOUNT_CONCURRENCY', '2'))
+TELEGRAM_COLLECTION_TIMEOUT = int(os.getenv('TELEGRAM_COLLECTION_TIMEOUT', '300'))
+# Seconds before a sync job retries a group that is being collected elsewhere
+TELEGRAM_JOB_LOCK_RETRY_DELAY = int(os.getenv('TELEGRAM_JOB_LOCK_RETRY_DELAY', '30'))
+
+# Adaptive polling: bounds of the seconds between polls of a group, the number
+# of new messages a poll aims to pick up, and the weight of the latest poll in
+# the smoothed message rate
+TELEGRAM_POLL_MIN_INTERVAL = int(os.getenv('TELEGRAM_POLL_MIN_INTERVAL', '60'))
+TELEGRAM_POLL_MAX_INTERVAL = int(os.getenv('TELEGRAM_POLL_MAX_INTERVAL', '3600'))
+TELEGRAM_POLL_TARGET_MESSAGES = int(os.getenv('TELEGRAM_POLL_TARGET_MESSAGES', '20'))
+TELEGRAM_POLL_SMOOTHING = float(os.getenv('TELEGRAM_POLL_SMOOTHING', '0.5'))
+
+# Per-account request rate limit. With a Redis URL the buckets are shared by all
+# processes, otherwise each process limits its own clients
+TELEGRAM_RATE_LIMIT_REDIS_URL = os.getenv('TELEGRAM_RATE_LIMIT_REDIS_URL')
+TELEGRAM_RATE_LIMIT_RATE = float(os.getenv('TELEGRAM_RATE_LIMIT_RATE', '1.0'))
+TELEGRAM_RATE_LIMIT_BURST = int(os.getenv('TELEGRAM_RATE_LIMIT_BURST', '5'))
+TELEGRAM_RATE_LIMIT_MAX_CHUNK = int(os.getenv('TELEGRAM_RATE_LIMIT_MAX_CHUNK', '1000'))
+# Longest FloodWait callers wait out before giving up
+TELEGRAM_FLOOD_MAX_WAIT = int(os.getenv('TELEGRAM_FLOOD_MAX_WAIT', '900'))
+
 # Google Gemini AI settings
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+# Windows over SUMMARY_CHUNK_TOKENS tokens are summarized in chunks of that size,
+# at most SUMMARY_MAX_CONCURRENCY model calls at a time, then combined
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', '30000'))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv('SUMMARY_MAX_CONCURRENCY', '4'))
+# Retries of a failed model call and seconds before a call is abandoned
+SUMMARY_CALL_RETRIES = int(os.getenv('SUMMARY_CALL_RETRIES', '3'))
+SUMMARY_CALL_TIMEOUT = int(os.getenv('SUMMARY_CALL_TIMEOUT', '120'))
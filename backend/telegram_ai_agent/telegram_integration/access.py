@@ -0,0 +1,55 @@
+"""
+Cached sets of the groups each user can access
+"""
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from .models import AccountGroupAssociation, TelegramAccount
+
+logger = logging.getLogger(__name__)
+
+def _cache_key(user_id):
+    return f'telegram:group-access:{user_id}'
+
+def _timeout():
+    return getattr(settings, 'TELEGRAM_GROUP_ACCESS_CACHE_TTL', 300)
+
+def accessible_group_ids(user):
+    """
+    Ids of the groups the user's accounts are associated with.
+
+    Every scoped queryset and permission check asks for this set, so it is
+    cached per user and dropped by the signal handlers whenever an
+    association or account of the user is added, moved or removed. The
+    timeout bounds how stale another process can be with a cache that is
+    not shared.
+    """
+    group_ids = cache.get(_cache_key(user.pk))
+    if group_ids is None:
+        group_ids = frozenset(
+            AccountGroupAssociation.objects.filter(account__user_id=user.pk).values_list('group_id', flat=True)
+        )
+        cache.set(_cache_key(user.pk), group_ids, _timeout())
+    return group_ids
+
+async def aaccessible_group_ids(user):
+    """`accessible_group_ids()` for async callers"""
+    group_ids = await cache.aget(_cache_key(user.pk))
+    if group_ids is None:
+        group_ids = frozenset([
+            group_id async for group_id in AccountGroupAssociation.objects.filter(
+                account__user_id=user.pk
+            ).values_list('group_id', flat=True)
+        ])
+        await cache.aset(_cache_key(user.pk), group_ids, _timeout())
+    return group_ids
+
+def invalidate_group_access(user_id):
+    """Forget the cached groups of a user"""
+    cache.delete(_cache_key(user_id))
+
+def invalidate_account_group_access(account_id):
+    """Forget the cached groups of the user owning an account"""
+    user_id = TelegramAccount.objects.filter(pk=account_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_group_access(user_id)
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation
+from .models import (
+    TelegramAccount, TelegramGroup, TelegramSender, TelegramMessage, AccountGroupAssociation, GroupPollSchedule,
+    Job
+)
 
 @admin.register(TelegramAccount)
 class TelegramAccountAdmin(admin.ModelAdmin):
@@ -15,6 +18,12 @@ class TelegramGroupAdmin(admin.ModelAdmin):
     search_fields = ('name', 'username')
     readonly_fields = ('created_at', 'updated_at')
 
+@admin.register(TelegramSender)
+class TelegramSenderAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'first_name', 'last_name', 'username', 'updated_at')
+    search_fields = ('first_name', 'last_name', 'username')
+    readonly_fields = ('updated_at',)
+
 @admin.register(TelegramMessage)
 class TelegramMessageAdmin(admin.ModelAdmin):
     list_display = ('message_id', 'group', 'sender_name', 'date', 'is_processed')
@@ -29,3 +38,16 @@ class AccountGroupAssociationAdmin(admin.ModelAdmin):
     search_fields = ('account__phone_number', 'group__name')
     readonly_fields = ('joined_at', 'last_collection')
 
+
+@admin.register(GroupPollSchedule)
+class GroupPollScheduleAdmin(admin.ModelAdmin):
+    list_display = ('group', 'message_rate', 'interval', 'next_poll_at', 'last_polled_at')
+    search_fields = ('group__name',)
+    readonly_fields = ('updated_at',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user', 'status', 'phase', 'processed', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('user__username', 'task_id')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TelegramIntegrationConfig(AppConfig):
@@ -7,3 +8,6 @@ class TelegramIntegrationConfig(AppConfig):
 
     def ready(self):
         import telegram_integration.signals  # noqa
+        from .search import restore_sqlite_triggers
+        # Table rebuilds of later SQLite migrations drop the search triggers
+        post_migrate.connect(restore_sqlite_triggers, sender=self)
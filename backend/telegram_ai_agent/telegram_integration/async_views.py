@@ -0,0 +1,85 @@
+"""
+Async request handlers for Django REST framework viewsets
+"""
+import asyncio
+from functools import update_wrapper
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+class AsyncViewSetMixin:
+    """
+    Let viewset actions be declared `async def`.
+
+    REST framework only dispatches synchronous handlers. For routes whose
+    actions are all coroutines this mixin hands Django an async view, so
+    under ASGI a request waiting on Telegram or the AI API only suspends its
+    coroutine instead of holding a worker thread; under WSGI Django runs the
+    view in an event loop of its own. Authentication, permissions and
+    throttling still run through the regular `initial()` hooks, and routes
+    with synchronous actions are left untouched.
+
+        class GroupViewSet(AsyncViewSetMixin, viewsets.ModelViewSet):
+            @action(detail=True, methods=['post'])
+            async def collect(self, request, pk=None):
+                group = await self.aget_object()
+                ...
+    """
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not actions or not all(
+            asyncio.iscoroutinefunction(getattr(cls, action)) for action in actions.values()
+        ):
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            # The synchronous view sets the viewset up and returns the
+            # coroutine of `dispatch`
+            return await view(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if asyncio.iscoroutinefunction(handler):
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """`dispatch()` awaiting the handler"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication and permission checks may query the database
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """`get_object()` through the async ORM"""
+        # Scoping the queryset may read the database, e.g. the groups of the user
+        queryset = await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
@@ -0,0 +1,157 @@
+"""
+Background event loop running the Telegram calls of the API views
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from .pool import ClientPool
+
+logger = logging.getLogger(__name__)
+
+class AccountNotAuthorized(Exception):
+    """The account has no authorized Telegram session"""
+
+class TelegramBridge:
+    """
+    Run Telegram coroutines on one event loop thread shared by the process.
+
+    Views used to create an event loop and a client per request, paying the
+    MTProto connect handshake on every call. The bridge keeps the clients of
+    recently used accounts connected in a ClientPool on its own loop, so a
+    request only waits for the actual Telegram calls:
+
+        count = get_bridge().call(account, lambda manager: manager.collect_messages(group))
+
+    Async views await `arun()` and `acall()` instead, which leaves their own
+    event loop free while the bridge works. Clients unused for
+    `idle_timeout` seconds are disconnected.
+    """
+    def __init__(self, idle_timeout=None, timeout=None):
+        self.idle_timeout = idle_timeout or getattr(settings, 'TELEGRAM_BRIDGE_IDLE_TIMEOUT', 600)
+        self.timeout = timeout or getattr(settings, 'TELEGRAM_BRIDGE_TIMEOUT', 300)
+        self.loop = None
+        self.pool = None
+        self.last_used = {}
+        self._thread = None
+        self._evictor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the loop thread unless it is running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self.pool = ClientPool()
+            self.last_used = {}
+            self._thread = threading.Thread(target=self._run_loop, name='telegram-bridge', daemon=True)
+            self._thread.start()
+            self._evictor = asyncio.run_coroutine_threadsafe(self._evict_idle(), self.loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the bridge loop and return its result"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout or self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def arun(self, coro, timeout=None):
+        """Await a coroutine running on the bridge loop from another loop"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        finally:
+            future.cancel()
+
+    def call(self, account, func, timeout=None):
+        """
+        Run `func(manager)` with a connected, authorized manager of the
+        account and return its result. Raises AccountNotAuthorized when the
+        account has no usable session.
+        """
+        return self.run(self._call(account, func), timeout)
+
+    async def acall(self, account, func, timeout=None):
+        """`call()` for async callers"""
+        return await self.arun(self._call(account, func), timeout)
+
+    async def _call(self, account, func):
+        # The loop thread outlives requests, so it cleans up its own connections
+        await sync_to_async(close_old_connections)()
+        manager = await self.pool.get(account)
+        if manager is None:
+            raise AccountNotAuthorized(f"Account {account.phone_number} is not authenticated")
+        self.last_used[account.pk] = time.monotonic()
+        try:
+            return await func(manager)
+        finally:
+            self.last_used[account.pk] = time.monotonic()
+
+    def release(self, account_id):
+        """Disconnect the warm client of an account, e.g. when it logs out"""
+        if self.loop is None:
+            return
+        self.last_used.pop(account_id, None)
+        self.run(self.pool.release(account_id))
+
+    async def arelease(self, account_id):
+        """`release()` for async callers"""
+        if self.loop is None:
+            return
+        self.last_used.pop(account_id, None)
+        await self.arun(self.pool.release(account_id))
+
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error(f"Error evicting idle Telegram clients: {str(e)}")
+
+    async def evict_idle(self):
+        """Disconnect the clients that were not used for `idle_timeout` seconds"""
+        now = time.monotonic()
+        for account_id in list(self.pool.managers):
+            if now - self.last_used.get(account_id, 0) >= self.idle_timeout:
+                logger.info(f"Disconnecting idle client of account {account_id}")
+                self.last_used.pop(account_id, None)
+                await self.pool.release(account_id)
+
+    def shutdown(self):
+        """Disconnect every client and stop the loop thread"""
+        with self._lock:
+            if not (self._thread and self._thread.is_alive()):
+                return
+            self._evictor.cancel()
+            asyncio.run_coroutine_threadsafe(self.pool.close(), self.loop).result(self.timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._thread = None
+
+_bridge = None
+_bridge_pid = None
+_bridge_lock = threading.Lock()
+
+def get_bridge():
+    """Return the bridge of this process, creating it after a fork"""
+    global _bridge, _bridge_pid
+    with _bridge_lock:
+        if _bridge is None or _bridge_pid != os.getpid():
+            _bridge = TelegramBridge()
+            _bridge_pid = os.getpid()
+        return _bridge
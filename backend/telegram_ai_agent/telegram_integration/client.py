@@ -1,32 +1,66 @@
-from telethon import TelegramClient, events
-from telethon.sessions import StringSession
+from telethon import events, utils
 from telethon.tl.types import (
     MessageMediaDocument,
     MessageMediaPhoto,
     DocumentAttributeAudio,
     PeerChannel, 
-    PeerChat, 
-    InputPeerChannel, 
-    InputPeerChat
+    PeerChat
 )
+from asgiref.sync import sync_to_async
 from django.conf import settings
 import asyncio
 import logging
 from datetime import datetime
-from .models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation
-from asgiref.sync import sync_to_async
+from django.utils import timezone
+from .models import TelegramAccount, TelegramGroup, AccountGroupAssociation
+from .access import invalidate_group_access
+from .ingest import MessageIngestor
+from .ratelimit import RateLimitedTelegramClient, get_rate_limiter
+from .senders import SenderCache
+from .sessions import DjangoSession
 from django.db import transaction
+from django.db.models import Q
 from functools import partial
 
 logger = logging.getLogger(__name__)
 
+class CollectionError(Exception):
+    """A group could not be collected through the account"""
+
+def raw_group_id(group_id):
+    """Return a stored group id without the -100 channel prefix"""
+    if str(group_id).startswith('-100'):
+        group_id = str(group_id)[4:]
+    return abs(int(group_id))
+
 class TelegramClientManager:
     """
     Class to manage Telegram client instances and handle authentication
+
+    With `catch_up` the client resumes from the update state saved in its
+    session: on every connect Telethon asks for what was missed with
+    updates.getDifference and channels.getChannelDifference and dispatches
+    it to the handlers registered through `add_event_handler`.
     """
-    def __init__(self, account):
+    def __init__(self, account, catch_up=False):
         self.account = account
         self.client = None
+        self.catch_up = catch_up
+        self.event_handlers = []
+        self.senders = SenderCache()
+        self.limiter = get_rate_limiter(account.pk)
+
+    def add_event_handler(self, callback, event):
+        """Register an event handler on this and every later client"""
+        self.event_handlers.append((callback, event))
+        if self.client:
+            self.client.add_event_handler(callback, event)
+
+    def remove_event_handler(self, callback, event):
+        if (callback, event) in self.event_handlers:
+            self.event_handlers.remove((callback, event))
+        if self.client:
+            self.client.remove_event_handler(callback, event)
 
     def process_unsupported_media(self, media):
         """Handle unsupported media types"""
@@ -68,10 +102,12 @@ class TelegramClientManager:
     async def create_client(self):
         """Create and initialize a Telegram client for the account"""
         try:
-            session = StringSession(self.account.session_string) if self.account.session_string else StringSession()
+            session = DjangoSession(self.account, track_updates=self.catch_up)
+            await session.load()
             
-            self.client = TelegramClient(
+            self.client = RateLimitedTelegramClient(
                 session,
+                limiter=self.limiter,
                 api_id=self.account.api_id,
                 api_hash=self.account.api_hash,
                 device_model="Python",
@@ -80,8 +116,13 @@ class TelegramClientManager:
                 connection_retries=10,
                 retry_delay=2,
                 timeout=20,
-                request_retries=5
+                request_retries=5,
+                catch_up=self.catch_up
             )
+            # Registered before connecting, so updates caught up on connect
+            # reach the handlers
+            for callback, event in self.event_handlers:
+                self.client.add_event_handler(callback, event)
             
             await self.client.connect()
             return self.client
@@ -124,7 +165,7 @@ class TelegramClientManager:
             entity = await self.client.get_entity(group_username_or_link)
             
             if hasattr(entity, 'id') and hasattr(entity, 'title'):
-                group, created = TelegramGroup.objects.update_or_create(
+                group, created = await TelegramGroup.objects.aupdate_or_create(
                     group_id=entity.id,
                     defaults={
                         'name': entity.title,
@@ -133,7 +174,7 @@ class TelegramClientManager:
                     }
                 )
                 
-                AccountGroupAssociation.objects.update_or_create(
+                await AccountGroupAssociation.objects.aupdate_or_create(
                     account=self.account,
                     group=group,
                     defaults={'is_active': True}
@@ -147,253 +188,425 @@ class TelegramClientManager:
             logger.error(f"Error joining group: {str(e)}")
             return None
 
+    async def sync_dialogs(self):
+        """
+        Store every group and channel the account is a member of and
+        associate it with the account. Returns the number of groups added
+        and the number of dialogs seen.
+        """
+        chats = {}
+        total_dialogs = 0
+        async for dialog in self.client.iter_dialogs():
+            total_dialogs += 1
+            if dialog.is_group or dialog.is_channel:
+                entity = dialog.entity
+                chats[entity.id] = {
+                    'name': entity.title,
+                    'username': getattr(entity, 'username', None),
+                }
+
+        groups_added = await self._store_dialogs(chats)
+        logger.info(f"Synced {total_dialogs} dialogs of {self.account.phone_number}, {groups_added} new groups")
+        return groups_added, total_dialogs
+
+    @sync_to_async
+    def _store_dialogs(self, chats):
+        """
+        Upsert the groups of the account's dialogs in one transaction.
+
+        Existing groups and associations are loaded with one query each and
+        diffed in memory, so only new or renamed groups and missing
+        associations are written, in bulk. Returns the number of new groups.
+        """
+        if not chats:
+            return 0
+
+        with transaction.atomic():
+            groups = {}
+            # The oldest row wins should a group have been stored twice
+            for group in TelegramGroup.objects.filter(group_id__in=list(chats)).order_by('-pk'):
+                groups[group.group_id] = group
+
+            now = timezone.now()
+            new_groups = []
+            changed_groups = []
+            for chat_id, fields in chats.items():
+                group = groups.get(chat_id)
+                if group is None:
+                    group = TelegramGroup(group_id=chat_id, is_active=True, **fields)
+                    groups[chat_id] = group
+                    new_groups.append(group)
+                elif (group.name, group.username, group.is_active) != (fields['name'], fields['username'], True):
+                    group.name = fields['name']
+                    group.username = fields['username']
+                    group.is_active = True
+                    group.updated_at = now
+                    changed_groups.append(group)
+
+            TelegramGroup.objects.bulk_create(new_groups)
+            TelegramGroup.objects.bulk_update(changed_groups, ['name', 'username', 'is_active', 'updated_at'])
+
+            associated = set(
+                AccountGroupAssociation.objects.filter(
+                    account=self.account,
+                    group__in=[group.pk for group in groups.values()]
+                ).values_list('group_id', flat=True)
+            )
+            new_associations = AccountGroupAssociation.objects.bulk_create(
+                [
+                    AccountGroupAssociation(account=self.account, group=group, is_active=True)
+                    for group in groups.values()
+                    if group.pk not in associated
+                ],
+                ignore_conflicts=True
+            )
+            if new_associations:
+                # Bulk inserts send no post_save
+                invalidate_group_access(self.account.user_id)
+
+        return len(new_groups)
+
     async def get_entity_by_id(self, group_id):
-        """Try different methods to get the correct entity"""
+        """
+        Resolve a stored group id to an input peer.
+
+        Channels and chats seen before are found in the persisted session
+        cache together with their access hash, so this is a local lookup.
+        Unknown groups are searched for once in the dialogs, which also adds
+        every chat of the account to the cache.
+        """
         try:
-            if str(group_id).startswith('-100'):
-                group_id = str(group_id)[4:]
-            group_id = int(group_id)
-            
-            errors = []
-            
-            try:
-                return await self.client.get_entity(InputPeerChannel(
-                    channel_id=group_id,
-                    access_hash=0
-                ))
-            except Exception as e:
-                errors.append(f"Channel attempt: {str(e)}")
-                
-            try:
-                return await self.client.get_entity(InputPeerChat(
-                    chat_id=group_id
-                ))
-            except Exception as e:
-                errors.append(f"Chat attempt: {str(e)}")
-                
-            try:
-                return await self.client.get_entity(group_id)
-            except Exception as e:
-                errors.append(f"Direct ID attempt: {str(e)}")
-                
-            logger.error(f"All entity resolution attempts failed: {errors}")
+            group_id = raw_group_id(group_id)
+
+            session = self.client.session
+            for peer in (PeerChannel(group_id), PeerChat(group_id)):
+                if session.get_entity_rows_by_id(utils.get_peer_id(peer)):
+                    return session.get_input_entity(peer)
+
+            logger.info(f"Group {group_id} not in the entity cache, searching dialogs")
+            async for dialog in self.client.iter_dialogs():
+                if dialog.entity.id == group_id:
+                    return dialog.input_entity
+
+            logger.error(f"Group {group_id} not found among the account's dialogs")
             return None
             
         except Exception as e:
             logger.error(f"Error in get_entity_by_id: {str(e)}")
             return None
 
-    async def collect_messages(self, group, limit=100):
-        """Collect messages from a Telegram group"""
+    def parse_message_content(self, message):
+        """Return the (message_type, text) pair stored for a message"""
+        message_text = message.text or ''
+        message_type = 'TEXT'
+
+        if message.media:
+            if isinstance(message.media, MessageMediaDocument) and hasattr(message.media.document, 'attributes'):
+                for attr in message.media.document.attributes:
+                    if isinstance(attr, DocumentAttributeAudio) and attr.voice:
+                        message_type = 'VOICE'
+                        message_text = self.process_voice_message(message)
+                        break
+                if message_type == 'TEXT':  # If not voice, then it's a regular document
+                    message_type = 'DOCUMENT'
+                    message_text = self.process_document(message)
+            elif isinstance(message.media, MessageMediaPhoto):
+                message_type = 'PHOTO'
+                message_text = self.process_photo(message)
+            else:
+                message_type = 'OTHER'
+                message_text = self.process_unsupported_media(message.media)
+
+        return message_type, message_text
+
+    def build_message_data(self, message):
+        """
+        Convert a Telethon message into TelegramMessage field values.
+        Returns None for messages without text or media.
+        """
+        if not message.text and not message.media:
+            return None
+
+        sender_name = 'Unknown'
+        sender_id = None
+
+        if hasattr(message, 'sender_id') and message.sender_id:
+            sender_id = message.sender_id
+            sender = getattr(message, 'sender', None)
+            if sender:
+                # Telegram sends the users along with each message batch
+                self.senders.observe(sender)
+                sender_name = utils.get_display_name(sender) or getattr(sender, 'username', None) or 'Unknown'
+            else:
+                sender_name = f"User{message.sender_id}"
+
+        message_type, message_text = self.parse_message_content(message)
+
+        return {
+            'message_id': message.id,
+            'sender_id': sender_id,
+            'sender_name': sender_name,
+            'text': message_text,
+            'message_type': message_type,
+            'date': message.date,
+            'is_processed': False
+        }
+
+    async def get_association(self, group):
+        """Return this account's association with a group, if any"""
+        return await AccountGroupAssociation.objects.filter(
+            account=self.account,
+            group=group
+        ).afirst()
+
+    async def save_cursor(self, association, message_id, message_date):
+        """Advance the association's high-water mark, never moving it backwards"""
+        await AccountGroupAssociation.objects.filter(pk=association.pk).filter(
+            Q(last_message_id__isnull=True) | Q(last_message_id__lt=message_id)
+        ).aupdate(last_message_id=message_id, last_message_date=message_date)
+
+        if association.last_message_id is None or association.last_message_id < message_id:
+            association.last_message_id = message_id
+            association.last_message_date = message_date
+
+    async def collect_messages(self, group, limit=100, batch_size=500, association=None, since=None):
+        """
+        Collect new messages from a Telegram group.
+
+        Once the association has a cursor, only messages newer than it are
+        requested, paging forward a chunk of the account's current chunk
+        size at a time until the group is caught up. Without a cursor the
+        newest `limit` messages are fetched to bootstrap it.
+
+        With `since` the messages posted after that datetime are fetched
+        instead, oldest first starting at the date, so only the window is
+        downloaded; `limit` then caps the window and may be None.
+
+        Raises CollectionError when the account is not authenticated or the
+        group cannot be resolved, so callers record a failure rather than
+        an empty collection.
+        """
         try:
             if not self.client or not await self.client.is_user_authorized():
-                logger.error("Client not authenticated")
-                return 0
+                raise CollectionError("Client not authenticated")
 
             entity = await self.get_entity_by_id(group.group_id)
             
             if not entity:
-                logger.error(f"Could not resolve entity for group ID: {group.group_id}")
-                return 0
+                raise CollectionError(f"Could not resolve entity for group ID: {group.group_id}")
                 
-            logger.info(f"Successfully got entity of type {type(entity).__name__}: {entity.title}")
-            
-            @sync_to_async
-            def message_exists(message_id):
-                return TelegramMessage.objects.filter(
-                    group=group,
-                    message_id=message_id
-                ).exists()
-
-            @sync_to_async
-            def create_message(msg_data):
-                return TelegramMessage.objects.create(**msg_data)
-
-            try:
-                messages = await self.client.get_messages(
+            logger.info(f"Resolved {group.name} to {type(entity).__name__}")
+
+            if association is None:
+                association = await self.get_association(group)
+
+            incremental = bool(association and association.last_message_id) and since is None
+            # A window only extends the cursor when it starts below it,
+            # otherwise the messages in between were never fetched
+            advance_cursor = bool(association) and (
+                since is None
+                or not association.last_message_id
+                or (association.last_message_date and association.last_message_date >= since)
+            )
+            if since is not None:
+                logger.info(f"Fetching messages since {since.isoformat()} from {group.name}")
+                messages = self.client.iter_messages(
                     entity,
-                    limit=limit
+                    limit=limit,
+                    offset_date=since,
+                    reverse=True
                 )
-                logger.info(f"Retrieved {len(messages)} messages from group")
-            except Exception as e:
-                logger.error(f"Error getting messages: {str(e)}")
-                return 0
+            elif incremental:
+                logger.info(f"Fetching messages newer than {association.last_message_id} from {group.name}")
+                messages = self._messages_after(entity, association.last_message_id)
+            else:
+                messages = self.client.iter_messages(entity, limit=limit)
 
-            count = 0
-            for message in messages:
-                try:
-                    if not message.text and not message.media:
-                        continue
+            ingestor = MessageIngestor(group, batch_size=batch_size, resolve_senders=self.resolve_senders)
+            high_id = None
+            high_date = None
 
-                    exists = await message_exists(message.id)
-                    if exists:
+            try:
+                async for message in messages:
+                    if high_id is None or message.id > high_id:
+                        high_id = message.id
+                        high_date = message.date
+
+                    try:
+                        msg_data = self.build_message_data(message)
+                        if not msg_data:
+                            continue
+                        batch = await ingestor.add(msg_data)
+                        # Oldest-first paging means everything up to high_id
+                        # is stored once a batch has been flushed
+                        if batch and incremental:
+                            await self.save_cursor(association, high_id, high_date)
+                    except Exception as msg_e:
+                        logger.error(f"Error processing message {message.id}: {str(msg_e)}")
                         continue
+            except Exception as e:
+                # The cursor covers every flushed batch, a retry resumes there
+                logger.error(f"Error getting messages: {str(e)}")
+                raise
 
-                    sender_name = 'Unknown'
-                    sender_id = None
-                    sender_username = None
-                    
-                    if hasattr(message, 'sender_id') and message.sender_id:
-                        sender_id = str(message.sender_id)
-                        if hasattr(message, 'sender') and message.sender:
-                            sender = message.sender
-                            first_name = getattr(sender, 'first_name', '') or ''
-                            last_name = getattr(sender, 'last_name', '') or ''
-                            sender_name = f"{first_name} {last_name}".strip() or getattr(sender, 'username', 'Unknown')
-                            sender_username = getattr(sender, 'username', None)
-                        else:
-                            sender_name = f"User{message.sender_id}"
-
-                    message_text = message.text or ''
-                    message_type = 'TEXT'
-
-                    if message.media:
-                        if isinstance(message.media, MessageMediaDocument) and hasattr(message.media.document, 'attributes'):
-                            for attr in message.media.document.attributes:
-                                if isinstance(attr, DocumentAttributeAudio) and attr.voice:
-                                    message_type = 'VOICE'
-                                    message_text = self.process_voice_message(message)
-                                    break
-                            if message_type == 'TEXT':  # If not voice, then it's a regular document
-                                message_type = 'DOCUMENT'
-                                message_text = self.process_document(message)
-                        elif isinstance(message.media, MessageMediaPhoto):
-                            message_type = 'PHOTO'
-                            message_text = self.process_photo(message)
-                        else:
-                            message_type = 'OTHER'
-                            message_text = self.process_unsupported_media(message.media)
-
-                    # Create or update the message
-                    TelegramMessage.objects.create(
-                        group=group,
-                        message_id=message.id,
-                        sender_id=sender_id,
-                        sender_name=sender_name,
-                        sender_username=sender_username,
-                        text=message_text,
-                        message_type=message_type,  # Make sure this line exists
-                        date=message.date,
-                        is_processed=False
-                    )
-                    count += 1
-
-                    if count % 50 == 0:
-                        logger.info(f"Processed {count} new messages so far")
+            batches = await ingestor.close()
+            count = ingestor.created_count
 
-                except Exception as msg_e:
-                    logger.error(f"Error processing message {message.id}: {str(msg_e)}")
-                    continue
+            if advance_cursor and high_id is not None:
+                await self.save_cursor(association, high_id, high_date)
+            if incremental:
+                await self.limiter.record_success()
 
-            logger.info(f"Successfully collected {count} new messages from {group.name}")
+            logger.info(f"Successfully collected {count} new messages from {group.name} in {len(batches)} batches")
             return count
 
         except Exception as e:
             logger.error(f"Error in collect_messages: {str(e)}")
+            raise
+
+    async def _messages_after(self, entity, min_id):
+        """Messages newer than `min_id`, oldest first, requested a chunk at a time"""
+        while True:
+            chunk = await self.limiter.chunk_size()
+            fetched = 0
+            async for message in self.client.iter_messages(entity, limit=chunk, min_id=min_id, reverse=True):
+                fetched += 1
+                min_id = max(min_id, message.id)
+                yield message
+            if fetched < chunk:
+                return
+
+    async def resolve_senders(self, user_ids):
+        """Resolve sender ids through the account's sender cache"""
+        return await self.senders.resolve(user_ids, client=self.client)
+
+    async def save_backfill_checkpoint(self, association, offset_id, completed=False):
+        """Persist how far the historical backfill has progressed"""
+        association.backfill_offset_id = offset_id
+        association.backfill_completed_at = timezone.now() if completed else None
+        await association.asave(update_fields=['backfill_offset_id', 'backfill_completed_at'])
+
+    async def backfill_messages(self, group, association=None, limit=None, chunk_size=500, reset=False,
+                                on_progress=None):
+        """
+        Stream a group's history oldest-first and store it in chunks.
+
+        The offset id reached is checkpointed on the association after every
+        chunk, so an interrupted backfill resumes where it stopped instead of
+        starting over. Returns the number of new messages stored.
+
+        `on_progress` is awaited with the number of messages stored so far
+        after every chunk; the backfill stops at that checkpoint when it
+        returns False.
+        """
+        if not self.client or not await self.client.is_user_authorized():
+            logger.error("Client not authenticated")
             return 0
 
-    async def get_sender_info(self, message):
-        """Get sender information from a message"""
-        try:
-            if message.sender_id:
-                sender = await self.client.get_entity(message.sender_id)
-                return {
-                    'id': sender.id,
-                    'name': f"{getattr(sender, 'first_name', '')} {getattr(sender, 'last_name', '')}".strip(),
-                    'username': getattr(sender, 'username', None)
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Error getting sender info: {str(e)}")
-            return None
+        entity = await self.get_entity_by_id(group.group_id)
 
-    async def sync_historical_messages(self, group, limit=1000):
-        """Sync historical messages from a Telegram group"""
-        try:
-            if not self.client or not await self.client.is_user_authorized():
-                logger.error("Client not authenticated")
-                return 0
+        if not entity:
+            logger.error(f"Could not resolve entity for group ID: {group.group_id}")
+            return 0
 
-            entity = await self.get_entity_by_id(group.group_id)
-            
-            if not entity:
-                logger.error(f"Could not resolve entity for group ID: {group.group_id}")
-                return 0
+        if association is None:
+            association = await self.get_association(group)
+        if association is None:
+            logger.error(f"No association between {self.account.phone_number} and {group.name}")
+            return 0
 
-            @sync_to_async
-            def create_message(msg_data):
-                return TelegramMessage.objects.create(**msg_data)
+        if reset:
+            await self.save_backfill_checkpoint(association, None)
 
-            messages = await self.client.get_messages(
+        offset_id = association.backfill_offset_id or 0
+        logger.info(f"Backfilling {group.name} from message {offset_id}")
+
+        ingestor = MessageIngestor(group, batch_size=chunk_size, resolve_senders=self.resolve_senders)
+        fetched = 0
+        exhausted = False
+        stopped = False
+
+        try:
+            async for message in self.client.iter_messages(
                 entity,
                 limit=limit,
+                offset_id=offset_id,
                 reverse=True
-            )
-            
-            count = 0
-            for message in messages:
+            ):
+                fetched += 1
+                offset_id = message.id
+
                 try:
-                    if not message.text and not message.media:
+                    msg_data = self.build_message_data(message)
+                    if not msg_data:
                         continue
-
-                    # Get sender info
-                    sender = await self.get_sender_info(message)
-                    sender_id = sender.get('id') if sender else None
-                    sender_name = sender.get('name') if sender else None
-                    sender_username = sender.get('username') if sender else None
-
-                    message_text = message.text or ''
-                    message_type = 'TEXT'
-
-                    if message.media:
-                        if isinstance(message.media, MessageMediaDocument):
-                            if hasattr(message.media.document, 'attributes'):
-                                for attr in message.media.document.attributes:
-                                    if isinstance(attr, DocumentAttributeAudio) and attr.voice:
-                                        message_type = 'VOICE'
-                                        message_text = self.process_voice_message(message)
-                                        break
-                                if message_type == 'TEXT':  # If not voice, then it's a regular document
-                                    message_type = 'DOCUMENT'
-                                    message_text = self.process_document(message)
-                        elif isinstance(message.media, MessageMediaPhoto):
-                            message_type = 'PHOTO'
-                            message_text = self.process_photo(message)
-                        else:
-                            message_type = 'OTHER'
-                            message_text = self.process_unsupported_media(message.media)
-
-                    # Create message using sync_to_async
-                    msg_data = {
-                        'group': group,
-                        'message_id': message.id,
-                        'sender_id': sender_id,
-                        'sender_name': sender_name,
-                        'sender_username': sender_username,
-                        'text': message_text,
-                        'message_type': message_type,
-                        'date': message.date,
-                        'is_processed': False
-                    }
-                    
-                    await create_message(msg_data)
-                    count += 1
-
-                    if count % 50 == 0:
-                        logger.info(f"Processed {count} new messages so far")
-
+                    if await ingestor.add(msg_data):
+                        await self.save_backfill_checkpoint(association, offset_id)
+                        logger.info(f"Backfill of {group.name} reached message {offset_id}")
+                        if on_progress and await on_progress(ingestor.created_count) is False:
+                            stopped = True
+                            break
                 except Exception as msg_e:
                     logger.error(f"Error processing message {message.id}: {str(msg_e)}")
                     continue
+            exhausted = not stopped and (limit is None or fetched < limit)
+        except Exception as e:
+            logger.error(f"Error streaming history of {group.name}: {str(e)}")
 
-            logger.info(f"Successfully synced {count} messages from {group.name}")
-            return count
+        await ingestor.close()
+        await self.save_backfill_checkpoint(association, offset_id or None, completed=exhausted)
 
+        count = ingestor.created_count
+        logger.info(f"Backfilled {count} messages from {group.name}" + (" (complete)" if exhausted else ""))
+        return count
+
+    async def sync_historical_messages(self, group, limit=1000):
+        """Sync historical messages from a Telegram group"""
+        try:
+            return await self.backfill_messages(group, limit=limit)
         except Exception as e:
             logger.error(f"Error in sync_historical_messages: {str(e)}")
             return 0
             
+    async def persist_session(self):
+        """Write the client's entity cache and update state to the database"""
+        if self.client and isinstance(self.client.session, DjangoSession):
+            try:
+                await self.client.session.persist()
+            except Exception as e:
+                logger.error(f"Error persisting session of {self.account.phone_number}: {str(e)}")
+
+    def has_update_state(self, group):
+        """
+        Whether missed updates of the group are caught up from the saved
+        update state, so polling it after an outage is unnecessary
+        """
+        if not (self.catch_up and self.client):
+            return False
+
+        group_id = raw_group_id(group.group_id)
+        session = self.client.session
+        states = dict(session.get_update_states())
+        # Channels have their own pts, basic groups share the account's
+        if group_id in states:
+            return True
+        return 0 in states and bool(session.get_entity_rows_by_id(utils.get_peer_id(PeerChat(group_id))))
+
+    async def save_update_state(self):
+        """
+        Checkpoint the update state of a connected client.
+
+        Telethon only writes its update state into the session when
+        disconnecting, so without this a crash would lose everything the
+        client processed since it connected.
+        """
+        if self.client and self.client.is_connected() and hasattr(self.client, '_save_states_and_entities'):
+            self.client._save_states_and_entities()
+        await self.persist_session()
+
     async def disconnect(self):
         """Disconnect the client"""
         if self.client:
             await self.client.disconnect()
+            # Disconnecting flushes Telethon's entities and update state into the session
+            await self.persist_session()
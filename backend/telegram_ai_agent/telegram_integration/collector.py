@@ -0,0 +1,127 @@
+"""
+Long-running message collector that keeps Telegram clients connected
+"""
+import asyncio
+import logging
+import time
+from django.conf import settings
+from .listener import MessageListener
+from .pool import ClientPool
+from .scheduler import CollectionScheduler, load_active_associations
+
+logger = logging.getLogger(__name__)
+
+class CollectorDaemon:
+    """
+    Collect messages from every active association in a loop.
+
+    Associations and accounts are reloaded from the database on every cycle,
+    so new groups, deactivated accounts and re-authenticated sessions are
+    picked up without a restart, while the clients themselves stay connected
+    in a ClientPool between cycles. Each cycle runs on a CollectionScheduler,
+    so accounts are collected concurrently, and only collects the groups
+    whose adaptive poll interval has elapsed.
+
+    With `listen` every connected account also gets a MessageListener that
+    ingests messages as they arrive; the polling cycles then only act as a
+    periodic resync of every group and run every
+    TELEGRAM_LISTENER_RESYNC_INTERVAL seconds.
+    Clients are created with catch-up enabled and their listener attached
+    before connecting, so after a restart exactly the missed messages,
+    edits and deletions are fetched from the saved update state.
+    """
+    def __init__(self, interval=None, pool=None, listen=False):
+        self.listen = listen
+        if listen:
+            default_interval = getattr(settings, 'TELEGRAM_LISTENER_RESYNC_INTERVAL', 900)
+        else:
+            default_interval = getattr(settings, 'TELEGRAM_COLLECTOR_INTERVAL', 60)
+        self.interval = interval or default_interval
+        if pool is None:
+            pool = ClientPool(catch_up=True, on_create=self._attach_listener) if listen else ClientPool()
+        self.pool = pool
+        self.scheduler = CollectionScheduler(pool=self.pool)
+        self.listeners = {}
+        self._attached = {}
+        self._by_account = {}
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        """Ask the loop to finish after the current cycle"""
+        self._stop.set()
+
+    async def run(self, once=False):
+        """Run collection cycles until stopped"""
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    await self.run_cycle()
+                except Exception as e:
+                    logger.error(f"Collection cycle failed: {str(e)}")
+
+                if once:
+                    break
+
+                delay = max(0, self.interval - (time.monotonic() - started))
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for listener in self.listeners.values():
+                await listener.stop()
+            self.listeners = {}
+            await self.pool.close()
+
+    async def run_cycle(self):
+        """Collect the due active associations once, reusing pooled clients"""
+        by_account = await load_active_associations()
+        self._by_account = by_account
+        if self.listen:
+            for account_id in list(self.listeners):
+                if account_id not in by_account:
+                    await self.listeners.pop(account_id).stop()
+        await self.pool.retain(by_account)
+        if self.listen:
+            await self.sync_listeners(by_account)
+            return await self.scheduler.run(by_account)
+        return await self.scheduler.run(await load_active_associations(due_only=True))
+
+    def _attach_listener(self, manager):
+        """Register a listener on a new manager before its client connects"""
+        listener = MessageListener(manager, self._by_account.get(manager.account.pk, []))
+        listener.attach()
+        self._attached[manager.account.pk] = listener
+
+    async def sync_listeners(self, by_account):
+        """Start, update or replace the listener of every connected account"""
+        for account_id, associations in by_account.items():
+            account = associations[0].account
+            try:
+                manager = await self.pool.get(account)
+            except Exception as e:
+                logger.error(f"Could not connect account {account.phone_number}: {str(e)}")
+                manager = None
+
+            listener = self.listeners.get(account_id)
+            if listener and listener.manager is not manager:
+                # The client was replaced, e.g. after re-authentication
+                await self.listeners.pop(account_id).stop()
+                listener = None
+
+            if manager is None:
+                continue
+            try:
+                if listener:
+                    listener.update(associations)
+                    await listener.catch_up()
+                else:
+                    listener = self._attached.pop(account_id, None)
+                    if listener is None or listener.manager is not manager:
+                        listener = MessageListener(manager, associations)
+                    listener.update(associations)
+                    self.listeners[account_id] = listener
+                    await listener.start()
+            except Exception as e:
+                logger.error(f"Error starting listener for {account.phone_number}: {str(e)}")
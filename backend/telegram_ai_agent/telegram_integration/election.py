@@ -0,0 +1,130 @@
+"""
+Choice of the account that collects a group watched by several accounts
+"""
+import logging
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from .models import AccountGroupAssociation
+from .ratelimit import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+class CollectorElection:
+    """
+    Elect one "collector of record" per group for a collection run.
+
+    Every group is fetched once, through the best of the associations that
+    watch it, however many accounts are subscribed. Candidates are ranked by
+
+    1. whether their account is currently serving a FloodWait,
+    2. the number of consecutive failed collections of the association,
+    3. the number of groups already assigned to the account in this run,
+       so the work is spread over the healthy accounts,
+    4. the most recent successful collection, which keeps a group on the
+       same account while it stays healthy.
+
+    The other candidates are kept as standbys that `failover()` hands out
+    when the elected one turns out to be unavailable. Candidates behind the
+    group's newest cursor are moved up to it in the database as well, since
+    Celery workers reload the associations they collect.
+    """
+    def __init__(self, by_account):
+        self.by_account = by_account
+        self.standbys = {}
+        self.elected = {}
+
+    async def elect(self):
+        """Return account id -> elected associations, in the shape of `by_account`"""
+        candidates = {}
+        for associations in self.by_account.values():
+            for association in associations:
+                candidates.setdefault(association.group_id, []).append(association)
+
+        blocked = {}
+        for account_id in self.by_account:
+            blocked[account_id] = await get_rate_limiter(account_id).blocked_for() > 0
+
+        load = {account_id: 0 for account_id in self.by_account}
+        plan = {}
+        raised = []
+        # Groups with the fewest candidates first, they have the least choice
+        for group_id, group_candidates in sorted(candidates.items(), key=lambda item: (len(item[1]), item[0])):
+            raised.extend(self._share_cursor(group_candidates))
+            ranked = sorted(group_candidates, key=lambda a: (
+                blocked[a.account_id],
+                a.consecutive_failures,
+                load[a.account_id],
+                -(a.last_collection.timestamp() if a.last_collection else 0),
+                a.pk,
+            ))
+            elected = ranked[0]
+            load[elected.account_id] += 1
+            plan.setdefault(elected.account_id, []).append(elected)
+            self.elected[group_id] = elected
+            self.standbys[group_id] = ranked[1:]
+
+        if raised:
+            await self._save_cursors(raised)
+        if self.standby_count:
+            logger.info(
+                f"Elected collectors for {len(self.elected)} groups, "
+                f"{self.standby_count} subscriptions on standby"
+            )
+        return plan
+
+    def failover(self, group_id):
+        """Return the next standby association of a group, or None"""
+        standbys = self.standbys.get(group_id)
+        if not standbys:
+            return None
+        association = standbys.pop(0)
+        previous = self.elected.get(group_id)
+        if previous:
+            # Whatever the previous collector stored is stored for the group
+            self._share_cursor([previous, association])
+        self.elected[group_id] = association
+        logger.info(
+            f"Failing over {association.group.name} to account {association.account.phone_number}"
+        )
+        return association
+
+    @property
+    def standby_count(self):
+        return sum(len(standbys) for standbys in self.standbys.values())
+
+    @staticmethod
+    def _share_cursor(associations):
+        """
+        Start every candidate from the group's highest cursor and return the
+        candidates that were behind it.
+
+        Messages are stored per group, so whichever account collects next
+        only needs what is newer than anything stored through any of them.
+        """
+        newest = max(
+            (a for a in associations if a.last_message_id),
+            key=lambda a: a.last_message_id,
+            default=None
+        )
+        if newest is None:
+            return []
+        raised = []
+        for association in associations:
+            if not association.last_message_id or association.last_message_id < newest.last_message_id:
+                association.last_message_id = newest.last_message_id
+                association.last_message_date = newest.last_message_date
+                raised.append(association)
+        return raised
+
+    @staticmethod
+    @sync_to_async
+    def _save_cursors(associations):
+        """Store the raised cursors, never moving one back"""
+        for association in associations:
+            AccountGroupAssociation.objects.filter(
+                Q(last_message_id__isnull=True) | Q(last_message_id__lt=association.last_message_id),
+                pk=association.pk
+            ).update(
+                last_message_id=association.last_message_id,
+                last_message_date=association.last_message_date
+            )
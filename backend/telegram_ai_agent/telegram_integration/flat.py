@@ -0,0 +1,48 @@
+"""
+Flat list responses for objects that belong to a group
+"""
+from rest_framework.response import Response
+from .serializers import TelegramGroupSerializer
+
+class FlatGroupsMixin:
+    """
+    Let list endpoints answer `?flat=1` with ids instead of nested objects.
+
+    The nested serializers repeat the full group of every row. In flat mode
+    the list uses `flat_serializer_class`, whose relations are plain ids,
+    and the groups of the listed rows are sent once, keyed by id:
+
+        {"results": [{"id": 1, "group": 3, ...}], "groups": {"3": {...}}}
+
+    Paginated lists keep their pagination keys next to `groups`. The
+    groups come from the rows, so querysets should `select_related` them.
+    """
+    flat_serializer_class = None
+
+    @property
+    def flat(self):
+        return self.request.query_params.get('flat', '').lower() in ('1', 'true', 'yes')
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.flat_serializer_class and self.flat:
+            return self.flat_serializer_class
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        if not (self.flat_serializer_class and self.flat):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = page if page is not None else list(queryset)
+        results = self.get_serializer(objects, many=True).data
+        groups = {
+            str(obj.group_id): TelegramGroupSerializer(obj.group).data
+            for obj in objects
+        }
+
+        if page is not None:
+            response = self.get_paginated_response(results)
+            response.data['groups'] = groups
+            return response
+        return Response({'results': results, 'groups': groups})
@@ -0,0 +1,123 @@
+"""
+Batched ingest stage for messages fetched from Telegram
+"""
+import logging
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from .models import TelegramMessage
+from .signals import messages_ingested
+
+logger = logging.getLogger(__name__)
+
+class MessageIngestor:
+    """
+    Buffer converted messages for one group and write them in chunks.
+
+    Every flush dedups the buffered messages in memory against the ids that
+    are already stored for the group (one query) and writes the remainder
+    with a single bulk insert, so a chunk costs two queries whatever its size.
+
+    When `resolve_senders` is given, the senders of each chunk are resolved
+    in one call before writing and linked to the stored messages. Every
+    non-empty batch is announced through the `messages_ingested` signal.
+
+    Messages are unique per group, so a batch racing another collector of
+    the same group skips whatever that one stored first instead of failing.
+    """
+    def __init__(self, group, batch_size=500, resolve_senders=None):
+        self.group = group
+        self.batch_size = batch_size
+        self.resolve_senders = resolve_senders
+        self.buffer = []
+        self.batches = []
+
+    @property
+    def created_count(self):
+        """Total number of messages inserted so far"""
+        return sum(batch['created'] for batch in self.batches)
+
+    async def add(self, msg_data):
+        """
+        Queue a message dict and flush once the buffer is full.
+        Returns the batch counts when this call triggered a flush.
+        """
+        self.buffer.append(msg_data)
+        if len(self.buffer) >= self.batch_size:
+            return await self.flush()
+        return None
+
+    async def flush(self):
+        """Write the buffered messages and return the counts for this batch"""
+        if not self.buffer:
+            return None
+
+        pending, self.buffer = self.buffer, []
+        if self.resolve_senders:
+            await self._link_senders(pending)
+        created = await self._write_batch(pending)
+
+        batch = {
+            'received': len(pending),
+            'created': len(created),
+            'skipped': len(pending) - len(created),
+        }
+        self.batches.append(batch)
+        logger.info(
+            f"Ingested batch {len(self.batches)} for {self.group.name}: "
+            f"{batch['created']} new, {batch['skipped']} skipped"
+        )
+        return batch
+
+    async def close(self):
+        """Flush whatever is left and return the per-batch counts"""
+        await self.flush()
+        return self.batches
+
+    async def _link_senders(self, pending):
+        user_ids = {msg_data['sender_id'] for msg_data in pending if msg_data.get('sender_id')}
+        if not user_ids:
+            return
+
+        senders = await self.resolve_senders(user_ids)
+        for msg_data in pending:
+            sender = senders.get(msg_data.get('sender_id'))
+            if sender is not None:
+                msg_data['sender_profile'] = sender
+                msg_data['sender_name'] = sender.display_name
+
+    @sync_to_async
+    def _write_batch(self, pending):
+        # Only the first copy of a message id inside a batch is kept
+        by_id = {}
+        for msg_data in pending:
+            by_id.setdefault(msg_data['message_id'], msg_data)
+
+        new_messages = self._new_messages(by_id)
+        if not new_messages:
+            return new_messages
+
+        try:
+            with transaction.atomic():
+                TelegramMessage.objects.bulk_create(new_messages)
+        except IntegrityError:
+            # Some of them were stored since the check, by a concurrent collection
+            logger.info(f"Concurrent insert in {self.group.name}, skipping the stored messages")
+            new_messages = self._new_messages(by_id)
+            TelegramMessage.objects.bulk_create(new_messages, ignore_conflicts=True)
+
+        if new_messages:
+            messages_ingested.send(sender=TelegramMessage, group=self.group, messages=new_messages)
+        return new_messages
+
+    def _new_messages(self, by_id):
+        existing = set(
+            TelegramMessage.objects.filter(
+                group=self.group,
+                message_id__in=list(by_id)
+            ).values_list('message_id', flat=True)
+        )
+        return [
+            TelegramMessage(group=self.group, **msg_data)
+            for message_id, msg_data in by_id.items()
+            if message_id not in existing
+        ]
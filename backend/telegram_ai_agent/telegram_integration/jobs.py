@@ -0,0 +1,93 @@
+"""
+Background jobs for operations that take too long for an HTTP request
+"""
+import logging
+from celery import current_app
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import Job
+from .serializers import JobSerializer
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """The job was cancelled while it was running"""
+
+def enqueue_job(user, kind, params, task):
+    """Create a pending job and hand it to a Celery task taking its id"""
+    job = Job.objects.create(user=user, kind=kind, params=params)
+    job.task_id = task.delay(job.pk).id
+    job.save(update_fields=['task_id'])
+    return job
+
+def job_accepted(request, job):
+    """202 response describing a queued job, whose `url` reports its status"""
+    return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+def update_progress(job, processed=None, phase=None):
+    """
+    Record the progress of a running job and return whether it should go on,
+    i.e. False once cancellation was requested
+    """
+    fields = {}
+    if processed is not None:
+        job.processed = fields['processed'] = processed
+    if phase is not None:
+        job.phase = fields['phase'] = phase
+    if fields:
+        Job.objects.filter(pk=job.pk).update(**fields)
+    job.cancel_requested = Job.objects.filter(pk=job.pk, cancel_requested=True).exists()
+    return not job.cancel_requested
+
+def run_job(job_id, work):
+    """
+    Run `work(job)` for a pending job and record the outcome.
+
+    `work` returns the JSON result of the job. It reports progress through
+    `update_progress` and raises JobCancelled when that says to stop. A job
+    cancelled before a worker picked it up is not run at all.
+    """
+    started = Job.objects.filter(pk=job_id, status='pending').update(
+        status='running',
+        started_at=timezone.now()
+    )
+    if not started:
+        logger.info(f"Job {job_id} is no longer pending, not running it")
+        return None
+
+    job = Job.objects.get(pk=job_id)
+    try:
+        job.result = work(job)
+        job.status = 'succeeded'
+    except JobCancelled:
+        job.status = 'cancelled'
+        logger.info(f"Job {job_id} cancelled")
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return job.status
+
+def cancel_job(job):
+    """
+    Cancel a job: a pending one right away, a running one as soon as it next
+    reports progress. Returns False if the job had already finished.
+    """
+    cancelled = Job.objects.filter(pk=job.pk, status='pending').update(
+        status='cancelled', cancel_requested=True, finished_at=timezone.now()
+    )
+    if cancelled:
+        if job.task_id:
+            try:
+                current_app.control.revoke(job.task_id)
+            except Exception as e:
+                # run_job skips cancelled jobs anyway
+                logger.error(f"Error revoking task of job {job.pk}: {str(e)}")
+        requested = 0
+    else:
+        requested = Job.objects.filter(pk=job.pk, status='running').update(cancel_requested=True)
+    job.refresh_from_db()
+    return bool(cancelled or requested)
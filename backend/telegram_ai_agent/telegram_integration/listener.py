@@ -0,0 +1,248 @@
+"""
+Real-time ingestion from Telegram update events
+"""
+import asyncio
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from telethon import events, utils
+from telethon.tl.types import PeerChannel, PeerChat
+from .client import raw_group_id
+from .ingest import MessageIngestor
+from .models import TelegramMessage
+from .signals import messages_edited, messages_deleted
+
+logger = logging.getLogger(__name__)
+
+def group_peer_ids(group):
+    """Return the marked peer ids a stored group can appear under in updates"""
+    group_id = raw_group_id(group.group_id)
+    return [utils.get_peer_id(PeerChannel(group_id)), utils.get_peer_id(PeerChat(group_id))]
+
+class MessageListener:
+    """
+    Ingest new, edited and deleted messages of one account as they happen.
+
+    Handlers for NewMessage, MessageEdited and MessageDeleted only buffer the
+    changes; they are written in batches once a group has `flush_size`
+    pending messages or every `flush_interval` seconds, whichever comes
+    first, so a busy group still costs a couple of queries per batch.
+
+    New messages advance the association's cursor, so polling collection
+    only fetches what the listener missed. Telegram does not say which chat
+    a deletion in a basic group or private chat belongs to, so only
+    deletions in channels and supergroups are recorded.
+
+    When the manager catches up from its saved update state, the changes
+    missed while offline arrive through the same handlers, and the update
+    state is checkpointed every `state_interval` seconds after a flush.
+    Only groups without a saved state are caught up by polling.
+    """
+    def __init__(self, manager, associations, flush_size=None, flush_interval=None, state_interval=None):
+        self.manager = manager
+        self.flush_size = flush_size or getattr(settings, 'TELEGRAM_LISTENER_FLUSH_SIZE', 100)
+        self.flush_interval = flush_interval or getattr(settings, 'TELEGRAM_LISTENER_FLUSH_INTERVAL', 2)
+        self.state_interval = state_interval or getattr(settings, 'TELEGRAM_UPDATE_STATE_INTERVAL', 30)
+        self.associations = {}
+        self.ingestors = {}
+        self.edits = {}
+        self.deletions = {}
+        self.cursors = {}
+        self._caught_up = set()
+        self._handlers = []
+        self._task = None
+        self._lock = asyncio.Lock()
+        self._state_saved = time.monotonic()
+        self.update(associations)
+
+    def update(self, associations):
+        """Replace the set of associations the listener ingests for"""
+        self.associations = {}
+        for association in associations:
+            for peer_id in group_peer_ids(association.group):
+                self.associations[peer_id] = association
+
+    def association_for(self, chat_id):
+        return self.associations.get(chat_id) if chat_id is not None else None
+
+    def attach(self):
+        """Register the event handlers with the manager"""
+        if self._handlers:
+            return
+        self._handlers = [
+            (self.on_new_message, events.NewMessage()),
+            (self.on_message_edited, events.MessageEdited()),
+            (self.on_message_deleted, events.MessageDeleted()),
+        ]
+        for callback, event in self._handlers:
+            self.manager.add_event_handler(callback, event)
+
+    async def start(self):
+        """Start listening, then catch up on the groups without update state"""
+        self.attach()
+        self._task = asyncio.ensure_future(self._flush_loop())
+        logger.info(f"Listening for messages of {self.manager.account.phone_number}")
+
+        await self.catch_up()
+
+    async def catch_up(self):
+        """Collect what was posted while nobody was listening"""
+        for association in {a.pk: a for a in self.associations.values()}.values():
+            if association.pk in self._caught_up:
+                continue
+            if self.manager.has_update_state(association.group):
+                # Telethon fetches the difference for it on connect
+                self._caught_up.add(association.pk)
+                continue
+            try:
+                await self.manager.collect_messages(association.group, association=association)
+                self._caught_up.add(association.pk)
+            except Exception as e:
+                logger.error(f"Error catching up on {association.group.name}: {str(e)}")
+
+    async def stop(self):
+        """Unregister the handlers and write whatever is still buffered"""
+        for callback, event in self._handlers:
+            self.manager.remove_event_handler(callback, event)
+        self._handlers = []
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._state_saved >= self.state_interval:
+                    # Only after a flush, so the saved state never runs ahead
+                    # of the messages written
+                    await self.manager.save_update_state()
+                    self._state_saved = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error flushing listener of {self.manager.account.phone_number}: {str(e)}")
+
+    def _ingestor(self, association):
+        if association.pk not in self.ingestors:
+            self.ingestors[association.pk] = (association, MessageIngestor(
+                association.group,
+                batch_size=self.flush_size,
+                resolve_senders=self.manager.resolve_senders
+            ))
+        return self.ingestors[association.pk][1]
+
+    async def on_new_message(self, event):
+        association = self.association_for(event.chat_id)
+        if association is None:
+            return
+        try:
+            msg_data = self.manager.build_message_data(event.message)
+            if not msg_data:
+                return
+            cursor = self.cursors.get(association.pk)
+            if cursor is None or event.message.id > cursor[0]:
+                self.cursors[association.pk] = (event.message.id, event.message.date)
+
+            ingestor = self._ingestor(association)
+            ingestor.buffer.append(msg_data)
+            if len(ingestor.buffer) >= self.flush_size:
+                async with self._lock:
+                    await self._flush_new(association.pk)
+        except Exception as e:
+            logger.error(f"Error handling new message {event.message.id}: {str(e)}")
+
+    async def on_message_edited(self, event):
+        association = self.association_for(event.chat_id)
+        if association is None:
+            return
+        try:
+            msg_data = self.manager.build_message_data(event.message)
+            if not msg_data:
+                return
+            msg_data['edited_at'] = event.message.edit_date or timezone.now()
+            self.edits.setdefault(association.pk, (association, {}))[1][event.message.id] = msg_data
+            if len(self.edits[association.pk][1]) >= self.flush_size:
+                await self.flush()
+        except Exception as e:
+            logger.error(f"Error handling edit of message {event.message.id}: {str(e)}")
+
+    async def on_message_deleted(self, event):
+        association = self.association_for(event.chat_id)
+        if association is None:
+            return
+        self.deletions.setdefault(association.pk, (association, set()))[1].update(event.deleted_ids)
+        if len(self.deletions[association.pk][1]) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        """Write the buffered new messages, then edits, then deletions"""
+        async with self._lock:
+            for association_pk in list(self.ingestors):
+                await self._flush_new(association_pk)
+
+            edits, self.edits = self.edits, {}
+            for association, pending in edits.values():
+                await self._write_edits(association, pending)
+
+            deletions, self.deletions = self.deletions, {}
+            for association, message_ids in deletions.values():
+                await self._write_deletions(association.group, message_ids)
+
+    async def _flush_new(self, association_pk):
+        association, ingestor = self.ingestors[association_pk]
+        if not ingestor.buffer:
+            return
+
+        # Taken before the flush, so messages arriving meanwhile are not covered
+        cursor = self.cursors.pop(association_pk, None)
+        await ingestor.flush()
+        # The listener lives for days, only the stored messages matter
+        ingestor.batches = []
+
+        # Until catch-up for the group has finished there may be a gap
+        # below the first message we heard about
+        if cursor and association_pk in self._caught_up:
+            await self.manager.save_cursor(association, *cursor)
+
+    async def _write_edits(self, association, pending):
+        missing = await self._apply_edits(association.group, pending)
+        # Edits of messages we never stored are ingested as new messages
+        ingestor = self._ingestor(association)
+        for message_id in missing:
+            msg_data = pending[message_id]
+            msg_data.pop('edited_at', None)
+            ingestor.buffer.append(msg_data)
+        if missing:
+            await ingestor.flush()
+
+    @sync_to_async
+    def _apply_edits(self, group, pending):
+        messages = list(TelegramMessage.objects.filter(group=group, message_id__in=list(pending)))
+        for message in messages:
+            msg_data = pending[message.message_id]
+            message.text = msg_data['text']
+            message.message_type = msg_data['message_type']
+            message.edited_at = msg_data['edited_at']
+        if messages:
+            TelegramMessage.objects.bulk_update(messages, ['text', 'message_type', 'edited_at'])
+            messages_edited.send(sender=TelegramMessage, group=group, messages=messages)
+            logger.info(f"Applied {len(messages)} edits in {group.name}")
+        return set(pending) - {message.message_id for message in messages}
+
+    @sync_to_async
+    def _write_deletions(self, group, message_ids):
+        updated = TelegramMessage.objects.filter(
+            group=group,
+            message_id__in=list(message_ids),
+            is_deleted=False
+        ).update(is_deleted=True)
+        if updated:
+            messages_deleted.send(sender=TelegramMessage, group=group, message_ids=sorted(message_ids))
+            logger.info(f"Marked {updated} messages as deleted in {group.name}")
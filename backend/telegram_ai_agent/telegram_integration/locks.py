@@ -0,0 +1,69 @@
+"""
+Locks that keep a group from being collected twice at the same time
+"""
+import logging
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+class CollectionLock:
+    """
+    Lock on the collection of one group.
+
+    Keyed on the group, not on the association, since several accounts may
+    subscribe to the same group and only one of them should fetch it.
+
+    Built on the Django cache: `cache.add` only stores a key that does not
+    exist yet, which the Redis backend does atomically, so with CACHE_REDIS_URL
+    set the lock holds across Celery workers, the API and the collector.
+    The lock expires after `timeout` seconds in case its holder dies.
+
+        with CollectionLock(association.group_id) as acquired:
+            if not acquired:
+                return
+            ...
+    """
+    def __init__(self, group_id, timeout=None):
+        self.key = f'telegram:collect-lock:{group_id}'
+        self.timeout = timeout or getattr(settings, 'TELEGRAM_COLLECTION_TIMEOUT', 300) + 60
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+
+    def acquire(self):
+        """Take the lock if it is free and return whether we hold it"""
+        self.acquired = cache.add(self.key, self.token, self.timeout)
+        return self.acquired
+
+    def release(self):
+        """Give the lock back, unless it expired and someone else took it"""
+        if not self.acquired:
+            return
+        self.acquired = False
+        try:
+            if cache.get(self.key) == self.token:
+                cache.delete(self.key)
+        except Exception as e:
+            logger.error(f"Error releasing {self.key}: {str(e)}")
+
+    def extend(self):
+        """Restart the expiry of a lock we hold, for work that runs longer than `timeout`"""
+        if not self.acquired:
+            return
+        try:
+            if cache.get(self.key) == self.token:
+                cache.touch(self.key, self.timeout)
+        except Exception as e:
+            logger.error(f"Error extending {self.key}: {str(e)}")
+
+    def locked(self):
+        """Whether anybody currently holds the lock"""
+        return cache.get(self.key) is not None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from telegram_integration.models import AccountGroupAssociation
+from telegram_integration.client import TelegramClientManager
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Backfill the message history of monitored groups, resuming from the saved checkpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, help="Only backfill groups of this TelegramAccount id")
+        parser.add_argument('--group', type=int, help="Only backfill this TelegramGroup id")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Maximum number of messages to fetch per group in this run")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Number of messages written (and checkpointed) per chunk")
+        parser.add_argument('--reset', action='store_true',
+                            help="Discard saved checkpoints and start from the oldest message")
+        parser.add_argument('--include-completed', action='store_true',
+                            help="Also process groups whose backfill already completed")
+        parser.add_argument('--status', action='store_true',
+                            help="Only print the backfill checkpoints and exit")
+
+    def handle(self, *args, **options):
+        associations = AccountGroupAssociation.objects.filter(
+            is_active=True,
+            account__is_active=True,
+            group__is_active=True
+        ).select_related('account', 'group').order_by('account_id', 'group_id')
+
+        if options['account']:
+            associations = associations.filter(account_id=options['account'])
+        if options['group']:
+            associations = associations.filter(group_id=options['group'])
+        if not options['include_completed'] and not options['reset']:
+            associations = associations.filter(backfill_completed_at__isnull=True)
+
+        associations = list(associations)
+        if not associations:
+            raise CommandError("No matching associations to backfill")
+
+        if options['status']:
+            for association in associations:
+                state = 'complete' if association.backfill_completed_at else 'pending'
+                self.stdout.write(
+                    f"{association.account.phone_number} - {association.group.name}: "
+                    f"{state}, checkpoint {association.backfill_offset_id or 0}"
+                )
+            return
+
+        by_account = {}
+        for association in associations:
+            by_account.setdefault(association.account_id, []).append(association)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        total = 0
+
+        try:
+            for account_associations in by_account.values():
+                total += loop.run_until_complete(self.backfill_account(account_associations, options))
+        finally:
+            loop.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill finished. Stored {total} new messages"))
+
+    async def backfill_account(self, associations, options):
+        """Backfill every association of one account over a single connection"""
+        account = associations[0].account
+        client_manager = TelegramClientManager(account)
+        total = 0
+
+        try:
+            client = await client_manager.create_client()
+            if not await client.is_user_authorized():
+                self.stderr.write(f"Account {account.phone_number} not authenticated, skipping")
+                return 0
+
+            for association in associations:
+                self.stdout.write(f"Backfilling {association.group.name} with {account.phone_number}")
+                count = await client_manager.backfill_messages(
+                    association.group,
+                    association=association,
+                    limit=options['limit'],
+                    chunk_size=options['chunk_size'],
+                    reset=options['reset']
+                )
+                total += count
+                self.stdout.write(
+                    f"  stored {count} messages, checkpoint {association.backfill_offset_id or 0}"
+                    + (" (complete)" if association.backfill_completed_at else "")
+                )
+        except Exception as e:
+            logger.error(f"Backfill failed for account {account.phone_number}: {str(e)}")
+            self.stderr.write(f"Backfill failed for account {account.phone_number}: {str(e)}")
+        finally:
+            await client_manager.disconnect()
+
+        return total
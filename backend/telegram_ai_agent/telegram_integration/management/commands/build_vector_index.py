@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from telegram_integration.models import TelegramGroup
+from telegram_integration.semantic import build_group_index
+
+class Command(BaseCommand):
+    help = "Build the semantic indexes of the related messages search from the stored messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help="Only build the index of this TelegramGroup id")
+
+    def handle(self, *args, **options):
+        groups = TelegramGroup.objects.filter(is_active=True)
+        if options['group']:
+            groups = TelegramGroup.objects.filter(pk=options['group'])
+
+        for group in groups:
+            count = build_group_index(group)
+            self.stdout.write(f"{group.name}: {count} messages indexed")
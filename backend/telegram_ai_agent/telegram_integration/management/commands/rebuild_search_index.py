@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from telegram_integration.search import INDEXES
+
+class Command(BaseCommand):
+    help = "Recreate the full-text indexes of messages and summaries and reindex every row"
+
+    def handle(self, *args, **options):
+        with connection.schema_editor() as schema_editor:
+            for index in INDEXES:
+                index.install(schema_editor)
+                self.stdout.write(f"Rebuilt the search index of {index.table}")
@@ -0,0 +1,31 @@
+import asyncio
+import signal
+from django.core.management.base import BaseCommand
+from telegram_integration.collector import CollectorDaemon
+
+class Command(BaseCommand):
+    help = "Run the long-lived message collector, keeping one connected client per account"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=None,
+                            help="Seconds between the start of two collection cycles")
+        parser.add_argument('--once', action='store_true',
+                            help="Run a single collection cycle and exit")
+        parser.add_argument('--listen', action='store_true',
+                            help="Ingest messages in real time and only poll to resync")
+
+    def handle(self, *args, **options):
+        daemon = CollectorDaemon(interval=options['interval'], listen=options['listen'])
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, daemon.stop)
+
+        mode = "listening, resyncing" if daemon.listen else "running"
+        self.stdout.write(f"Collector started, {mode} every {daemon.interval} seconds")
+        try:
+            loop.run_until_complete(daemon.run(once=options['once']))
+        finally:
+            loop.close()
+        self.stdout.write(self.style.SUCCESS("Collector stopped"))
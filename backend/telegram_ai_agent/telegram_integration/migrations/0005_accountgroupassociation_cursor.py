@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0004_telegrammessage_message_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='last_message_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0005_accountgroupassociation_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='backfill_completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='backfill_offset_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_existing_senders(apps, schema_editor):
+    TelegramMessage = apps.get_model('telegram_integration', 'TelegramMessage')
+    TelegramSender = apps.get_model('telegram_integration', 'TelegramSender')
+
+    latest = {}
+    for sender_id, sender_name, sender_username in TelegramMessage.objects.filter(
+        sender_id__isnull=False
+    ).order_by('date').values_list('sender_id', 'sender_name', 'sender_username').iterator():
+        latest[sender_id] = (sender_name, sender_username)
+
+    TelegramSender.objects.bulk_create([
+        TelegramSender(user_id=sender_id, first_name=name, username=username)
+        for sender_id, (name, username) in latest.items()
+    ], batch_size=500)
+
+    for sender in TelegramSender.objects.iterator():
+        TelegramMessage.objects.filter(sender_id=sender.user_id).update(sender_profile=sender)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0006_accountgroupassociation_backfill_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramSender',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(unique=True)),
+                ('first_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('username', models.CharField(blank=True, max_length=255, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='telegrammessage',
+            name='sender_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='telegram_integration.telegramsender'),
+        ),
+        migrations.RunPython(link_existing_senders, migrations.RunPython.noop),
+    ]
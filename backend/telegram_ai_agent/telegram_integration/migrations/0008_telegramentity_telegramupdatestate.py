@@ -0,0 +1,46 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0007_telegramsender'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramUpdateState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_id', models.BigIntegerField()),
+                ('pts', models.IntegerField()),
+                ('qts', models.IntegerField(default=0)),
+                ('date', models.DateTimeField()),
+                ('seq', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='update_states', to='telegram_integration.telegramaccount')),
+            ],
+            options={
+                'unique_together': {('account', 'entity_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TelegramEntity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peer_id', models.BigIntegerField()),
+                ('access_hash', models.BigIntegerField()),
+                ('username', models.CharField(blank=True, max_length=255, null=True)),
+                ('phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('name', models.CharField(blank=True, max_length=255, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entities', to='telegram_integration.telegramaccount')),
+            ],
+            options={
+                'unique_together': {('account', 'peer_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0008_telegramentity_telegramupdatestate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegrammessage',
+            name='edited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='telegrammessage',
+            name='is_deleted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0009_telegrammessage_edits_deletions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='accountgroupassociation',
+            name='last_error_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0010_accountgroupassociation_health'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupPollSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_rate', models.FloatField(default=0)),
+                ('interval', models.PositiveIntegerField(help_text='Seconds between two polls')),
+                ('next_poll_at', models.DateTimeField(db_index=True)),
+                ('last_polled_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='poll_schedule', to='telegram_integration.telegramgroup')),
+            ],
+        ),
+    ]
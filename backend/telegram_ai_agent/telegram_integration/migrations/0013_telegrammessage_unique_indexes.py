@@ -0,0 +1,45 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:35
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_messages(apps, schema_editor):
+    TelegramMessage = apps.get_model('telegram_integration', 'TelegramMessage')
+
+    # Keep the first stored copy of every (group, message_id)
+    duplicates = TelegramMessage.objects.values('group_id', 'message_id').annotate(
+        first_id=Min('id'), copies=Count('id')
+    ).filter(copies__gt=1)
+    for duplicate in duplicates.iterator():
+        TelegramMessage.objects.filter(
+            group_id=duplicate['group_id'],
+            message_id=duplicate['message_id']
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0012_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_messages, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='telegrammessage',
+            index=models.Index(fields=['group', 'date'], name='message_group_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='telegrammessage',
+            index=models.Index(fields=['-date'], name='message_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='telegrammessage',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_processed', False)), fields=['group', 'date'], name='message_unprocessed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='telegrammessage',
+            constraint=models.UniqueConstraint(fields=('group', 'message_id'), name='unique_group_message'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Full-text index over the text and sender name of the messages.
+# The statements are frozen here rather than generated by
+# telegram_integration.search, so later changes to that module do not change
+# what this migration does.
+INSTALL = {
+    # Stored generated tsvector column with a GIN index
+    'postgresql': [
+        "ALTER TABLE telegram_integration_telegrammessage ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(text, '')), 'A') || setweight(to_tsvector('simple', coalesce(sender_name, '')), 'B')) STORED",
+        'CREATE INDEX IF NOT EXISTS telegram_integration_telegrammessage_search_idx ON telegram_integration_telegrammessage USING GIN (search_vector)',
+    ],
+    # External-content FTS5 table kept in sync by triggers
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS telegram_integration_telegrammessage_fts_insert',
+        'DROP TRIGGER IF EXISTS telegram_integration_telegrammessage_fts_delete',
+        'DROP TRIGGER IF EXISTS telegram_integration_telegrammessage_fts_update',
+        'DROP TABLE IF EXISTS telegram_integration_telegrammessage_fts',
+        "CREATE VIRTUAL TABLE telegram_integration_telegrammessage_fts USING fts5(text, sender_name, content='telegram_integration_telegrammessage', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO telegram_integration_telegrammessage_fts(telegram_integration_telegrammessage_fts) VALUES ('rebuild')",
+        'CREATE TRIGGER telegram_integration_telegrammessage_fts_insert AFTER INSERT ON telegram_integration_telegrammessage BEGIN INSERT INTO telegram_integration_telegrammessage_fts(rowid, text, sender_name) VALUES (new.id, new.text, new.sender_name); END',
+        "CREATE TRIGGER telegram_integration_telegrammessage_fts_delete AFTER DELETE ON telegram_integration_telegrammessage BEGIN INSERT INTO telegram_integration_telegrammessage_fts(telegram_integration_telegrammessage_fts, rowid, text, sender_name) VALUES ('delete', old.id, old.text, old.sender_name); END",
+        "CREATE TRIGGER telegram_integration_telegrammessage_fts_update AFTER UPDATE OF text, sender_name ON telegram_integration_telegrammessage BEGIN INSERT INTO telegram_integration_telegrammessage_fts(telegram_integration_telegrammessage_fts, rowid, text, sender_name) VALUES ('delete', old.id, old.text, old.sender_name); INSERT INTO telegram_integration_telegrammessage_fts(rowid, text, sender_name) VALUES (new.id, new.text, new.sender_name); END",
+    ],
+}
+
+UNINSTALL = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS telegram_integration_telegrammessage_search_idx',
+        'ALTER TABLE telegram_integration_telegrammessage DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS telegram_integration_telegrammessage_fts_insert',
+        'DROP TRIGGER IF EXISTS telegram_integration_telegrammessage_fts_delete',
+        'DROP TRIGGER IF EXISTS telegram_integration_telegrammessage_fts_update',
+        'DROP TABLE IF EXISTS telegram_integration_telegrammessage_fts',
+    ],
+}
+
+
+def install(apps, schema_editor):
+    # Other backends have no index, search scans the table
+    for statement in INSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def uninstall(apps, schema_editor):
+    for statement in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_integration', '0013_telegrammessage_unique_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
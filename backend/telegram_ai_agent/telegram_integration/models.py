@@ -16,6 +16,38 @@ class TelegramAccount(models.Model):
     def __str__(self):
         return f"{self.phone_number} ({self.user.username})"
 
+class TelegramEntity(models.Model):
+    """Model to persist the Telethon entity cache (peers and access hashes) of an account"""
+    account = models.ForeignKey(TelegramAccount, on_delete=models.CASCADE, related_name='entities')
+    peer_id = models.BigIntegerField()  # Marked id as used by Telethon (-100... for channels)
+    access_hash = models.BigIntegerField()
+    username = models.CharField(max_length=255, null=True, blank=True)
+    phone = models.CharField(max_length=20, null=True, blank=True)
+    name = models.CharField(max_length=255, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('account', 'peer_id')
+
+    def __str__(self):
+        return f"{self.name or self.peer_id} ({self.account.phone_number})"
+
+class TelegramUpdateState(models.Model):
+    """Model to persist the Telethon update state of an account (entity 0) and its channels"""
+    account = models.ForeignKey(TelegramAccount, on_delete=models.CASCADE, related_name='update_states')
+    entity_id = models.BigIntegerField()
+    pts = models.IntegerField()
+    qts = models.IntegerField(default=0)
+    date = models.DateTimeField()
+    seq = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('account', 'entity_id')
+
+    def __str__(self):
+        return f"Update state {self.entity_id} ({self.account.phone_number}): pts {self.pts}"
+
 class TelegramGroup(models.Model):
     """Model to store information about Telegram groups being monitored"""
     name = models.CharField(max_length=255)
@@ -28,6 +60,22 @@ class TelegramGroup(models.Model):
     def __str__(self):
         return self.name
 
+class TelegramSender(models.Model):
+    """Model to store the Telegram users and channels that sent collected messages"""
+    user_id = models.BigIntegerField(unique=True)
+    first_name = models.CharField(max_length=255, null=True, blank=True)
+    last_name = models.CharField(max_length=255, null=True, blank=True)
+    username = models.CharField(max_length=255, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def display_name(self):
+        name = f"{self.first_name or ''} {self.last_name or ''}".strip()
+        return name or self.username or f"User{self.user_id}"
+
+    def __str__(self):
+        return self.display_name
+
 class TelegramMessage(models.Model):
     """Model to store messages collected from Telegram groups"""
     MESSAGE_TYPES = [
@@ -40,18 +88,51 @@ class TelegramMessage(models.Model):
     
     group = models.ForeignKey(TelegramGroup, on_delete=models.CASCADE, related_name='messages')
     message_id = models.BigIntegerField()
+    sender_profile = models.ForeignKey(TelegramSender, on_delete=models.SET_NULL, null=True, blank=True, related_name='messages')
     sender_id = models.BigIntegerField(null=True, blank=True)
     sender_name = models.CharField(max_length=255, null=True, blank=True)
     sender_username = models.CharField(max_length=255, null=True, blank=True)
     text = models.TextField()
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='TEXT')
     date = models.DateTimeField()
+    edited_at = models.DateTimeField(null=True, blank=True)
+    is_deleted = models.BooleanField(default=False)
     is_processed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'message_id'], name='unique_group_message'),
+        ]
+        indexes = [
+            # Date windows of a group (summaries, polling rate, group filter)
+            models.Index(fields=['group', 'date'], name='message_group_date_idx'),
+            # Newest first across the groups of a user
+            models.Index(fields=['-date'], name='message_date_idx'),
+            # Messages still waiting for the weekly summaries
+            models.Index(
+                fields=['group', 'date'],
+                name='message_unprocessed_idx',
+                condition=models.Q(is_processed=False, is_deleted=False)
+            ),
+        ]
+
     def __str__(self):
         return f"Message {self.message_id} from {self.sender_name}"
 
+class GroupPollSchedule(models.Model):
+    """Adaptive polling schedule of a group, learned from its message rate"""
+    group = models.OneToOneField(TelegramGroup, on_delete=models.CASCADE, related_name='poll_schedule')
+    # Smoothed arrival rate in messages per hour
+    message_rate = models.FloatField(default=0)
+    interval = models.PositiveIntegerField(help_text="Seconds between two polls")
+    next_poll_at = models.DateTimeField(db_index=True)
+    last_polled_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.group.name} every {self.interval}s"
+
 class AccountGroupAssociation(models.Model):
     """Model to track which accounts are monitoring which groups"""
     account = models.ForeignKey(TelegramAccount, on_delete=models.CASCADE, related_name='group_associations')
@@ -59,9 +140,60 @@ class AccountGroupAssociation(models.Model):
     is_active = models.BooleanField(default=True)
     joined_at = models.DateTimeField(auto_now_add=True)
     last_collection = models.DateTimeField(null=True, blank=True)
+    # High-water mark of the messages collected through this association
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_message_date = models.DateTimeField(null=True, blank=True)
+    # Resumable checkpoint of the historical backfill (oldest-first)
+    backfill_offset_id = models.BigIntegerField(null=True, blank=True)
+    backfill_completed_at = models.DateTimeField(null=True, blank=True)
+    # Health of collection through this association, used to elect the
+    # account that collects a group watched by several accounts
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    last_error_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('account', 'group')
 
     def __str__(self):
         return f"{self.account.phone_number} - {self.group.name}"
+
+class Job(models.Model):
+    """Model to track a long-running operation run in the background for a user"""
+    KINDS = [
+        ('sync_messages', 'Sync Messages'),
+        ('sync_groups', 'Sync Groups'),
+        ('generate_summary', 'Generate Summary'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=32, choices=KINDS)
+    status = models.CharField(max_length=16, choices=STATUSES, default='pending')
+    params = models.JSONField(default=dict, blank=True)
+    # Progress reported by the running task
+    phase = models.CharField(max_length=64, blank=True, default='')
+    processed = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    task_id = models.CharField(max_length=255, null=True, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed', 'cancelled')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
@@ -0,0 +1,21 @@
+"""
+Pagination of the message API
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+class MessageCursorPagination(CursorPagination):
+    """
+    Newest-first keyset pagination of messages.
+
+    The opaque cursor holds the date of the last message of the page, so
+    the next page is an index seek on `date` rather than an OFFSET that
+    reads and discards every earlier row: deep pages cost the same as the
+    first one. Messages sharing a date are ordered by id, and only those
+    are skipped by offset. Clients pick a page size up to
+    TELEGRAM_MESSAGES_MAX_PAGE_SIZE with `page_size`.
+    """
+    ordering = ('-date', '-id')
+    page_size = getattr(settings, 'TELEGRAM_MESSAGES_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'TELEGRAM_MESSAGES_MAX_PAGE_SIZE', 200)
@@ -0,0 +1,105 @@
+"""
+Activity-adaptive polling schedule per group
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import GroupPollSchedule, TelegramMessage
+
+logger = logging.getLogger(__name__)
+
+# Window of stored messages used to estimate the rate of a new schedule
+HISTORY_WINDOW = timedelta(hours=24)
+
+def poll_interval(message_rate):
+    """
+    Seconds until the next poll of a group receiving `message_rate`
+    messages per hour: long enough to pick up about
+    TELEGRAM_POLL_TARGET_MESSAGES messages, within the configured bounds.
+    """
+    minimum = getattr(settings, 'TELEGRAM_POLL_MIN_INTERVAL', 60)
+    maximum = getattr(settings, 'TELEGRAM_POLL_MAX_INTERVAL', 3600)
+    target = getattr(settings, 'TELEGRAM_POLL_TARGET_MESSAGES', 20)
+    if message_rate <= 0:
+        return maximum
+    return int(min(maximum, max(minimum, target / message_rate * 3600)))
+
+def historical_rate(group, now=None):
+    """Messages per hour the group received over the last day"""
+    now = now or timezone.now()
+    count = TelegramMessage.objects.filter(group=group, date__gte=now - HISTORY_WINDOW).count()
+    return count / (HISTORY_WINDOW.total_seconds() / 3600)
+
+def record_poll(group, new_messages, now=None):
+    """
+    Update the group's schedule after a successful collection.
+
+    The messages found since the previous poll give the current rate,
+    which is blended into the smoothed rate so that a single burst or lull
+    only moves the interval part of the way. A group seen for the first
+    time starts from its stored history.
+    """
+    now = now or timezone.now()
+    smoothing = getattr(settings, 'TELEGRAM_POLL_SMOOTHING', 0.5)
+
+    schedule = GroupPollSchedule.objects.filter(group=group).first()
+    previous_rate = schedule.message_rate if schedule else historical_rate(group, now)
+    previous_poll = schedule.last_polled_at if schedule else None
+    if previous_poll and now > previous_poll:
+        hours = (now - previous_poll).total_seconds() / 3600
+        message_rate = smoothing * (new_messages / hours) + (1 - smoothing) * previous_rate
+    else:
+        message_rate = previous_rate
+
+    interval = poll_interval(message_rate)
+    GroupPollSchedule.objects.update_or_create(
+        group=group,
+        defaults={
+            'message_rate': round(message_rate, 3),
+            'interval': interval,
+            'next_poll_at': now + timedelta(seconds=interval),
+            'last_polled_at': now,
+        }
+    )
+    return interval
+
+def due_filter(now=None):
+    """Q filter on associations whose group is due for a poll"""
+    now = now or timezone.now()
+    return Q(group__poll_schedule__isnull=True) | Q(group__poll_schedule__next_poll_at__lte=now)
+
+def claim_groups(groups, now=None):
+    """
+    Push the next poll of dispatched groups one interval ahead, so a poll
+    that is queued or still running is not dispatched again. The real next
+    poll time is set by `record_poll` once the collection is done. Groups
+    without a schedule get one, estimated from their stored history.
+    """
+    now = now or timezone.now()
+    schedules = {s.group_id: s for s in GroupPollSchedule.objects.filter(group__in=groups)}
+    for schedule in schedules.values():
+        schedule.next_poll_at = now + timedelta(seconds=schedule.interval)
+        schedule.updated_at = now
+    GroupPollSchedule.objects.bulk_update(schedules.values(), ['next_poll_at', 'updated_at'])
+
+    new_groups = [group for group in groups if group.pk not in schedules]
+    if not new_groups:
+        return
+    counts = dict(
+        TelegramMessage.objects.filter(group__in=new_groups, date__gte=now - HISTORY_WINDOW)
+        .order_by().values('group').annotate(count=Count('id')).values_list('group', 'count')
+    )
+    hours = HISTORY_WINDOW.total_seconds() / 3600
+    new_schedules = []
+    for group in new_groups:
+        message_rate = counts.get(group.pk, 0) / hours
+        interval = poll_interval(message_rate)
+        new_schedules.append(GroupPollSchedule(
+            group=group,
+            message_rate=round(message_rate, 3),
+            interval=interval,
+            next_poll_at=now + timedelta(seconds=interval)
+        ))
+    GroupPollSchedule.objects.bulk_create(new_schedules)
@@ -0,0 +1,86 @@
+"""
+Pool of connected Telegram clients, one per account
+"""
+import asyncio
+import logging
+from .client import TelegramClientManager
+
+logger = logging.getLogger(__name__)
+
+class ClientPool:
+    """
+    Keep one connected, authorized TelegramClientManager per account.
+
+    A pooled client is reused for every group of its account. It is replaced
+    when the account's credentials or session change, reconnected when the
+    connection dropped, and released when the account is no longer active.
+
+    `on_create` is called with every new manager before its client
+    connects, e.g. to register event handlers; `catch_up` is passed on to
+    the managers. Concurrent `get()` calls for one account wait for each
+    other, so only one client is ever connected per account.
+    """
+    def __init__(self, catch_up=False, on_create=None):
+        self.managers = {}
+        self._locks = {}
+        self.catch_up = catch_up
+        self.on_create = on_create
+
+    @staticmethod
+    def _fingerprint(account):
+        return (account.api_id, account.api_hash, account.session_string)
+
+    async def get(self, account):
+        """Return a connected manager for the account, or None if it is not authorized"""
+        async with self._locks.setdefault(account.pk, asyncio.Lock()):
+            return await self._get(account)
+
+    async def _get(self, account):
+        entry = self.managers.get(account.pk)
+        if entry and entry[1] != self._fingerprint(account):
+            logger.info(f"Account {account.phone_number} changed, replacing its client")
+            await self.release(account.pk)
+            entry = None
+
+        if entry:
+            manager = entry[0]
+            manager.account = account
+            if manager.client.is_connected():
+                return manager
+            try:
+                logger.info(f"Reconnecting client of {account.phone_number}")
+                await manager.client.connect()
+                return manager
+            except Exception as e:
+                logger.warning(f"Reconnect failed for {account.phone_number}: {str(e)}")
+                await self.release(account.pk)
+
+        manager = TelegramClientManager(account, catch_up=self.catch_up)
+        if self.on_create:
+            self.on_create(manager)
+        await manager.create_client()
+        if not await manager.client.is_user_authorized():
+            logger.warning(f"Account {account.phone_number} not authenticated, skipping")
+            await manager.disconnect()
+            return None
+
+        self.managers[account.pk] = (manager, self._fingerprint(account))
+        return manager
+
+    async def release(self, account_id):
+        """Disconnect and forget the client of an account"""
+        entry = self.managers.pop(account_id, None)
+        if entry:
+            try:
+                await entry[0].disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting client: {str(e)}")
+
+    async def retain(self, account_ids):
+        """Release every client whose account is not in `account_ids`"""
+        for account_id in set(self.managers) - set(account_ids):
+            await self.release(account_id)
+
+    async def close(self):
+        """Disconnect every pooled client"""
+        await self.retain(())
@@ -0,0 +1,318 @@
+"""
+Per-account request rate limiting shared across processes
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from django.conf import settings
+from telethon import TelegramClient, errors
+
+logger = logging.getLogger(__name__)
+
+# A message history request returns at most this many messages
+PAGE_SIZE = 100
+
+class MemoryBucketBackend:
+    """
+    Token buckets kept in this process.
+
+    Used when no Redis URL is configured (development, tests); limits are
+    then only shared between the clients of one process.
+    """
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, now):
+        # A new bucket is full; its capacity is only known to acquire(), so
+        # None stands for it, like a missing field in the Redis hash
+        return self._buckets.setdefault(key, {
+            'tokens': None,
+            'ts': now,
+            'blocked_until': 0,
+            'chunk': None,
+        })
+
+    async def acquire(self, key, rate, capacity, cost=1):
+        """Take `cost` tokens and return 0, or return the seconds to wait first"""
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            if bucket['blocked_until'] > now:
+                return bucket['blocked_until'] - now
+
+            if bucket['tokens'] is None:
+                bucket['tokens'] = capacity
+            else:
+                bucket['tokens'] = min(capacity, bucket['tokens'] + (now - bucket['ts']) * rate)
+            bucket['ts'] = now
+            if bucket['tokens'] >= cost:
+                bucket['tokens'] -= cost
+                return 0
+            return (cost - bucket['tokens']) / rate
+
+    async def penalize(self, key, seconds, min_chunk):
+        """Block the bucket for `seconds` and halve its chunk size"""
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            bucket['blocked_until'] = max(bucket['blocked_until'], now + seconds)
+            bucket['tokens'] = 0
+            if bucket['chunk'] is not None:
+                bucket['chunk'] = max(min_chunk, bucket['chunk'] // 2)
+            return bucket['chunk']
+
+    async def blocked_for(self, key):
+        """Seconds until a FloodWait penalty on the bucket is over"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return max(0, bucket['blocked_until'] - time.time()) if bucket else 0
+
+    async def get_chunk(self, key, default):
+        with self._lock:
+            bucket = self._bucket(key, time.time())
+            if bucket['chunk'] is None:
+                bucket['chunk'] = default
+            return bucket['chunk']
+
+    async def grow_chunk(self, key, step, maximum):
+        with self._lock:
+            bucket = self._bucket(key, time.time())
+            bucket['chunk'] = min(maximum, (bucket['chunk'] or maximum) + step)
+            return bucket['chunk']
+
+class RedisBucketBackend:
+    """
+    Token buckets stored in Redis, so every worker, API process and the
+    collector draw from the same per-account budget.
+
+    Each bucket is a hash updated atomically by a Lua script using the Redis
+    clock, so hosts with skewed clocks still agree on refills and penalties.
+    """
+    ACQUIRE_SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'blocked_until')
+    local blocked = tonumber(state[3]) or 0
+    if blocked > now then
+        return tostring(blocked - now)
+    end
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return tostring(wait)
+    """
+
+    PENALIZE_SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+    blocked = math.max(blocked, now + tonumber(ARGV[1]))
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(blocked), 'tokens', '0', 'ts', tostring(now))
+    local chunk = tonumber(redis.call('HGET', KEYS[1], 'chunk'))
+    if chunk then
+        chunk = math.max(tonumber(ARGV[2]), math.floor(chunk / 2))
+        redis.call('HSET', KEYS[1], 'chunk', chunk)
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return chunk
+    """
+
+    GROW_SCRIPT = """
+    local chunk = tonumber(redis.call('HGET', KEYS[1], 'chunk')) or tonumber(ARGV[2])
+    chunk = math.min(tonumber(ARGV[2]), chunk + tonumber(ARGV[1]))
+    redis.call('HSET', KEYS[1], 'chunk', chunk)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return chunk
+    """
+
+    # Idle buckets disappear after a day
+    TTL = 86400
+
+    def __init__(self, url):
+        self.url = url
+        # redis.asyncio connections are bound to the loop that opened them,
+        # and Celery tasks run each call on a fresh loop
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        import redis.asyncio as redis
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = redis.Redis.from_url(self.url)
+            self._clients[loop] = client
+        return client
+
+    async def acquire(self, key, rate, capacity, cost=1):
+        try:
+            wait = await self._client().eval(
+                self.ACQUIRE_SCRIPT, 1, key, rate, capacity, cost, self.TTL
+            )
+            return float(wait)
+        except Exception as e:
+            # Better to risk a FloodWait than to stop collecting altogether
+            logger.error(f"Rate limiter unavailable, not throttling {key}: {str(e)}")
+            return 0
+
+    async def penalize(self, key, seconds, min_chunk):
+        try:
+            chunk = await self._client().eval(self.PENALIZE_SCRIPT, 1, key, seconds, min_chunk, self.TTL)
+            return int(chunk) if chunk is not None else None
+        except Exception as e:
+            logger.error(f"Could not record FloodWait penalty for {key}: {str(e)}")
+            return None
+
+    async def blocked_for(self, key):
+        try:
+            blocked_until = await self._client().hget(key, 'blocked_until')
+            return max(0, float(blocked_until) - time.time()) if blocked_until else 0
+        except Exception as e:
+            logger.error(f"Could not read FloodWait state of {key}: {str(e)}")
+            return 0
+
+    async def get_chunk(self, key, default):
+        try:
+            client = self._client()
+            chunk = await client.hget(key, 'chunk')
+            if chunk is None:
+                await client.hsetnx(key, 'chunk', default)
+                await client.expire(key, self.TTL)
+                return default
+            return int(chunk)
+        except Exception as e:
+            logger.error(f"Could not read chunk size for {key}: {str(e)}")
+            return default
+
+    async def grow_chunk(self, key, step, maximum):
+        try:
+            return int(await self._client().eval(self.GROW_SCRIPT, 1, key, step, maximum, self.TTL))
+        except Exception as e:
+            logger.error(f"Could not update chunk size for {key}: {str(e)}")
+            return maximum
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the process-wide bucket backend configured in settings"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            url = getattr(settings, 'TELEGRAM_RATE_LIMIT_REDIS_URL', None)
+            _backend = RedisBucketBackend(url) if url else MemoryBucketBackend()
+        return _backend
+
+class AccountRateLimiter:
+    """
+    Token bucket for the requests of one Telegram account.
+
+    Every request takes a token; tokens refill at `rate` per second up to
+    `burst`. A FloodWait reported by Telegram blocks the bucket for the
+    requested time, so every process using the account waits it out
+    instead of running into the same error.
+
+    The limiter also keeps the account's chunk size, the number of messages
+    requested at a time by a collection pass. It is halved on every FloodWait (down to
+    one page) and grows by one page after each pass that completed without
+    one, so busy accounts settle on what Telegram lets them fetch.
+    """
+    def __init__(self, account_id, backend=None, rate=None, burst=None, max_wait=None,
+                 max_chunk=None, min_chunk=PAGE_SIZE):
+        self.account_id = account_id
+        self.key = f'telegram:ratelimit:{account_id}'
+        self.backend = backend or get_backend()
+        self.rate = rate or getattr(settings, 'TELEGRAM_RATE_LIMIT_RATE', 1.0)
+        self.burst = burst or getattr(settings, 'TELEGRAM_RATE_LIMIT_BURST', 5)
+        self.max_wait = max_wait or getattr(settings, 'TELEGRAM_FLOOD_MAX_WAIT', 900)
+        self.max_chunk = max_chunk or getattr(settings, 'TELEGRAM_RATE_LIMIT_MAX_CHUNK', 1000)
+        self.min_chunk = min_chunk
+        self._penalized = False
+
+    async def acquire(self, cost=1):
+        """
+        Wait until the account may send a request.
+
+        Raises FloodWaitError when the account is blocked for longer than
+        `max_wait`, so callers fail fast instead of hanging for hours.
+        """
+        while True:
+            wait = await self.backend.acquire(self.key, self.rate, self.burst, cost)
+            if wait <= 0:
+                return
+            if wait > self.max_wait:
+                raise errors.FloodWaitError(request=None, capture=int(wait))
+            if wait >= 1:
+                logger.info(f"Account {self.account_id} throttled, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    async def penalize(self, seconds):
+        """Record a FloodWait of `seconds` for every user of the account"""
+        self._penalized = True
+        chunk = await self.backend.penalize(self.key, seconds, self.min_chunk)
+        logger.warning(
+            f"FloodWait of {seconds}s for account {self.account_id}"
+            + (f", chunk size lowered to {chunk}" if chunk else "")
+        )
+
+    async def blocked_for(self):
+        """Seconds the account still has to wait out a FloodWait"""
+        return await self.backend.blocked_for(self.key)
+
+    async def chunk_size(self):
+        """Return the number of messages to fetch in one pass"""
+        return await self.backend.get_chunk(self.key, self.max_chunk)
+
+    async def record_success(self):
+        """Grow the chunk size after a pass that did not hit a FloodWait"""
+        if self._penalized:
+            self._penalized = False
+            return
+        await self.backend.grow_chunk(self.key, PAGE_SIZE, self.max_chunk)
+
+def get_rate_limiter(account_id):
+    """Return a limiter for the account on the configured backend"""
+    return AccountRateLimiter(account_id)
+
+class RateLimitedTelegramClient(TelegramClient):
+    """
+    TelegramClient that takes a token from `limiter` before every request.
+
+    Telethon's own flood sleeping is disabled; a FloodWaitError is recorded
+    on the limiter, which makes this and every other client of the account
+    back off, and the request is retried once the wait is over.
+    """
+    flood_retries = 3
+
+    def __init__(self, *args, limiter=None, **kwargs):
+        kwargs['flood_sleep_threshold'] = 0
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        if self.limiter is None:
+            return await super()._call(sender, request, ordered=ordered,
+                                       flood_sleep_threshold=flood_sleep_threshold)
+
+        for attempt in range(self.flood_retries + 1):
+            await self.limiter.acquire()
+            try:
+                return await super()._call(sender, request, ordered=ordered, flood_sleep_threshold=0)
+            except errors.FloodWaitError as e:
+                await self.limiter.penalize(e.seconds)
+                if e.seconds > self.limiter.max_wait or attempt == self.flood_retries:
+                    raise
@@ -0,0 +1,264 @@
+"""
+Concurrent collection across accounts and groups
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .election import CollectorElection
+from .locks import CollectionLock
+from .models import AccountGroupAssociation
+from .polling import due_filter, record_poll
+from .pool import ClientPool
+
+logger = logging.getLogger(__name__)
+
+@sync_to_async
+def load_active_associations(account_ids=None, association_ids=None, due_only=False):
+    """
+    Return the active associations grouped by account, in a stable order;
+    with `due_only` only those whose group is due for a poll
+    """
+    associations = AccountGroupAssociation.objects.filter(
+        is_active=True,
+        account__is_active=True,
+        group__is_active=True
+    ).select_related('account', 'group').order_by('account_id', 'group_id')
+    if account_ids is not None:
+        associations = associations.filter(account_id__in=account_ids)
+    if association_ids is not None:
+        associations = associations.filter(pk__in=association_ids)
+    if due_only:
+        associations = associations.filter(due_filter())
+
+    by_account = {}
+    for association in associations:
+        by_account.setdefault(association.account_id, []).append(association)
+    return by_account
+
+@sync_to_async
+def mark_collected(association):
+    """Record a successful collection without touching the other fields"""
+    association.last_collection = timezone.now()
+    association.consecutive_failures = 0
+    AccountGroupAssociation.objects.filter(pk=association.pk).update(
+        last_collection=association.last_collection,
+        consecutive_failures=0
+    )
+
+@sync_to_async
+def mark_failed(association, error):
+    """Record a failed collection, which lowers the association in elections"""
+    association.consecutive_failures += 1
+    association.last_error = error
+    association.last_error_at = timezone.now()
+    AccountGroupAssociation.objects.filter(pk=association.pk).update(
+        consecutive_failures=association.consecutive_failures,
+        last_error=error,
+        last_error_at=association.last_error_at
+    )
+
+class CollectionScheduler:
+    """
+    Collect many associations concurrently and report on the run.
+
+    Accounts are processed in parallel, each over its own pooled client.
+    Within an account at most `per_account_concurrency` groups are collected
+    at the same time, and `max_concurrency` caps the group collections in
+    flight across all accounts. Every group collection is bounded by
+    `timeout`, so one slow or FloodWait-blocked group only holds up its own
+    slot instead of the whole cycle. A group that is already being collected
+    elsewhere (another worker, the API) holds a CollectionLock and is skipped.
+
+    A group watched by several accounts is collected once, by the account
+    a CollectorElection picks. When that collection fails or the account
+    is unavailable, the group is retried through the next standby account.
+    """
+    def __init__(self, pool=None, max_concurrency=None, per_account_concurrency=None, timeout=None):
+        self.pool = pool or ClientPool()
+        self.max_concurrency = max_concurrency or getattr(settings, 'TELEGRAM_COLLECTION_MAX_CONCURRENCY', 10)
+        self.per_account_concurrency = per_account_concurrency or getattr(
+            settings, 'TELEGRAM_COLLECTION_PER_ACCOUNT_CONCURRENCY', 2
+        )
+        self.timeout = timeout or getattr(settings, 'TELEGRAM_COLLECTION_TIMEOUT', 300)
+
+    async def run(self, by_account=None):
+        """
+        Collect every association in `by_account` (account id -> associations,
+        all active associations by default) and return the run report.
+        """
+        if by_account is None:
+            by_account = await load_active_associations()
+
+        started = time.monotonic()
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'finished_at': None,
+            'duration': None,
+            'total_messages': 0,
+            'groups': {'succeeded': 0, 'failed': 0, 'skipped': 0},
+            'standby': 0,
+            'failovers': 0,
+            'accounts': [],
+        }
+
+        election = CollectorElection(by_account)
+        plan = await election.elect()
+        report['standby'] = election.standby_count
+
+        global_limit = asyncio.Semaphore(self.max_concurrency)
+        while plan:
+            account_reports = await asyncio.gather(*[
+                self.collect_account(associations, global_limit)
+                for associations in plan.values()
+            ])
+
+            plan = {}
+            for account_report in account_reports:
+                report['accounts'].append(account_report)
+                report['total_messages'] += account_report['messages']
+                for group_report in account_report['groups']:
+                    report['groups'][group_report['status']] += 1
+                    if group_report['status'] == 'succeeded' or group_report.get('error') == 'locked':
+                        continue
+                    standby = election.failover(group_report['group_id'])
+                    if standby:
+                        plan.setdefault(standby.account_id, []).append(standby)
+                        report['failovers'] += 1
+
+        report['finished_at'] = timezone.now().isoformat()
+        report['duration'] = round(time.monotonic() - started, 3)
+        logger.info(
+            f"Collection run finished in {report['duration']}s: {report['total_messages']} new messages, "
+            f"{report['groups']['succeeded']} groups succeeded, {report['groups']['failed']} failed, "
+            f"{report['groups']['skipped']} skipped"
+        )
+        return report
+
+    async def collect_account(self, associations, global_limit):
+        """Collect the groups of one account with bounded concurrency"""
+        account = associations[0].account
+        account_report = {
+            'account_id': account.pk,
+            'phone_number': account.phone_number,
+            'status': 'ok',
+            'messages': 0,
+            'groups': [],
+        }
+
+        try:
+            manager = await self.pool.get(account)
+        except Exception as e:
+            logger.error(f"Could not connect account {account.phone_number}: {str(e)}")
+            manager = None
+            account_report['status'] = 'error'
+            account_report['error'] = str(e)
+        else:
+            if manager is None:
+                account_report['status'] = 'unauthorized'
+
+        if manager is None:
+            account_report['groups'] = []
+            for association in associations:
+                await mark_failed(association, f"account {account_report['status']}")
+                account_report['groups'].append(self._group_report(association, 'skipped'))
+            return account_report
+
+        account_limit = asyncio.Semaphore(self.per_account_concurrency)
+        account_report['groups'] = await asyncio.gather(*[
+            self.collect_group(manager, association, account_limit, global_limit)
+            for association in associations
+        ])
+        account_report['messages'] = sum(group['messages'] for group in account_report['groups'])
+
+        if manager.client.is_connected():
+            await manager.persist_session()
+        else:
+            await self.pool.release(account.pk)
+        return account_report
+
+    async def collect_group(self, manager, association, account_limit, global_limit):
+        """Collect one association once both concurrency slots are free"""
+        async with account_limit, global_limit:
+            lock = CollectionLock(association.group_id, timeout=self.timeout + 60)
+            if not await sync_to_async(lock.acquire)():
+                logger.info(f"{association.group.name} is already being collected, skipping")
+                return self._group_report(association, 'skipped', error='locked')
+            try:
+                return await self._collect_locked(manager, association)
+            finally:
+                await sync_to_async(lock.release)()
+
+    async def _collect_locked(self, manager, association):
+        started = time.monotonic()
+        try:
+            count = await asyncio.wait_for(
+                manager.collect_messages(association.group, association=association),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Collection of {association.group.name} timed out after {self.timeout}s")
+            await mark_failed(association, 'timeout')
+            return self._group_report(association, 'failed', started=started, error='timeout')
+        except Exception as e:
+            logger.error(f"Error collecting messages for association {association.id}: {str(e)}")
+            await mark_failed(association, str(e))
+            return self._group_report(association, 'failed', started=started, error=str(e))
+
+        await mark_collected(association)
+        try:
+            await sync_to_async(record_poll)(association.group, count)
+        except Exception as e:
+            logger.error(f"Error updating poll schedule of {association.group.name}: {str(e)}")
+        logger.info(
+            f"Collected {count} new messages from {association.group.name} "
+            f"using account {manager.account.phone_number}"
+        )
+        return self._group_report(association, 'succeeded', messages=count, started=started)
+
+    @staticmethod
+    def _group_report(association, status, messages=0, started=None, error=None):
+        group_report = {
+            'association_id': association.pk,
+            'group_id': association.group_id,
+            'group_name': association.group.name,
+            'status': status,
+            'messages': messages,
+            'duration': round(time.monotonic() - started, 3) if started is not None else 0,
+        }
+        if error:
+            group_report['error'] = error
+        return group_report
+
+def merge_reports(reports):
+    """Combine the reports of runs over disjoint accounts into one run summary"""
+    summary = {
+        'started_at': min((r['started_at'] for r in reports), default=None),
+        'finished_at': max((r['finished_at'] for r in reports), default=None),
+        'duration': 0,
+        'total_messages': sum(r['total_messages'] for r in reports),
+        'groups': {'succeeded': 0, 'failed': 0, 'skipped': 0},
+        'standby': sum(r.get('standby', 0) for r in reports),
+        'failovers': sum(r.get('failovers', 0) for r in reports),
+        'accounts': [],
+    }
+    if reports:
+        # Wall-clock time of the whole run, parts may have waited in the queue
+        span = datetime.fromisoformat(summary['finished_at']) - datetime.fromisoformat(summary['started_at'])
+        summary['duration'] = round(span.total_seconds(), 3)
+    for report in reports:
+        summary['accounts'].extend(report['accounts'])
+        for status, count in report['groups'].items():
+            summary['groups'][status] += count
+    return summary
+
+async def run_scheduled_collection(account_ids=None, association_ids=None):
+    """Collect the active associations (of `account_ids`) with a transient client pool"""
+    scheduler = CollectionScheduler()
+    try:
+        return await scheduler.run(await load_active_associations(account_ids, association_ids))
+    finally:
+        await scheduler.pool.close()
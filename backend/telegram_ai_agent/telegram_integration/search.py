@@ -0,0 +1,215 @@
+"""
+Full-text indexes over stored text, maintained by the database
+"""
+import html
+import logging
+import re
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+# The database marks matches with these private use characters, which are
+# swapped for the tags once the text is escaped
+_SENTINEL_START = '\ue000'
+_SENTINEL_STOP = '\ue001'
+
+def search_terms(query):
+    """Words of a user query; operators and punctuation are dropped"""
+    return re.findall(r'\w+', query or '')
+
+def highlight(snippet):
+    """HTML-escape a snippet marked with the sentinels and tag its matches"""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_SENTINEL_START, HIGHLIGHT_START).replace(_SENTINEL_STOP, HIGHLIGHT_STOP)
+
+class FullTextIndex:
+    """
+    Full-text index over text columns of one table.
+
+    The index lives in the database and is maintained by it on every
+    insert, update and delete, the bulk inserts of the ingest included, so
+    it stays current without a reindexing job:
+
+    - PostgreSQL: a stored generated `tsvector` column with a GIN index
+    - SQLite: an external-content FTS5 table kept in sync by triggers
+
+    Both use language-agnostic tokenization ('simple' configuration and
+    unicode61), as collected chats mix languages. The first column is the
+    one ranked highest and highlighted. Other backends have no index and
+    `search()` falls back to a substring scan.
+
+    SQLite drops the triggers whenever Django rebuilds the table for a
+    schema change. `restore_sqlite_triggers` reinstalls the index after
+    every migrate when that happened; manage.py rebuild_search_index does
+    the same by hand.
+    """
+    vector_column = 'search_vector'
+
+    def __init__(self, table, columns, config='simple'):
+        self.table = table
+        self.columns = columns
+        self.config = config
+        self.fts_table = f'{table}_fts'
+
+    @staticmethod
+    def supported(vendor=None):
+        return (vendor or connection.vendor) in ('postgresql', 'sqlite')
+
+    def install(self, schema_editor):
+        """Create the index and index the existing rows"""
+        vendor = schema_editor.connection.vendor
+        if not self.supported(vendor):
+            logger.warning(f"No full-text index for {self.table} on {vendor}, search scans the table")
+            return
+        for statement in getattr(self, f'_{vendor}_install')():
+            schema_editor.execute(statement)
+
+    def uninstall(self, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if not self.supported(vendor):
+            return
+        for statement in getattr(self, f'_{vendor}_uninstall')():
+            schema_editor.execute(statement)
+
+    def _postgresql_install(self):
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', coalesce({column}, '')), '{'A' if i == 0 else 'B'}')"
+            for i, column in enumerate(self.columns)
+        )
+        return [
+            f'ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS {self.vector_column} tsvector '
+            f'GENERATED ALWAYS AS ({vector}) STORED',
+            f'CREATE INDEX IF NOT EXISTS {self.table}_search_idx ON {self.table} USING GIN ({self.vector_column})',
+        ]
+
+    def _postgresql_uninstall(self):
+        return [
+            f'DROP INDEX IF EXISTS {self.table}_search_idx',
+            f'ALTER TABLE {self.table} DROP COLUMN IF EXISTS {self.vector_column}',
+        ]
+
+    def _sqlite_install(self):
+        columns = ', '.join(self.columns)
+        new = ', '.join(f'new.{column}' for column in self.columns)
+        old = ', '.join(f'old.{column}' for column in self.columns)
+        fts = self.fts_table
+        return self._sqlite_uninstall() + [
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{self.table}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+            f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {self.table} BEGIN '
+            f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END',
+            f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {self.table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); END",
+            f'CREATE TRIGGER {fts}_update AFTER UPDATE OF {columns} ON {self.table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+            f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END',
+        ]
+
+    def _sqlite_installed(self, cursor):
+        """Whether the FTS table and all its triggers exist"""
+        fts = self.fts_table
+        names = [fts, f'{fts}_insert', f'{fts}_delete', f'{fts}_update']
+        cursor.execute(
+            f"SELECT count(*) FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+        )
+        return cursor.fetchone()[0] == len(names)
+
+    def _sqlite_uninstall(self):
+        fts = self.fts_table
+        return [
+            f'DROP TRIGGER IF EXISTS {fts}_insert',
+            f'DROP TRIGGER IF EXISTS {fts}_delete',
+            f'DROP TRIGGER IF EXISTS {fts}_update',
+            f'DROP TABLE IF EXISTS {fts}',
+        ]
+
+    def search(self, query, queryset, limit=20):
+        """
+        Return (id, rank, snippet) of the best matches of `query` among the
+        rows of `queryset`, best first. Every word of the query must match.
+        The snippet is the matching part of the first column, HTML-escaped,
+        with the terms wrapped in <mark> tags.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+
+        try:
+            restrict, params = queryset.order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            # e.g. a user without groups
+            return []
+        vendor = connection.vendor
+        if vendor == 'postgresql':
+            sql, query_params = self._postgresql_search(terms)
+        elif vendor == 'sqlite':
+            sql, query_params = self._sqlite_search(terms)
+        else:
+            return self._scan(terms, queryset, limit)
+
+        sql = sql.format(restrict=restrict)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*query_params, *params, limit])
+            return [(row_id, float(rank), highlight(snippet)) for row_id, rank, snippet in cursor.fetchall()]
+
+    def _postgresql_search(self, terms):
+        options = (
+            f'StartSel={_SENTINEL_START}, StopSel={_SENTINEL_STOP}, '
+            f'MaxFragments=2, MaxWords=30, MinWords=10'
+        )
+        sql = (
+            f"SELECT t.id, ts_rank(t.{self.vector_column}, q), "
+            f"ts_headline('{self.config}', coalesce(t.{self.columns[0]}, ''), q, '{options}') "
+            f"FROM {self.table} t, plainto_tsquery('{self.config}', %s) q "
+            f"WHERE t.{self.vector_column} @@ q AND t.id IN ({{restrict}}) "
+            f"ORDER BY 2 DESC, t.id DESC LIMIT %s"
+        )
+        return sql, [' '.join(terms)]
+
+    def _sqlite_search(self, terms):
+        fts = self.fts_table
+        weights = ', '.join('2.0' if i == 0 else '1.0' for i in range(len(self.columns)))
+        sql = (
+            f"SELECT t.id, -bm25({fts}, {weights}), "
+            f"snippet({fts}, 0, '{_SENTINEL_START}', '{_SENTINEL_STOP}', '…', 24) "
+            f"FROM {fts} JOIN {self.table} t ON t.id = {fts}.rowid "
+            f"WHERE {fts} MATCH %s AND t.id IN ({{restrict}}) "
+            f"ORDER BY 2 DESC, t.id DESC LIMIT %s"
+        )
+        # Quoted terms are literal, whatever FTS5 operators they spell
+        return sql, [' '.join(f'"{term}"' for term in terms)]
+
+    def _scan(self, terms, queryset, limit):
+        column = self.columns[0]
+        for term in terms:
+            queryset = queryset.filter(**{f'{column}__icontains': term})
+        return [(pk, 0.0, highlight(text)) for pk, text in queryset.order_by('-pk').values_list('pk', column)[:limit]]
+
+# Text and sender of the collected messages
+MESSAGE_INDEX = FullTextIndex('telegram_integration_telegrammessage', ['text', 'sender_name'])
+# Content of the summaries of the ai_summarization app
+SUMMARY_INDEX = FullTextIndex('ai_summarization_summary', ['content'])
+
+INDEXES = [MESSAGE_INDEX, SUMMARY_INDEX]
+
+
+def restore_sqlite_triggers(using='default', **kwargs):
+    """
+    post_migrate handler reinstalling the SQLite indexes whose triggers a
+    table rebuild dropped, which also reindexes their rows
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        for index in INDEXES:
+            if index.table not in tables or index._sqlite_installed(cursor):
+                continue
+            logger.warning(f"Search triggers of {index.table} are missing, reinstalling the index")
+            for statement in index._sqlite_install():
+                cursor.execute(statement)
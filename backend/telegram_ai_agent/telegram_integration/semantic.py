@@ -0,0 +1,380 @@
+"""
+Local semantic search over the messages of each group
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Buckets of the hashed vocabulary (words and word pairs)
+N_FEATURES = 2 ** 14
+# Messages the TF-IDF weights and the SVD are fitted on
+FIT_SAMPLE = 2000
+# Locality-sensitive hashing: tables of random hyperplane signatures
+LSH_TABLES = 8
+LSH_BITS = 12
+# Segments appended by the ingest before they are merged into one
+MAX_SEGMENTS = 16
+
+def tokenize(text):
+    """Lowercase words and pairs of adjacent words"""
+    words = [word for word in re.findall(r'\w+', (text or '').lower()) if len(word) > 1]
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+def _hash(token):
+    # crc32 rather than hash(), which changes from one process to the next
+    h = zlib.crc32(token.encode())
+    return h & (N_FEATURES - 1), 1.0 if h & 0x80000000 else -1.0
+
+def hashed_counts(texts):
+    """
+    Sparse log term frequencies of the texts over the hashed vocabulary,
+    as COO arrays (rows, cols, values)
+    """
+    rows, cols, values = [], [], []
+    for row, text in enumerate(texts):
+        counts = {}
+        for token in tokenize(text):
+            bucket, sign = _hash(token)
+            counts[bucket] = counts.get(bucket, 0) + sign
+        for bucket, count in counts.items():
+            if count:
+                rows.append(row)
+                cols.append(bucket)
+                values.append(np.sign(count) * (1 + np.log(abs(count))))
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(values, dtype=np.float32)
+
+def _matmul(rows, cols, values, n_rows, matrix):
+    """(sparse n_rows x N_FEATURES) @ matrix"""
+    out = np.zeros((n_rows, matrix.shape[1]), dtype=np.float32)
+    np.add.at(out, rows, values[:, None] * matrix[cols])
+    return out
+
+def _rmatmul(rows, cols, values, matrix):
+    """(sparse n_rows x N_FEATURES).T @ matrix"""
+    out = np.zeros((N_FEATURES, matrix.shape[1]), dtype=np.float32)
+    np.add.at(out, cols, values[:, None] * matrix[rows])
+    return out
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+class MessageVectorizer:
+    """
+    Dense message embeddings computed on the CPU, without any model download.
+
+    Words and word pairs are hashed into N_FEATURES buckets, weighted by
+    TF-IDF and projected on the top singular vectors of a sample of the
+    group's messages (latent semantic analysis), so messages using related
+    vocabulary end up close even when they share few exact words. The SVD
+    is randomized and only ever touches the sparse term matrix.
+    """
+    def __init__(self, idf, components):
+        self.idf = idf
+        self.components = components
+
+    @property
+    def dimensions(self):
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, texts, dimensions, seed=0):
+        rows, cols, values = hashed_counts(texts)
+        n_rows = len(texts)
+        df = np.bincount(cols, minlength=N_FEATURES)
+        idf = (np.log((1 + n_rows) / (1 + df)) + 1).astype(np.float32)
+        rows, cols, values = cls._weigh(rows, cols, values, idf, n_rows)
+
+        rng = np.random.default_rng(seed)
+        rank = min(dimensions + 10, max(n_rows, 1))
+        basis = _matmul(rows, cols, values, n_rows, rng.standard_normal((N_FEATURES, rank)).astype(np.float32))
+        for _ in range(2):
+            basis, _ = np.linalg.qr(basis)
+            basis = _matmul(rows, cols, values, n_rows, _rmatmul(rows, cols, values, basis))
+        basis, _ = np.linalg.qr(basis)
+        _, _, vt = np.linalg.svd(_rmatmul(rows, cols, values, basis).T, full_matrices=False)
+
+        components = np.zeros((N_FEATURES, dimensions), dtype=np.float32)
+        kept = min(dimensions, vt.shape[0])
+        components[:, :kept] = vt[:kept].T
+        return cls(idf, components)
+
+    @staticmethod
+    def _weigh(rows, cols, values, idf, n_rows):
+        values = values * idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=n_rows)).astype(np.float32)
+        return rows, cols, values / np.where(norms > 0, norms, 1)[rows]
+
+    def transform(self, texts):
+        """Unit vectors of the texts (zero for texts without words)"""
+        rows, cols, values = self._weigh(*hashed_counts(texts), self.idf, len(texts))
+        return _normalize(_matmul(rows, cols, values, len(texts), self.components))
+
+def lsh_signatures(vectors, planes):
+    """One LSH_BITS-bit signature per table and vector"""
+    bits = (vectors @ planes > 0).reshape(len(vectors), LSH_TABLES, LSH_BITS)
+    return (bits * (1 << np.arange(LSH_BITS))).sum(axis=2).astype(np.uint16)
+
+_loaded = OrderedDict()
+_models = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def _cache_put(entries, key, value):
+    with _loaded_lock:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > getattr(settings, 'TELEGRAM_VECTOR_INDEX_CACHE_SIZE', 8):
+            entries.popitem(last=False)
+
+class GroupVectorIndex:
+    """
+    On-disk approximate nearest neighbour index of the messages of a group.
+
+    The directory of the group holds the current version of the index: a
+    model (the vectorizer and the LSH hyperplanes) and segments of message
+    ids, unit vectors and LSH signatures. The ingest appends a segment per
+    batch of new messages and merges the segments once there are too many.
+    A rebuild fits a new model on the stored messages and writes a new
+    version next to the current one, then switches to it.
+
+    Segment file names carry their number of messages, so the ingest checks
+    whether a rebuild is due from a directory listing and the cached model,
+    without reading the vectors back.
+
+    A query hashes its vector into each LSH table, scores the messages
+    sharing a bucket in any table by cosine similarity and returns the best.
+    Small indexes, or queries finding too few candidates, are scored in full.
+    """
+    def __init__(self, group_id, root=None):
+        self.group_id = group_id
+        self.root = Path(root or settings.TELEGRAM_VECTOR_INDEX_DIR) / f'group_{group_id}'
+
+    @property
+    def version_dir(self):
+        try:
+            return self.root / (self.root / 'CURRENT').read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    @property
+    def exists(self):
+        return self.version_dir is not None
+
+    def load_model(self, version_dir=None):
+        """Return (vectorizer, planes, fitted_count) of the current version, cached per process"""
+        version_dir = version_dir or self.version_dir
+        if version_dir is None:
+            return None
+        key = str(version_dir)
+        with _loaded_lock:
+            if key in _models:
+                _models.move_to_end(key)
+                return _models[key]
+
+        with np.load(version_dir / 'model.npz') as model:
+            loaded = (MessageVectorizer(model['idf'], model['components']), model['planes'], int(model['fitted_count']))
+        _cache_put(_models, key, loaded)
+        return loaded
+
+    def load(self):
+        """Return (vectorizer, planes, fitted_count, ids, vectors, signatures), cached per process"""
+        version_dir = self.version_dir
+        if version_dir is None:
+            return None
+        segments = sorted(version_dir.glob('segment_*.npz'))
+        key = (str(version_dir), tuple(segment.name for segment in segments))
+        with _loaded_lock:
+            if str(self.root) in _loaded and _loaded[str(self.root)][0] == key:
+                _loaded.move_to_end(str(self.root))
+                return _loaded[str(self.root)][1]
+
+        vectorizer, planes, fitted_count = self.load_model(version_dir)
+        ids, vectors, signatures = [], [], []
+        for segment in segments:
+            with np.load(segment) as data:
+                ids.append(data['ids'])
+                vectors.append(data['vectors'])
+                signatures.append(data['signatures'])
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, vectorizer.dimensions), dtype=np.float32)
+        signatures = np.concatenate(signatures) if signatures else np.zeros((0, LSH_TABLES), dtype=np.uint16)
+        # A merge racing a read may show a message twice
+        ids, first = np.unique(ids, return_index=True)
+        loaded = (vectorizer, planes, fitted_count, ids, vectors[first], signatures[first])
+        _cache_put(_loaded, str(self.root), (key, loaded))
+        return loaded
+
+    def indexed_count(self):
+        """Number of messages in the segments of the current version"""
+        version_dir = self.version_dir
+        if version_dir is None:
+            return 0
+        count = 0
+        for segment in version_dir.glob('segment_*.npz'):
+            match = re.search(r'_n(\d+)$', segment.stem)
+            if match is None:
+                # Written before segments carried their size
+                return len(self.load()[3])
+            count += int(match.group(1))
+        return count
+
+    def build(self, messages, dimensions=None):
+        """
+        Fit a new model on `messages`, a list of (id, text), embed them all
+        and make it the current version
+        """
+        dimensions = dimensions or getattr(settings, 'TELEGRAM_VECTOR_DIMENSIONS', 64)
+        stride = max(1, len(messages) // FIT_SAMPLE)
+        vectorizer = MessageVectorizer.fit([text for _, text in messages[::stride]], dimensions)
+        planes = np.random.default_rng(1).standard_normal((dimensions, LSH_TABLES * LSH_BITS)).astype(np.float32)
+
+        version = f'v{time.time_ns()}'
+        version_dir = self.root / version
+        version_dir.mkdir(parents=True)
+        np.savez(
+            version_dir / 'model.npz',
+            idf=vectorizer.idf, components=vectorizer.components,
+            planes=planes, fitted_count=len(messages)
+        )
+        self._write_segment(version_dir, vectorizer, planes, messages)
+
+        previous = self.version_dir
+        self._write_atomic(self.root / 'CURRENT', version)
+        if previous is not None and previous != version_dir:
+            shutil.rmtree(previous, ignore_errors=True)
+        logger.info(f"Built the semantic index of group {self.group_id} over {len(messages)} messages")
+
+    def add(self, messages):
+        """Embed `messages`, a list of (id, text), with the current model and append them"""
+        version_dir = self.version_dir
+        if version_dir is None or not messages:
+            return 0
+        vectorizer, planes, _ = self.load_model(version_dir)
+        self._write_segment(version_dir, vectorizer, planes, messages)
+        if len(list(version_dir.glob('segment_*.npz'))) > MAX_SEGMENTS:
+            self._merge(version_dir)
+        return len(messages)
+
+    def needs_rebuild(self):
+        """Whether the group doubled since its model was fitted"""
+        model = self.load_model()
+        return model is None or self.indexed_count() >= 2 * max(model[2], 1)
+
+    def query(self, text, k=10, exclude=()):
+        """Return [(message id, similarity)] of the k messages closest to `text`"""
+        loaded = self.load()
+        if loaded is None:
+            return []
+        vectorizer, planes, _, ids, vectors, signatures = loaded
+        vector = vectorizer.transform([text])[0]
+        if not vector.any() or not len(ids):
+            return []
+
+        candidates = np.flatnonzero((signatures == lsh_signatures(vector[None], planes)).any(axis=1))
+        if len(candidates) < 4 * k:
+            candidates = np.arange(len(ids))
+        if len(exclude):
+            candidates = candidates[~np.isin(ids[candidates], list(exclude))]
+        scores = vectors[candidates] @ vector
+        best = np.argsort(-scores)[:k]
+        return [(int(ids[candidates[i]]), float(scores[i])) for i in best if scores[i] > 0]
+
+    def _write_segment(self, version_dir, vectorizer, planes, messages):
+        vectors = vectorizer.transform([text for _, text in messages])
+        self._save_atomic(
+            version_dir / f'segment_{time.time_ns()}_{os.getpid()}_n{len(messages)}.npz',
+            ids=np.array([message_id for message_id, _ in messages], dtype=np.int64),
+            vectors=vectors,
+            signatures=lsh_signatures(vectors, planes)
+        )
+
+    def _merge(self, version_dir):
+        segments = sorted(version_dir.glob('segment_*.npz'))
+        arrays = {'ids': [], 'vectors': [], 'signatures': []}
+        for segment in segments:
+            with np.load(segment) as data:
+                for name in arrays:
+                    arrays[name].append(data[name])
+        # Named after the newest merged segment, so it sorts before the ones
+        # appended meanwhile
+        arrays = {name: np.concatenate(parts) for name, parts in arrays.items()}
+        self._save_atomic(
+            version_dir / f'segment_{segments[-1].stem.split("_")[1]}_merged_{time.time_ns()}_n{len(arrays["ids"])}.npz',
+            **arrays
+        )
+        for segment in segments:
+            segment.unlink(missing_ok=True)
+
+    @staticmethod
+    def _save_atomic(path, **arrays):
+        temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def _write_atomic(path, content):
+        temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        temporary.write_text(content)
+        os.replace(temporary, path)
+
+def index_enabled():
+    return bool(getattr(settings, 'TELEGRAM_VECTOR_INDEX_DIR', None))
+
+def index_messages(group, messages):
+    """
+    Add newly stored messages of a group to its semantic index. A group
+    without an index, or that doubled since its model was fitted, gets a
+    rebuild queued instead or on top.
+    """
+    if not index_enabled():
+        return
+    index = GroupVectorIndex(group.pk)
+    if index.exists:
+        index.add([(message.pk, message.text) for message in messages if message.pk and message.text])
+    if index.needs_rebuild():
+        schedule_rebuild(group.pk)
+
+def rebuild_key(group_id):
+    """Cache key held while a rebuild of the group's index is queued or running"""
+    return f'telegram:vector-rebuild:{group_id}'
+
+def schedule_rebuild(group_id):
+    """Queue a rebuild of the group's index unless one is already on its way"""
+    if not cache.add(rebuild_key(group_id), True, 600):
+        return
+
+    def enqueue():
+        from .tasks import rebuild_vector_index
+        try:
+            rebuild_vector_index.delay(group_id)
+        except Exception as e:
+            logger.error(f"Error queueing the semantic index rebuild of group {group_id}: {str(e)}")
+            cache.delete(rebuild_key(group_id))
+
+    transaction.on_commit(enqueue)
+
+def build_group_index(group):
+    """Fit and write the semantic index of a group from its stored messages"""
+    from .models import TelegramMessage
+    messages = TelegramMessage.objects.filter(group=group, is_deleted=False).exclude(text='')
+    pairs = list(messages.order_by('pk').values_list('pk', 'text').iterator(chunk_size=2000))
+    index = GroupVectorIndex(group.pk)
+    if not pairs:
+        return 0
+    index.build(pairs)
+    # Messages stored while the index was built
+    index.add(list(messages.filter(pk__gt=pairs[-1][0]).values_list('pk', 'text')))
+    return len(pairs)
@@ -0,0 +1,147 @@
+"""
+Per-account cache of message senders backed by the TelegramSender table
+"""
+import logging
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from telethon import utils
+from django.conf import settings
+from django.utils import timezone
+from .models import TelegramSender
+
+logger = logging.getLogger(__name__)
+
+class SenderCache:
+    """
+    Resolve Telegram user ids to TelegramSender rows with as few round-trips
+    as possible.
+
+    Lookups are served from an in-memory LRU with a TTL first, then from the
+    TelegramSender table, and only ids found in neither are fetched from
+    Telegram, all of them in one bulk request. Users that Telegram already
+    returned alongside a message batch are recorded with `observe` and
+    stored on the next `resolve`, so they never need a request of their own.
+    """
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or getattr(settings, 'TELEGRAM_SENDER_CACHE_SIZE', 5000)
+        self.ttl = ttl or getattr(settings, 'TELEGRAM_SENDER_CACHE_TTL', 3600)
+        self._entries = OrderedDict()
+        self._observed = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        """Return the cached sender for a user id, or None if missing or expired"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+
+        expires_at, sender = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+
+        self._entries.move_to_end(user_id)
+        return sender
+
+    def put(self, sender):
+        """Cache a TelegramSender row, evicting the least recently used ones"""
+        self._entries[sender.user_id] = (time.monotonic() + self.ttl, sender)
+        self._entries.move_to_end(sender.user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def observe(self, entity):
+        """Remember a user entity that came with a message batch"""
+        try:
+            self._observed[utils.get_peer_id(entity)] = entity
+        except TypeError:
+            pass
+
+    async def resolve(self, user_ids, client=None):
+        """
+        Return a dict mapping each resolvable user id to its TelegramSender.
+        Ids that cannot be resolved anywhere are left out.
+        """
+        resolved = {}
+        missing = set()
+
+        for user_id in set(user_ids):
+            sender = None if user_id in self._observed else self.get(user_id)
+            if sender is not None:
+                resolved[user_id] = sender
+            else:
+                missing.add(user_id)
+
+        if not missing:
+            return resolved
+
+        observed = [self._observed.pop(user_id) for user_id in missing if user_id in self._observed]
+        rows = await self._store_entities(observed) if observed else {}
+        rows.update(await self._load_rows(missing - set(rows)))
+
+        unknown = missing - set(rows)
+        if unknown and client is not None:
+            try:
+                entities = await client.get_entity(list(unknown))
+                rows.update(await self._store_entities(entities))
+            except Exception as e:
+                logger.warning(f"Could not resolve {len(unknown)} senders: {str(e)}")
+
+        for user_id, sender in rows.items():
+            self.put(sender)
+            resolved[user_id] = sender
+        return resolved
+
+    @sync_to_async
+    def _load_rows(self, user_ids):
+        if not user_ids:
+            return {}
+        return {
+            sender.user_id: sender
+            for sender in TelegramSender.objects.filter(user_id__in=list(user_ids))
+        }
+
+    @sync_to_async
+    def _store_entities(self, entities):
+        values = {}
+        for entity in entities:
+            # Keyed like message.sender_id, which marks channel ids
+            values[utils.get_peer_id(entity)] = {
+                'first_name': getattr(entity, 'first_name', None) or getattr(entity, 'title', None),
+                'last_name': getattr(entity, 'last_name', None),
+                'username': getattr(entity, 'username', None),
+            }
+
+        existing = {
+            sender.user_id: sender
+            for sender in TelegramSender.objects.filter(user_id__in=list(values))
+        }
+
+        changed = []
+        for user_id, fields in values.items():
+            sender = existing.get(user_id)
+            if sender and any(getattr(sender, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(sender, name, value)
+                sender.updated_at = timezone.now()
+                changed.append(sender)
+        if changed:
+            TelegramSender.objects.bulk_update(changed, ['first_name', 'last_name', 'username', 'updated_at'])
+
+        new_ids = set(values) - set(existing)
+        if not new_ids:
+            return existing
+
+        # Another worker may insert the same users concurrently
+        TelegramSender.objects.bulk_create(
+            [TelegramSender(user_id=user_id, **values[user_id]) for user_id in new_ids],
+            ignore_conflicts=True
+        )
+        existing.update({
+            sender.user_id: sender
+            for sender in TelegramSender.objects.filter(user_id__in=list(new_ids))
+        })
+        return existing
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation
+from .models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation, Job
 from django.contrib.auth.models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -58,6 +58,7 @@ class TelegramGroupSerializer(serializers.ModelSerializer):
 
 class TelegramMessageSerializer(serializers.ModelSerializer):
     group = TelegramGroupSerializer(read_only=True)
+    sender_username = serializers.SerializerMethodField()
     
     class Meta:
         model = TelegramMessage
@@ -71,11 +72,22 @@ class TelegramMessageSerializer(serializers.ModelSerializer):
             'text', 
             'message_type',
             'date', 
+            'edited_at',
+            'is_deleted',
             'is_processed', 
             'created_at'
         ]
         read_only_fields = ['id', 'created_at']
 
+    def get_sender_username(self, obj):
+        if obj.sender_profile_id:
+            return obj.sender_profile.username
+        return obj.sender_username
+
+class FlatTelegramMessageSerializer(TelegramMessageSerializer):
+    """Message with the id of its group, for flat lists"""
+    group = serializers.PrimaryKeyRelatedField(read_only=True)
+
 class AccountGroupAssociationSerializer(serializers.ModelSerializer):
     account = TelegramAccountSerializer(read_only=True)
     group = TelegramGroupSerializer(read_only=True)
@@ -85,6 +97,20 @@ class AccountGroupAssociationSerializer(serializers.ModelSerializer):
         fields = ['id', 'account', 'group', 'is_active', 'joined_at', 'last_collection']
         read_only_fields = ['id', 'joined_at', 'last_collection']
 
+class FlatAccountGroupAssociationSerializer(AccountGroupAssociationSerializer):
+    """Association with the ids of its account and group, for flat lists"""
+    account = serializers.PrimaryKeyRelatedField(read_only=True)
+    group = serializers.PrimaryKeyRelatedField(read_only=True)
+
+class JobSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='telegram-job-detail', read_only=True)
+    
+    class Meta:
+        model = Job
+        fields = ['id', 'url', 'kind', 'status', 'phase', 'processed', 'params', 'result', 'error',
+                  'cancel_requested', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
 class TelegramAuthenticateSerializer(serializers.Serializer):
     phone_number = serializers.CharField(required=False, help_text="Optional: Override the stored phone number")
     force_sms = serializers.BooleanField(required=False, default=False, help_text="Force SMS code instead of Telegram app")
@@ -123,11 +149,12 @@ class MessageCollectionSerializer(serializers.Serializer):
     )
     limit = serializers.IntegerField(
         required=False,
-        default=1000,
+        min_value=1,
         error_messages={
             'invalid': 'limit must be a valid integer.',
         },
-        help_text="Maximum number of messages to collect"
+        help_text="Maximum number of messages to collect. Defaults to 1000 for 'all'; "
+                  "'last_week' and 'since_date' fetch their whole window unless a limit is given"
     )
 
     def validate(self, data):
@@ -136,3 +163,51 @@ class MessageCollectionSerializer(serializers.Serializer):
                 "since_date": "since_date field is required when collection_type is 'since_date'. Please provide a date in YYYY-MM-DD format."
             })
         return data
+
+class MessageFilterSerializer(serializers.Serializer):
+    group_id = serializers.IntegerField(required=False, help_text="Only messages of this group")
+    sender_id = serializers.IntegerField(required=False, help_text="Only messages of this Telegram user")
+    message_type = serializers.ChoiceField(
+        choices=[choice for choice, _ in TelegramMessage.MESSAGE_TYPES],
+        required=False,
+        help_text="Only messages of this type"
+    )
+    since = serializers.DateTimeField(required=False, help_text="Only messages sent at or after this ISO 8601 time")
+    until = serializers.DateTimeField(required=False, help_text="Only messages sent before this ISO 8601 time")
+
+    def validate(self, data):
+        if data.get('since') and data.get('until') and data['since'] >= data['until']:
+            raise serializers.ValidationError({'until': 'until must be later than since.'})
+        return data
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=True, help_text="Words to search for, all of them must match")
+    type = serializers.ChoiceField(
+        choices=['all', 'messages', 'summaries'],
+        required=False,
+        default='all',
+        help_text="Search messages, summaries or both"
+    )
+    group_id = serializers.IntegerField(required=False, help_text="Only results of this group")
+    since = serializers.DateTimeField(required=False, help_text="Only results at or after this ISO 8601 time")
+    until = serializers.DateTimeField(required=False, help_text="Only results before this ISO 8601 time")
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=100,
+                                     help_text="Maximum number of results of each type")
+
+    def validate(self, data):
+        if data.get('since') and data.get('until') and data['since'] >= data['until']:
+            raise serializers.ValidationError({'until': 'until must be later than since.'})
+        return data
+
+class RelatedMessagesSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, help_text="Text to find related messages for")
+    message = serializers.IntegerField(required=False, help_text="Id of a stored message to find related messages for")
+    k = serializers.IntegerField(required=False, default=10, min_value=1, max_value=50,
+                                 help_text="Number of messages to return")
+    context = serializers.IntegerField(required=False, default=2, min_value=0, max_value=10,
+                                       help_text="Messages returned before and after each result")
+
+    def validate(self, data):
+        if not data.get('q') and not data.get('message'):
+            raise serializers.ValidationError('Provide the text q or the id of a message.')
+        return data
@@ -0,0 +1,214 @@
+"""
+Telethon session that keeps its entity cache and update state in the database
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from telethon import utils
+from telethon.sessions import StringSession
+from telethon.tl import types
+from .models import TelegramEntity, TelegramUpdateState
+
+logger = logging.getLogger(__name__)
+
+class DjangoSession(StringSession):
+    """
+    Telethon session for a TelegramAccount.
+
+    The data center and auth key still live in `TelegramAccount.session_string`
+    (`save()` keeps returning that string), while the entity cache and the
+    update state are stored in the TelegramEntity and TelegramUpdateState
+    tables. Peers seen in earlier runs therefore resolve locally, access hash
+    included, instead of being probed over the network.
+
+    Telethon uses the session synchronously from inside the event loop, so
+    changes are only collected in memory: call `load()` before connecting and
+    `persist()` to write them back.
+
+    The update state is the checkpoint of the client that catches up on
+    updates (`track_updates`). Every other client of the account also gets
+    the current state from Telegram when it connects; writing it would move
+    the checkpoint past updates the listener never processed, so their
+    update states are never persisted.
+    """
+    def __init__(self, account, track_updates=False):
+        super().__init__(account.session_string or None)
+        self.account = account
+        self.track_updates = track_updates
+        self._rows_by_id = {}
+        self._ids_by_username = {}
+        self._ids_by_phone = {}
+        self._ids_by_name = {}
+        self._dirty_ids = set()
+        self._dirty_states = set()
+        # A new login may be a different user, whose access hashes differ
+        self._deleted = not account.session_string
+
+    @sync_to_async
+    def load(self):
+        """Read the persisted entities and update states of the account"""
+        if self._deleted:
+            return
+
+        rows = TelegramEntity.objects.filter(account_id=self.account.pk).values_list(
+            'peer_id', 'access_hash', 'username', 'phone', 'name'
+        )
+        for row in rows:
+            self._add_row(tuple(row), dirty=False)
+
+        for state in TelegramUpdateState.objects.filter(account_id=self.account.pk):
+            self._update_states[state.entity_id] = types.updates.State(
+                pts=state.pts,
+                qts=state.qts,
+                date=state.date,
+                seq=state.seq,
+                unread_count=0
+            )
+
+        logger.info(
+            f"Loaded {len(self._rows_by_id)} entities and {len(self._update_states)} "
+            f"update states for {self.account.phone_number}"
+        )
+
+    @sync_to_async
+    def persist(self):
+        """Write the entities and update states changed since the last call"""
+        if not self.track_updates:
+            self._dirty_states = set()
+        if not (self._deleted or self._dirty_ids or self._dirty_states):
+            return
+
+        with transaction.atomic():
+            if self._deleted:
+                TelegramEntity.objects.filter(account_id=self.account.pk).delete()
+                TelegramUpdateState.objects.filter(account_id=self.account.pk).delete()
+                self._deleted = False
+                self._dirty_ids = set(self._rows_by_id)
+                if self.track_updates:
+                    self._dirty_states = set(self._update_states)
+
+            if self._dirty_ids:
+                entities = []
+                for peer_id in self._dirty_ids:
+                    _, access_hash, username, phone, name = self._rows_by_id[peer_id]
+                    entities.append(TelegramEntity(
+                        account_id=self.account.pk,
+                        peer_id=peer_id,
+                        access_hash=access_hash,
+                        username=username,
+                        phone=phone,
+                        name=name[:255] if name else name
+                    ))
+                TelegramEntity.objects.bulk_create(
+                    entities,
+                    update_conflicts=True,
+                    unique_fields=['account', 'peer_id'],
+                    update_fields=['access_hash', 'username', 'phone', 'name', 'updated_at']
+                )
+
+            if self._dirty_states:
+                states = []
+                for entity_id in self._dirty_states:
+                    state = self._update_states[entity_id]
+                    states.append(TelegramUpdateState(
+                        account_id=self.account.pk,
+                        entity_id=entity_id,
+                        pts=state.pts,
+                        qts=state.qts,
+                        date=self._as_aware(state.date),
+                        seq=state.seq
+                    ))
+                TelegramUpdateState.objects.bulk_create(
+                    states,
+                    update_conflicts=True,
+                    unique_fields=['account', 'entity_id'],
+                    update_fields=['pts', 'qts', 'date', 'seq', 'updated_at']
+                )
+
+        self._dirty_ids = set()
+        self._dirty_states = set()
+
+    @staticmethod
+    def _as_aware(date):
+        if isinstance(date, (int, float)):
+            return datetime.fromtimestamp(date, tz=dt_timezone.utc)
+        if date.tzinfo is None:
+            # Telethon stores a naive placeholder date for channel states
+            return date.replace(tzinfo=dt_timezone.utc)
+        return date
+
+    def _add_row(self, row, dirty=True):
+        peer_id, access_hash, username, phone, name = row
+        previous = self._rows_by_id.get(peer_id)
+        if previous:
+            # Entities saved from input peers carry no names, keep what we knew
+            username = username or previous[2]
+            phone = phone or previous[3]
+            name = name or previous[4]
+            self._unindex(previous)
+
+        row = (peer_id, access_hash, username, phone, name)
+        self._rows_by_id[peer_id] = row
+        if username:
+            self._ids_by_username[username] = peer_id
+        if phone:
+            self._ids_by_phone[phone] = peer_id
+        if name:
+            self._ids_by_name[name] = peer_id
+
+        if dirty and row != previous:
+            self._dirty_ids.add(peer_id)
+
+    def _unindex(self, row):
+        peer_id, _, username, phone, name = row
+        for index, key in ((self._ids_by_username, username),
+                           (self._ids_by_phone, phone),
+                           (self._ids_by_name, name)):
+            if key and index.get(key) == peer_id:
+                del index[key]
+
+    def _row_for(self, peer_id):
+        row = self._rows_by_id.get(peer_id) if peer_id is not None else None
+        return (row[0], row[1]) if row else None
+
+    def process_entities(self, tlo):
+        for row in self._entities_to_rows(tlo):
+            self._add_row(row)
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._row_for(self._ids_by_phone.get(phone))
+
+    def get_entity_rows_by_username(self, username):
+        return self._row_for(self._ids_by_username.get(username))
+
+    def get_entity_rows_by_name(self, name):
+        return self._row_for(self._ids_by_name.get(name))
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            return self._row_for(id)
+
+        for peer in (types.PeerUser(id), types.PeerChat(id), types.PeerChannel(id)):
+            row = self._row_for(utils.get_peer_id(peer))
+            if row:
+                return row
+        return None
+
+    def set_update_state(self, entity_id, state):
+        previous = self._update_states.get(entity_id)
+        super().set_update_state(entity_id, state)
+        # Checkpoints re-save every channel, only write the ones that moved
+        if previous is None or (previous.pts, previous.qts, previous.seq) != (state.pts, state.qts, state.seq):
+            self._dirty_states.add(entity_id)
+
+    def delete(self):
+        super().delete()
+        self._rows_by_id.clear()
+        self._ids_by_username.clear()
+        self._ids_by_phone.clear()
+        self._ids_by_name.clear()
+        self._update_states.clear()
+        self._dirty_ids = set()
+        self._dirty_states = set()
+        self._deleted = True
@@ -1,17 +1,75 @@
 """
 Signal handlers for telegram_integration app
 """
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import TelegramMessage
+import logging
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from .access import invalidate_account_group_access, invalidate_group_access
+from .models import AccountGroupAssociation, TelegramAccount, TelegramMessage
+from .semantic import index_messages
+
+logger = logging.getLogger(__name__)
+
+# Sent after new messages of a group have been stored, with `group` and the
+# list of created `messages`. Bulk inserts do not send post_save, so this is
+# the notification point for everything the collectors and listeners ingest.
+messages_ingested = Signal()
+
+# Sent after stored messages were edited on Telegram, with `group` and the
+# updated `messages`
+messages_edited = Signal()
+
+# Sent after messages were deleted on Telegram, with `group` and the
+# `message_ids` that were marked as deleted
+messages_deleted = Signal()
 
 @receiver(post_save, sender=TelegramMessage)
 def handle_new_message(sender, instance, created, **kwargs):
     """
     Signal handler for new messages
-    This can be used to trigger actions when new messages are saved
+    Messages saved one at a time are announced like ingested batches
     """
     if created:
-        # This is where you could add logic to be executed when a new message is created
-        # For example, you might want to notify users or trigger immediate processing
-        pass
+        messages_ingested.send(sender=TelegramMessage, group=instance.group, messages=[instance])
+
+@receiver(messages_ingested)
+def log_ingested_messages(sender, group, messages, **kwargs):
+    """
+    This is where you could add logic to be executed when new messages arrive,
+    for example notifying users or triggering immediate processing
+    """
+    logger.debug(f"{len(messages)} new messages stored for {group.name}")
+
+@receiver(messages_ingested)
+def index_ingested_messages(sender, group, messages, **kwargs):
+    """Add new messages to the semantic index of their group"""
+    try:
+        index_messages(group, messages)
+    except Exception as e:
+        logger.error(f"Error indexing messages of {group.name}: {str(e)}")
+
+@receiver(post_save, sender=AccountGroupAssociation)
+def association_saved(sender, instance, created, **kwargs):
+    """
+    A new association grants its group to the account's user. Updates of
+    an existing one (cursors, health) leave the cached group access alone.
+    """
+    if created:
+        invalidate_account_group_access(instance.account_id)
+
+@receiver(post_delete, sender=AccountGroupAssociation)
+def association_deleted(sender, instance, **kwargs):
+    invalidate_account_group_access(instance.account_id)
+
+@receiver(pre_save, sender=TelegramAccount)
+def account_moving(sender, instance, update_fields=None, **kwargs):
+    """An account handed to another user takes its groups along"""
+    if instance.pk and (update_fields is None or 'user' in update_fields):
+        previous = TelegramAccount.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+        if previous is not None and previous != instance.user_id:
+            invalidate_group_access(previous)
+            invalidate_group_access(instance.user_id)
+
+@receiver(post_delete, sender=TelegramAccount)
+def account_deleted(sender, instance, **kwargs):
+    invalidate_group_access(instance.user_id)
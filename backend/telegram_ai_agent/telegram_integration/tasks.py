@@ -1,10 +1,19 @@
-from celery import shared_task
-import asyncio
+from celery import chord, shared_task
 import logging
+from asgiref.sync import async_to_sync, sync_to_async
 from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
-from .models import TelegramAccount, TelegramGroup, AccountGroupAssociation
+from .models import TelegramAccount, TelegramGroup, AccountGroupAssociation, Job
 from .client import TelegramClientManager
+from .election import CollectorElection
+from .jobs import JobCancelled, run_job, update_progress
+from .locks import CollectionLock
+from .polling import claim_groups
+from .scheduler import load_active_associations, merge_reports, run_scheduled_collection
+from .semantic import build_group_index, rebuild_key
 
 logger = logging.getLogger(__name__)
 
@@ -13,74 +22,223 @@ def collect_messages_from_all_groups():
     """
     Celery task to collect messages from all active groups for all active accounts
     This task is scheduled to run periodically
+
+    One account is elected to collect each group, and the work is fanned out
+    as one collect_account_messages task per account with its elected
+    associations, so it spreads over all workers. summarize_collection
+    aggregates their reports into the run summary once every account is
+    done, and hands groups whose collection failed to a standby account.
+    Groups that are still being collected by an earlier run are skipped
+    thanks to the per-group CollectionLock.
     """
     logger.info("Starting scheduled message collection task")
     
-    # Get all active account-group associations
-    associations = AccountGroupAssociation.objects.filter(
-        is_active=True,
-        account__is_active=True,
-        group__is_active=True
+    by_account = async_to_sync(load_active_associations)()
+    if not by_account:
+        logger.info("No active associations to collect")
+        return merge_reports([])
+    
+    return _dispatch_collection(by_account)
+
+@shared_task
+def dispatch_due_collections():
+    """
+    Celery task dispatching the collection of the groups that are due
+    This task is scheduled to run every minute
+
+    Each group is polled at an interval adapted to its message rate (see
+    polling.py), so busy groups are collected within a minute or two while
+    quiet ones are only checked about once an hour. The due groups are
+    claimed before dispatch, so a slow run is not dispatched twice.
+    """
+    by_account = async_to_sync(load_active_associations)(due_only=True)
+    if not by_account:
+        return {'accounts': 0, 'groups': 0}
+    
+    groups = {association.group_id: association.group for associations in by_account.values() for association in associations}
+    claim_groups(list(groups.values()))
+    logger.info(f"Dispatching collection of {len(groups)} due groups")
+    
+    result = _dispatch_collection(by_account)
+    result['groups'] = len(groups)
+    return result
+
+def _dispatch_collection(by_account):
+    """Elect the collector of each group and fan the collection out per account"""
+    election = CollectorElection(by_account)
+    plan = async_to_sync(election.elect)()
+    standbys = {
+        str(group_id): [association.pk for association in associations]
+        for group_id, associations in election.standbys.items()
+        if associations
+    }
+    
+    result = chord(
+        collect_account_messages.s(account_id, [association.pk for association in associations])
+        for account_id, associations in plan.items()
+    )(summarize_collection.s(standbys=standbys))
+    
+    logger.info(f"Dispatched collection of {len(plan)} accounts, summary task {result.id}")
+    return {'accounts': len(plan), 'summary_task_id': result.id}
+
+@shared_task
+def collect_account_messages(account_id, association_ids=None):
+    """
+    Celery task to collect the active groups of one account
+    (only `association_ids` when given). Returns the run report of the account
+    """
+    try:
+        return async_to_sync(run_scheduled_collection)(account_ids=[account_id], association_ids=association_ids)
+    except Exception as e:
+        # A failing account must not keep the summary from running
+        logger.error(f"Error collecting account {account_id}: {str(e)}")
+        report = merge_reports([])
+        report['accounts'].append({
+            'account_id': account_id,
+            'status': 'error',
+            'error': str(e),
+            'messages': 0,
+            'groups': [],
+        })
+        return report
+
+@shared_task
+def summarize_collection(reports, standbys=None):
+    """
+    Celery task aggregating the per-account reports of a collection run
+
+    Groups that failed or whose account was unavailable are dispatched once
+    more, through the first standby account in `standbys` (group id ->
+    association ids).
+    """
+    summary = merge_reports(reports)
+    
+    failover = {}
+    for account_report in summary['accounts']:
+        for group_report in account_report['groups']:
+            if group_report['status'] == 'succeeded' or group_report.get('error') == 'locked':
+                continue
+            candidates = (standbys or {}).get(str(group_report['group_id']))
+            if candidates:
+                failover.setdefault(candidates[0], []).append(group_report['group_id'])
+    
+    if failover:
+        by_account = {}
+        for association in AccountGroupAssociation.objects.filter(pk__in=list(failover)):
+            by_account.setdefault(association.account_id, []).append(association.pk)
+        for account_id, association_ids in by_account.items():
+            collect_account_messages.delay(account_id, association_ids)
+        summary['failovers'] += len(failover)
+    
+    logger.info(
+        f"Completed scheduled message collection task. Total new messages: {summary['total_messages']}, "
+        f"groups succeeded: {summary['groups']['succeeded']}, failed: {summary['groups']['failed']}, "
+        f"skipped: {summary['groups']['skipped']}, failed over: {summary['failovers']}"
+    )
+    return summary
+
+@shared_task(bind=True, max_retries=None)
+def sync_messages_job(self, job_id):
+    """
+    Celery task running a `sync_messages` Job: backfill the history of a
+    group, reporting the number of messages stored after every chunk
+
+    The group is locked like any other collection. While it is being
+    collected elsewhere the job stays pending and the task is retried.
+    """
+    job = Job.objects.filter(pk=job_id, status='pending').first()
+    if job is None:
+        # Cancelled or already run, run_job says so
+        return run_job(job_id, _sync_messages)
+    
+    lock = CollectionLock(job.params['group_id'])
+    if not lock.acquire():
+        logger.info(f"Group {job.params['group_id']} is being collected, retrying job {job_id} later")
+        raise self.retry(countdown=getattr(settings, 'TELEGRAM_JOB_LOCK_RETRY_DELAY', 30))
+    try:
+        return run_job(job_id, lambda job: _sync_messages(job, lock))
+    finally:
+        lock.release()
+
+def _sync_messages(job, lock=None):
+    association = AccountGroupAssociation.objects.select_related('account', 'group').get(
+        account_id=job.params['account_id'],
+        group_id=job.params['group_id']
     )
+    group = association.group
     
-    collection_count = 0
+    async def sync(manager):
+        await sync_to_async(update_progress)(job, phase='fetching messages')
+        
+        async def on_progress(count):
+            if lock:
+                # A backfill may outlast the lock's expiry
+                await sync_to_async(lock.extend)()
+            return await sync_to_async(update_progress)(job, processed=count)
+        
+        return await manager.backfill_messages(
+            group,
+            association=association,
+            limit=job.params.get('limit'),
+            on_progress=on_progress
+        )
     
-    for association in associations:
+    count = _run_with_client(association.account, sync)
+    association.last_collection = timezone.now()
+    association.save(update_fields=['last_collection'])
+    if not update_progress(job, processed=count, phase='done'):
+        # Everything up to the last checkpoint is stored, a new sync resumes there
+        raise JobCancelled()
+    return {'count': count, 'group_id': group.group_id, 'group_name': group.name}
+
+@shared_task
+def sync_groups_job(job_id):
+    """Celery task running a `sync_groups` Job: store every group the account is in"""
+    return run_job(job_id, _sync_groups)
+
+def _sync_groups(job):
+    account = TelegramAccount.objects.get(pk=job.params['account_id'])
+    update_progress(job, phase='listing dialogs')
+    groups_added, total = _run_with_client(account, lambda manager: manager.sync_dialogs())
+    update_progress(job, processed=total, phase='done')
+    return {'groups_added': groups_added, 'total_groups': total}
+
+def _run_with_client(account, func):
+    """Run `func(manager)` with a connected client of the account"""
+    async def run():
+        manager = TelegramClientManager(account)
         try:
-            # Create a new event loop for each association
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Create client manager
-            client_manager = TelegramClientManager(association.account)
-            
-            # Connect and authenticate
-            client = loop.run_until_complete(client_manager.create_client())
-            
-            if not loop.run_until_complete(client.is_user_authorized()):
-                logger.warning(f"Account {association.account.phone_number} not authenticated, skipping")
-                continue
-            
-            # Collect messages
-            count = loop.run_until_complete(
-                client_manager.collect_messages(association.group, limit=200)
-            )
-            
-            # Disconnect
-            loop.run_until_complete(client_manager.disconnect())
-            
-            collection_count += count
-            
-            logger.info(f"Collected {count} new messages from {association.group.name} using account {association.account.phone_number}")
-            
-            # Update last collection timestamp
-            association.last_collection = timezone.now()
-            association.save()
-            
-            # Close the loop
-            loop.close()
-            
-        except Exception as e:
-            logger.error(f"Error collecting messages for association {association.id}: {str(e)}")
-    
-    logger.info(f"Completed scheduled message collection task. Total new messages: {collection_count}")
-    return collection_count
+            client = await manager.create_client()
+            if not await client.is_user_authorized():
+                raise Exception("Account not authenticated")
+            return await func(manager)
+        finally:
+            await manager.disconnect()
+    
+    return async_to_sync(run)()
 
 @shared_task
 def check_inactive_associations():
     """
     Celery task to check for inactive associations
     If an association hasn't collected messages in a week, mark it as inactive
+
+    Only one account collects a group watched by several, so standby
+    associations of a group that was collected recently stay active.
     """
     logger.info("Checking for inactive associations")
     
     # Get associations that haven't collected messages in a week
     one_week_ago = timezone.now() - timedelta(days=7)
     
+    recently_collected = AccountGroupAssociation.objects.filter(
+        group=OuterRef('group'),
+        last_collection__gte=one_week_ago
+    )
     associations = AccountGroupAssociation.objects.filter(
         is_active=True,
         last_collection__lt=one_week_ago
-    )
+    ).exclude(Exists(recently_collected))
     
     for association in associations:
         association.is_active = False
@@ -88,3 +246,21 @@ def check_inactive_associations():
         logger.info(f"Marked association {association.id} as inactive due to inactivity")
     
     return len(associations)
+
+@shared_task
+def rebuild_vector_index(group_id):
+    """
+    Fit the semantic index of a group on its stored messages and embed them
+    all. Queued by the ingest for groups without an index or that doubled
+    since their index was fitted.
+    """
+    try:
+        group = TelegramGroup.objects.get(pk=group_id)
+        count = build_group_index(group)
+        logger.info(f"Semantic index of {group.name} rebuilt over {count} messages")
+        return count
+    except Exception as e:
+        logger.error(f"Error rebuilding the semantic index of group {group_id}: {str(e)}")
+        return None
+    finally:
+        cache.delete(rebuild_key(group_id))
@@ -4,7 +4,8 @@ from .views import (
     TelegramAccountViewSet,
     TelegramGroupViewSet,
     TelegramMessageViewSet,
-    AccountGroupAssociationViewSet
+    AccountGroupAssociationViewSet,
+    JobViewSet
 )
 
 router = DefaultRouter()
@@ -12,6 +13,7 @@ router.register(r'accounts', TelegramAccountViewSet, basename='telegram-account'
 router.register(r'groups', TelegramGroupViewSet, basename='telegram-group')
 router.register(r'messages', TelegramMessageViewSet, basename='telegram-message')
 router.register(r'associations', AccountGroupAssociationViewSet, basename='account-group-association')
+router.register(r'jobs', JobViewSet, basename='telegram-job')
 
 urlpatterns = [
     path('', include(router.urls)),
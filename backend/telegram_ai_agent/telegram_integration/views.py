@@ -1,61 +1,85 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from asgiref.sync import sync_to_async
+from django.db.models import Q, Subquery, Value
+from django.http import Http404
 from telethon.sessions import StringSession
-from .models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation
+from .models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation, Job
 from .serializers import (
     TelegramAccountSerializer, 
     TelegramGroupSerializer, 
     TelegramMessageSerializer,
+    FlatTelegramMessageSerializer,
     AccountGroupAssociationSerializer,
+    FlatAccountGroupAssociationSerializer,
     TelegramAuthenticateSerializer,
     TelegramVerifyCodeSerializer,
     TelegramAccountSyncSerializer,
-    MessageCollectionSerializer
+    MessageCollectionSerializer,
+    MessageFilterSerializer,
+    RelatedMessagesSerializer,
+    JobSerializer
 )
+from .access import accessible_group_ids
+from .async_views import AsyncViewSetMixin
+from .bridge import AccountNotAuthorized, get_bridge
 from .client import TelegramClientManager
-import asyncio
+from .flat import FlatGroupsMixin
+from .jobs import cancel_job, enqueue_job, job_accepted
+from .locks import CollectionLock
+from .pagination import MessageCursorPagination
+from .semantic import GroupVectorIndex, schedule_rebuild
+from .tasks import sync_groups_job, sync_messages_job
 import logging
 from django.utils import timezone
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
-class TelegramAccountViewSet(viewsets.ModelViewSet):
+class TelegramAccountViewSet(AsyncViewSetMixin, viewsets.ModelViewSet):
     """ViewSet for managing Telegram accounts"""
     serializer_class = TelegramAccountSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return TelegramAccount.objects.filter(user=self.request.user)
+        return TelegramAccount.objects.filter(user=self.request.user).select_related('user')
+    
+    @staticmethod
+    async def _disconnect(bridge, client_manager):
+        """Disconnect a client created for signing in, which is never pooled"""
+        try:
+            await bridge.arun(client_manager.disconnect())
+        except Exception as e:
+            logger.error(f"Error disconnecting client: {str(e)}")
     
     @action(detail=True, methods=['post'], serializer_class=TelegramAuthenticateSerializer)
-    def authenticate(self, request, pk=None):
+    async def authenticate(self, request, pk=None):
         """
         Start authentication process for a Telegram account.
         """
         serializer = TelegramAuthenticateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        account = self.get_object()
+        account = await self.aget_object()
+        bridge = get_bridge()
+        # The warm client of the old session must not outlive it
+        await bridge.arelease(account.pk)
         client_manager = TelegramClientManager(account)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         
         try:
-            client = loop.run_until_complete(client_manager.create_client())
+            client = await bridge.arun(client_manager.create_client())
             
             # Force logout if there's an existing session
             if account.session_string:
                 try:
-                    loop.run_until_complete(client.log_out())
+                    await bridge.arun(client.log_out())
                     account.session_string = None
                     account.is_active = False
-                    account.save()
+                    await account.asave()
                     
                     # Create a new client after logout
-                    client = loop.run_until_complete(client_manager.create_client())
+                    client = await bridge.arun(client_manager.create_client())
                 except Exception as logout_error:
                     logger.warning(f"Logout error (non-critical): {str(logout_error)}")
             
@@ -63,7 +87,7 @@ class TelegramAccountViewSet(viewsets.ModelViewSet):
             force_sms = serializer.validated_data.get('force_sms', False)
             
             # Send code request with force_sms
-            result = loop.run_until_complete(client.send_code_request(
+            result = await bridge.arun(client.send_code_request(
                 phone=phone_number,
                 force_sms=True  # Force SMS code
             ))
@@ -72,9 +96,7 @@ class TelegramAccountViewSet(viewsets.ModelViewSet):
             session_string = client.session.save()
             account.session_string = session_string
             account.last_code_request = timezone.now()
-            account.save()
-            
-            loop.run_until_complete(client_manager.disconnect())
+            await account.asave()
             
             return Response({
                 'message': 'Verification code sent to your phone',
@@ -98,17 +120,17 @@ class TelegramAccountViewSet(viewsets.ModelViewSet):
                 'error': error_message
             }, status=status.HTTP_400_BAD_REQUEST)
         finally:
-            loop.close()
+            await self._disconnect(bridge, client_manager)
 
     @action(detail=True, methods=['post'], serializer_class=TelegramVerifyCodeSerializer)
-    def verify_code(self, request, pk=None):
+    async def verify_code(self, request, pk=None):
         """
         Verify the Telegram authentication code.
         """
         serializer = TelegramVerifyCodeSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        account = self.get_object()
+        account = await self.aget_object()
         code = serializer.validated_data['code']
         phone_code_hash = serializer.validated_data['phone_code_hash']
         
@@ -126,17 +148,16 @@ class TelegramAccountViewSet(viewsets.ModelViewSet):
                     'elapsed_seconds': time_elapsed.total_seconds()
                 }, status=status.HTTP_400_BAD_REQUEST)
         
+        bridge = get_bridge()
         client_manager = TelegramClientManager(account)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         
         try:
             # Create client with existing session
-            client = loop.run_until_complete(client_manager.create_client())
+            client = await bridge.arun(client_manager.create_client())
             
             try:
                 # Sign in with the code
-                result = loop.run_until_complete(client.sign_in(
+                result = await bridge.arun(client.sign_in(
                     phone=account.phone_number,
                     code=code,
                     phone_code_hash=phone_code_hash
@@ -146,13 +167,13 @@ class TelegramAccountViewSet(viewsets.ModelViewSet):
                 new_session_string = client.session.save()
                 account.session_string = new_session_string
                 account.is_active = True
-                account.save()
-                
-                loop.run_until_complete(client_manager.disconnect())
+                await account.asave()
                 
                 return Response({
                     'message': 'Authentication successful',
-                    'account': TelegramAccountSerializer(account).data,
+                    'account': await sync_to_async(
+                        lambda: TelegramAccountSerializer(account, context={'request': request}).data
+                    )(),
                     'session_valid': bool(new_session_string)  # Debug info
                 })
                 
@@ -170,98 +191,131 @@ class TelegramAccountViewSet(viewsets.ModelViewSet):
                 'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
         finally:
-            loop.close()
+            await self._disconnect(bridge, client_manager)
 
     @action(detail=True, 
             methods=['post'], 
             url_path='sync', 
             url_name='sync',
             serializer_class=TelegramAccountSyncSerializer)
-    def sync_account(self, request, pk=None):
+    async def sync_account(self, request, pk=None):
         """
         Sync all Telegram groups, channels, and chats from this account.
         """
         try:
-            account = self.get_object()
+            account = await self.aget_object()
             
-            # Create client manager
-            client_manager = TelegramClientManager(account)
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Store all groups and channels over the account's warm client
+            groups_added, total_chats = await get_bridge().acall(account, lambda manager: manager.sync_dialogs())
             
-            try:
-                # Connect and authenticate client
-                client = loop.run_until_complete(client_manager.create_client())
-                
-                if not loop.run_until_complete(client.is_user_authorized()):
-                    return Response({
-                        'error': 'Account not authenticated'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Get all dialogs (groups, channels, chats)
-                dialogs = loop.run_until_complete(client.get_dialogs())
-                
-                groups_added = 0
-                
-                for dialog in dialogs:
-                    entity = dialog.entity
-                    
-                    if dialog.is_group or dialog.is_channel:
-                        # Create or update the group/channel
-                        group, created = TelegramGroup.objects.update_or_create(
-                            group_id=str(entity.id),
-                            defaults={
-                                'name': entity.title,
-                                'username': getattr(entity, 'username', None),
-                                'is_active': True
-                            }
-                        )
-                        
-                        # Create or update association
-                        AccountGroupAssociation.objects.get_or_create(
-                            account=account,
-                            group=group,
-                            defaults={'is_active': True}
-                        )
-                        
-                        if created:
-                            groups_added += 1
-                
-                return Response({
-                    'status': 'success',
-                    'message': f'Successfully synced account.',
-                    'details': {
-                        'groups_added': groups_added,
-                        'total_chats': len(dialogs)
-                    }
-                })
-                
-            finally:
-                # Always disconnect client and close loop
-                loop.run_until_complete(client_manager.disconnect())
-                loop.close()
+            return Response({
+                'status': 'success',
+                'message': f'Successfully synced account.',
+                'details': {
+                    'groups_added': groups_added,
+                    'total_chats': total_chats
+                }
+            })
                 
+        except AccountNotAuthorized:
+            return Response({
+                'error': 'Account not authenticated'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Account sync error: {str(e)}")
             return Response({
                 'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-class TelegramGroupViewSet(viewsets.ModelViewSet):
+class TelegramGroupViewSet(AsyncViewSetMixin, viewsets.ModelViewSet):
     """ViewSet for managing Telegram groups"""
     serializer_class = TelegramGroupSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         # Return groups associated with the user's accounts
-        user_accounts = TelegramAccount.objects.filter(user=self.request.user)
-        group_ids = AccountGroupAssociation.objects.filter(
-            account__in=user_accounts
-        ).values_list('group_id', flat=True)
-        return TelegramGroup.objects.filter(id__in=group_ids)
+        return TelegramGroup.objects.filter(id__in=accessible_group_ids(self.request.user))
+    
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """
+        Endpoint to find the messages of the group closest in meaning to a
+        text or to one of its messages, with the messages around each of
+        them. Served from the local semantic index of the group, without
+        calling the AI API.
+        """
+        group = self.get_object()
+        serializer = RelatedMessagesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        text, exclude = params.get('q'), []
+        if params.get('message'):
+            try:
+                message = TelegramMessage.objects.get(pk=params['message'], group=group)
+            except TelegramMessage.DoesNotExist:
+                return Response({
+                    'error': 'Message not found in this group'
+                }, status=status.HTTP_404_NOT_FOUND)
+            text, exclude = message.text, [message.pk]
+        
+        index = GroupVectorIndex(group.pk)
+        if not index.exists:
+            schedule_rebuild(group.pk)
+            return Response({
+                'indexed': False,
+                'results': [],
+                'message': 'The group is being indexed, try again in a moment'
+            })
+        
+        matches = index.query(text, k=params['k'], exclude=exclude)
+        stored = TelegramMessage.objects.filter(group=group, is_deleted=False)
+        messages = stored.filter(pk__in=[pk for pk, _ in matches]).select_related('sender_profile').in_bulk()
+        
+        # The context of every match in one query: two seeks on the
+        # (group, date, id) index per match, tagged with the match they
+        # belong to. The slices are wrapped in IN subqueries because SQLite
+        # rejects LIMIT in the parts of a compound statement.
+        context = params['context']
+        parts = []
+        for message in messages.values() if context else []:
+            earlier = stored.filter(
+                Q(date__lt=message.date) | Q(date=message.date, id__lt=message.id)
+            ).order_by('-date', '-id').values('pk')[:context]
+            later = stored.filter(
+                Q(date__gt=message.date) | Q(date=message.date, id__gt=message.id)
+            ).order_by('date', 'id').values('pk')[:context]
+            parts += [
+                stored.filter(pk__in=Subquery(part)).select_related('sender_profile').annotate(
+                    match=Value(message.pk), side=Value(side)
+                ).order_by()
+                for side, part in (('before', earlier), ('after', later))
+            ]
+        around = {message.pk: {'before': [], 'after': []} for message in messages.values()}
+        if parts:
+            for row in parts[0].union(*parts[1:], all=True):
+                around[row.match][row.side].append(row)
+            for sides in around.values():
+                for side in sides.values():
+                    side.sort(key=lambda message: (message.date, message.id))
+        
+        results = []
+        for pk, score in matches:
+            if pk not in messages:
+                continue
+            message = messages[pk]
+            before, after = around[pk]['before'], around[pk]['after']
+            results.append({
+                'score': score,
+                'message': FlatTelegramMessageSerializer(message).data,
+                'before': FlatTelegramMessageSerializer(before, many=True).data,
+                'after': FlatTelegramMessageSerializer(after, many=True).data,
+            })
+        
+        return Response({'indexed': True, 'results': results})
     
     @action(detail=False, methods=['post'])
-    def join(self, request):
+    async def join(self, request):
         """
         Endpoint to join a Telegram group using a specified account
         """
@@ -275,59 +329,43 @@ class TelegramGroupViewSet(viewsets.ModelViewSet):
         
         # Get the account
         try:
-            account = TelegramAccount.objects.get(id=account_id, user=request.user)
+            account = await TelegramAccount.objects.aget(id=account_id, user=request.user)
         except TelegramAccount.DoesNotExist:
             return Response({
                 'error': 'Account not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Create a client manager
-        client_manager = TelegramClientManager(account)
-        
-        # Join the group asynchronously
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
         try:
-            # Connect and authenticate the client
-            client = loop.run_until_complete(client_manager.create_client())
-            
-            if not loop.run_until_complete(client.is_user_authorized()):
-                return Response({
-                    'error': 'Account not authenticated'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Join the group
-            group = loop.run_until_complete(client_manager.join_group(group_link))
+            # Join the group over the account's warm client
+            group = await get_bridge().acall(account, lambda manager: manager.join_group(group_link))
             
             if not group:
                 return Response({
                     'error': 'Failed to join group'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Disconnect the client
-            loop.run_until_complete(client_manager.disconnect())
-            
             return Response({
                 'message': 'Successfully joined group',
                 'group': TelegramGroupSerializer(group).data
             })
+        except AccountNotAuthorized:
+            return Response({
+                'error': 'Account not authenticated'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Join group error: {str(e)}")
             return Response({
                 'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
-        finally:
-            loop.close()
     
     @action(detail=True, 
             methods=['post'],
             serializer_class=MessageCollectionSerializer)
-    def collect_messages(self, request, pk=None):
+    async def collect_messages(self, request, pk=None):
         """
         Collect messages from a Telegram group based on specified criteria
         """
-        group = self.get_object()
+        group = await self.aget_object()
         serializer = self.get_serializer(data=request.data)
         
         if not serializer.is_valid():
@@ -336,66 +374,70 @@ class TelegramGroupViewSet(viewsets.ModelViewSet):
         validated_data = serializer.validated_data
         account_id = validated_data['account_id']
         collection_type = validated_data['collection_type']
-        limit = validated_data.get('limit', 1000)
+        
+        # Windowed collections fetch exactly their window, limit only caps it
+        since = None
+        if collection_type == 'last_week':
+            since = timezone.now() - timedelta(days=7)
+        elif collection_type == 'since_date':
+            since = timezone.make_aware(datetime.combine(validated_data['since_date'], datetime.min.time()))
+        limit = validated_data.get('limit') or (None if since else 1000)
         
         try:
-            account = TelegramAccount.objects.get(id=account_id, user=request.user)
+            account = await TelegramAccount.objects.aget(id=account_id, user=request.user)
         except TelegramAccount.DoesNotExist:
             return Response({
                 'error': 'Account not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Check association
-        association = get_object_or_404(
-            AccountGroupAssociation,
-            account=account,
-            group=group
-        )
+        try:
+            association = await AccountGroupAssociation.objects.aget(account=account, group=group)
+        except AccountGroupAssociation.DoesNotExist:
+            raise Http404
         
-        # Setup client
-        client_manager = TelegramClientManager(account)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Never collect a group twice at the same time
+        lock = CollectionLock(association.group_id)
+        if not await sync_to_async(lock.acquire)():
+            return Response({
+                'error': 'Messages of this group are already being collected'
+            }, status=status.HTTP_409_CONFLICT)
         
         try:
-            # Create and connect client
-            client = loop.run_until_complete(client_manager.create_client())
-            
-            if not loop.run_until_complete(client.is_user_authorized()):
-                return Response({
-                    'error': 'Account not authenticated'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Collect messages
-            count = loop.run_until_complete(client_manager.collect_messages(group, limit=limit))
+            # Collect messages over the account's warm client
+            count = await get_bridge().acall(
+                account,
+                lambda manager: manager.collect_messages(group, limit=limit, association=association, since=since)
+            )
             
             # Update last collection timestamp
             association.last_collection = timezone.now()
-            association.save()
+            await association.asave(update_fields=['last_collection'])
             
             return Response({
                 'message': f'Successfully collected {count} messages',
                 'collection_type': collection_type,
+                'since': since.isoformat() if since else None,
                 'count': count
             })
             
+        except AccountNotAuthorized:
+            return Response({
+                'error': 'Account not authenticated'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Message collection error: {str(e)}")
             return Response({
                 'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
         finally:
-            # Cleanup
-            try:
-                loop.run_until_complete(client_manager.disconnect())
-            except Exception as e:
-                logger.error(f"Error disconnecting client: {str(e)}")
-            loop.close()
+            await sync_to_async(lock.release)()
 
     @action(detail=False, methods=['post'], url_path='sync-groups', url_name='sync_groups')
-    def sync_groups(self, request):
+    async def sync_groups(self, request):
         """
         Sync all Telegram groups that the user is already a member of.
+        Runs in the background, answers 202 with the job to poll.
         
         Expected payload:
         {
@@ -410,78 +452,34 @@ class TelegramGroupViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            account = TelegramAccount.objects.get(id=account_id, user=request.user)
+            account = await TelegramAccount.objects.aget(id=account_id, user=request.user)
         except TelegramAccount.DoesNotExist:
             return Response({
                 'error': 'Account not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        client_manager = TelegramClientManager(account)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Connect and authenticate the client
-            client = loop.run_until_complete(client_manager.create_client())
-            
-            if not loop.run_until_complete(client.is_user_authorized()):
-                return Response({
-                    'error': 'Account not authenticated'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Get all dialogs (chats and groups)
-            dialogs = loop.run_until_complete(client.get_dialogs())
-            
-            # Filter for groups only
-            groups_added = 0
-            for dialog in dialogs:
-                if dialog.is_group or dialog.is_channel:
-                    group, created = TelegramGroup.objects.update_or_create(
-                        group_id=str(dialog.entity.id),  # Convert to string to ensure compatibility
-                        defaults={
-                            'name': dialog.entity.title,
-                            'username': getattr(dialog.entity, 'username', None),
-                            'is_active': True
-                        }
-                    )
-                    
-                    # Create association if it doesn't exist
-                    association, assoc_created = AccountGroupAssociation.objects.get_or_create(
-                        account=account,
-                        group=group,
-                        defaults={'is_active': True}
-                    )
-                    
-                    if created:
-                        groups_added += 1
-            
-            # Disconnect the client
-            loop.run_until_complete(client_manager.disconnect())
-            
-            return Response({
-                'message': f'Successfully synced groups. Added {groups_added} new groups.',
-                'groups_added': groups_added,
-                'total_groups': len(dialogs)
-            })
-            
-        except Exception as e:
-            logger.error(f"Sync groups error: {str(e)}")
+        if not account.session_string:
             return Response({
-                'error': str(e)
+                'error': 'Account not authenticated'
             }, status=status.HTTP_400_BAD_REQUEST)
-        finally:
-            loop.close()
+        
+        # Listing every dialog can take minutes, it runs as a job
+        job = await sync_to_async(enqueue_job)(
+            request.user, 'sync_groups', {'account_id': account.pk}, sync_groups_job
+        )
+        return job_accepted(request, job)
 
     @action(detail=True, 
             methods=['post'],
             url_path='sync-messages',
             url_name='sync_messages',
             serializer_class=MessageCollectionSerializer)
-    def sync_messages(self, request, pk=None):
+    async def sync_messages(self, request, pk=None):
         """
         Sync historical messages from a Telegram group
+        Runs in the background, answers 202 with the job to poll.
         """
-        group = self.get_object()
+        group = await self.aget_object()
         serializer = self.get_serializer(data=request.data)
         
         if not serializer.is_valid():
@@ -492,115 +490,76 @@ class TelegramGroupViewSet(viewsets.ModelViewSet):
         limit = validated_data.get('limit', 1000)
         
         try:
-            account = TelegramAccount.objects.get(id=account_id, user=request.user)
+            account = await TelegramAccount.objects.aget(id=account_id, user=request.user)
         except TelegramAccount.DoesNotExist:
             return Response({
                 'error': 'Account not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Check association
-        try:
-            association = AccountGroupAssociation.objects.get(
-                account=account,
-                group=group
-            )
-        except AccountGroupAssociation.DoesNotExist:
+        if not await AccountGroupAssociation.objects.filter(account=account, group=group).aexists():
             return Response({
                 'error': 'No association found between this account and group'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Setup client
-        client_manager = TelegramClientManager(account)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Create and connect client
-            client = loop.run_until_complete(client_manager.create_client())
-            
-            if not loop.run_until_complete(client.is_user_authorized()):
-                return Response({
-                    'error': 'Account not authenticated'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            logger.info(f"Starting message sync for group {group.name} using account {account.phone_number}")
-            
-            # Sync historical messages
-            count = loop.run_until_complete(
-                client_manager.sync_historical_messages(group, limit=limit)
-            )
-            
-            if count == 0:
-                return Response({
-                    'warning': 'No new messages were synced. This could mean either all messages are already synced or there was an issue accessing the group.',
-                    'group_id': group.group_id,
-                    'group_name': group.name
-                }, status=status.HTTP_200_OK)
-            
-            # Update last collection timestamp
-            association.last_collection = timezone.now()
-            association.save()
-            
-            return Response({
-                'message': f'Successfully synced {count} historical messages',
-                'count': count,
-                'group_name': group.name,
-                'group_id': group.group_id
-            })
-            
-        except Exception as e:
-            logger.error(f"Message sync error: {str(e)}")
+        if not account.session_string:
             return Response({
-                'error': str(e),
-                'group_id': group.group_id,
-                'group_name': group.name
+                'error': 'Account not authenticated'
             }, status=status.HTTP_400_BAD_REQUEST)
-        finally:
-            try:
-                loop.run_until_complete(client_manager.disconnect())
-            except Exception as e:
-                logger.error(f"Error disconnecting client: {str(e)}")
-            loop.close()
+        
+        logger.info(f"Queueing message sync for group {group.name} using account {account.phone_number}")
+        job = await sync_to_async(enqueue_job)(
+            request.user,
+            'sync_messages',
+            {'account_id': account.pk, 'group_id': group.pk, 'limit': limit},
+            sync_messages_job
+        )
+        return job_accepted(request, job)
 
-class TelegramMessageViewSet(viewsets.ReadOnlyModelViewSet):
+class TelegramMessageViewSet(FlatGroupsMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing Telegram messages"""
     serializer_class = TelegramMessageSerializer
+    flat_serializer_class = FlatTelegramMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
     
     def get_queryset(self):
         # Return messages from groups associated with the user's accounts
-        user_accounts = TelegramAccount.objects.filter(user=self.request.user)
-        group_ids = AccountGroupAssociation.objects.filter(
-            account__in=user_accounts
-        ).values_list('group_id', flat=True)
-        return TelegramMessage.objects.filter(group_id__in=group_ids).order_by('-date')
+        return TelegramMessage.objects.filter(
+            group_id__in=accessible_group_ids(self.request.user)
+        ).select_related('group', 'sender_profile').order_by('-date', '-id')
     
-    def list(self, request):
-        # Filter by group if provided
-        group_id = request.query_params.get('group_id')
-        queryset = self.get_queryset()
-        
-        if group_id:
-            queryset = queryset.filter(group_id=group_id)
-        
-        # Paginate the results
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        
+        filters = MessageFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+        
+        if 'group_id' in params:
+            queryset = queryset.filter(group_id=params['group_id'])
+        if 'sender_id' in params:
+            queryset = queryset.filter(sender_id=params['sender_id'])
+        if 'message_type' in params:
+            queryset = queryset.filter(message_type=params['message_type'])
+        if 'since' in params:
+            queryset = queryset.filter(date__gte=params['since'])
+        if 'until' in params:
+            queryset = queryset.filter(date__lt=params['until'])
+        return queryset
 
-class AccountGroupAssociationViewSet(viewsets.ModelViewSet):
+class AccountGroupAssociationViewSet(FlatGroupsMixin, viewsets.ModelViewSet):
     """ViewSet for managing account-group associations"""
     serializer_class = AccountGroupAssociationSerializer
+    flat_serializer_class = FlatAccountGroupAssociationSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         return AccountGroupAssociation.objects.filter(
             account__user=self.request.user
-        )
+        ).select_related('account__user', 'group')
     
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
@@ -613,5 +572,31 @@ class AccountGroupAssociationViewSet(viewsets.ModelViewSet):
         
         return Response({
             'message': f'Association is now {"active" if association.is_active else "inactive"}',
-            'association': AccountGroupAssociationSerializer(association).data
+            'association': AccountGroupAssociationSerializer(association, context={'request': request}).data
         })
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """ViewSet for following and cancelling the background jobs of the user"""
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+    
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Endpoint to cancel a job. A job that has not started is cancelled at
+        once, a running one stops at its next progress report (202)
+        """
+        job = self.get_object()
+        if not cancel_job(job):
+            return Response({
+                'error': f'Job already {job.status}',
+                'job': JobSerializer(job, context={'request': request}).data
+            }, status=status.HTTP_409_CONFLICT)
+        
+        return Response(
+            JobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_200_OK if job.is_finished else status.HTTP_202_ACCEPTED
+        )
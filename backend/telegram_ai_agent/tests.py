@@ -1,10 +1,50 @@
+import asyncio
+import re
+import shutil
+import tempfile
+import threading
 import unittest
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 
-from telegram_integration.models import TelegramAccount, TelegramGroup, TelegramMessage, AccountGroupAssociation
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from celery.exceptions import Retry
+from rest_framework.test import APIClient
+from telethon import TelegramClient, events, errors as telethon_errors
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, StringSession
+from telethon.tl.types import User as TelethonUser, PeerChannel, InputPeerChannel
+from telethon.tl.types.updates import State as UpdateState
+
+from telegram_integration.models import TelegramAccount, TelegramGroup, TelegramSender, TelegramMessage, AccountGroupAssociation, GroupPollSchedule, Job
+from telegram_integration.access import accessible_group_ids
+from telegram_integration.ingest import MessageIngestor
+from telegram_integration.client import TelegramClientManager
+from telegram_integration.search import restore_sqlite_triggers
+from telegram_integration.semantic import GroupVectorIndex, build_group_index
+from telegram_integration.senders import SenderCache
+from telegram_integration.sessions import DjangoSession
+from telegram_integration.collector import CollectorDaemon
+from telegram_integration.bridge import AccountNotAuthorized, TelegramBridge
+from telegram_integration.pool import ClientPool
+from telegram_integration.listener import MessageListener
+from telegram_integration.signals import messages_ingested
+from telegram_integration.ratelimit import AccountRateLimiter, MemoryBucketBackend, RateLimitedTelegramClient
+from telegram_integration.scheduler import CollectionScheduler, load_active_associations, merge_reports
+from telegram_integration.election import CollectorElection
+from telegram_integration.locks import CollectionLock
+from telegram_integration.tasks import collect_account_messages, collect_messages_from_all_groups, dispatch_due_collections, summarize_collection, sync_messages_job
+from ai_summarization.tasks import generate_summary_job
+from ai_summarization.summarizer import GeminiSummarizer
+from telegram_integration.polling import claim_groups, poll_interval, record_poll
 from ai_summarization.models import Summary, SummaryFeedback
 
 class TelegramIntegrationTestCase(TestCase):
@@ -102,6 +142,1346 @@ class TelegramIntegrationTestCase(TestCase):
         unprocessed = TelegramMessage.objects.filter(is_processed=False)
         self.assertEqual(unprocessed.count(), 1)
 
+    def test_message_api_cursor_pagination(self):
+        """Test that the message list pages by cursor in a stable order and filters"""
+        tied = timezone.now() - timedelta(hours=1)
+        for message_id in range(3, 8):
+            TelegramMessage.objects.create(
+                group=self.group, message_id=message_id, sender_id=987654321,
+                sender_name='Test User 1', text=f'Message {message_id}', date=tied,
+                message_type='PHOTO' if message_id == 7 else 'TEXT'
+            )
+        api = APIClient()
+        api.force_authenticate(self.user)
+        
+        ids = []
+        url = '/api/telegram/messages/?page_size=3'
+        while url:
+            response = api.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids += [message['id'] for message in response.data['results']]
+            url = response.data['next']
+        expected = list(TelegramMessage.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        
+        response = api.get('/api/telegram/messages/', {
+            'group_id': self.group.pk,
+            'sender_id': 987654321,
+            'message_type': 'TEXT',
+            'since': (tied - timedelta(minutes=1)).isoformat(),
+        })
+        self.assertEqual([m['message_id'] for m in response.data['results']], [6, 5, 4, 3])
+        
+        response = api.get('/api/telegram/messages/', {'since': tied.isoformat(), 'until': tied.isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+class QueryBudgetTestCase(TestCase):
+    """List endpoints run a fixed number of queries whatever their length"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='testpassword')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.add_rows()
+    
+    def add_rows(self):
+        account = TelegramAccount.objects.create(
+            user=self.user, phone_number=f'+77{TelegramAccount.objects.count()}', api_id='1', api_hash='hash'
+        )
+        for _ in range(3):
+            group = TelegramGroup.objects.create(name='Budget Group', group_id=TelegramGroup.objects.count() + 1)
+            AccountGroupAssociation.objects.create(account=account, group=group)
+            Summary.objects.create(
+                group=group, start_date=timezone.now() - timedelta(days=7), end_date=timezone.now(), content='Summary'
+            )
+            for message_id in range(5):
+                TelegramMessage.objects.create(group=group, message_id=message_id, text='Hello', date=timezone.now())
+    
+    def assert_budget(self, url, queries):
+        for _ in range(2):
+            # Measured once the groups of the user are cached
+            self.api.get(url)
+            with self.assertNumQueries(queries):
+                response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            # Twice the rows, same queries
+            self.add_rows()
+        return response
+    
+    def test_message_list(self):
+        self.assert_budget('/api/telegram/messages/', 1)
+        response = self.assert_budget('/api/telegram/messages/?flat=1', 1)
+        group_id = response.data['results'][0]['group']
+        self.assertEqual(response.data['groups'][str(group_id)]['id'], group_id)
+    
+    def test_association_list(self):
+        self.assert_budget('/api/telegram/associations/', 1)
+        response = self.assert_budget('/api/telegram/associations/?flat=1', 1)
+        self.assertEqual(len(response.data['groups']), len(response.data['results']))
+    
+    def test_summary_list(self):
+        self.assert_budget('/api/ai/summaries/', 1)
+        self.assert_budget('/api/ai/summaries/?flat=1', 1)
+
+class GroupAccessTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='access', password='testpassword')
+        self.account = TelegramAccount.objects.create(user=self.user, phone_number='+7800', api_id='1', api_hash='hash')
+        self.group = TelegramGroup.objects.create(name='Mine', group_id=1)
+        self.other_group = TelegramGroup.objects.create(name='Other', group_id=2)
+        AccountGroupAssociation.objects.create(account=self.account, group=self.group)
+    
+    def test_cached_until_associations_change(self):
+        """Test that group access is read once and invalidated by association changes"""
+        self.assertEqual(accessible_group_ids(self.user), {self.group.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(accessible_group_ids(self.user), {self.group.pk})
+        
+        association = AccountGroupAssociation.objects.create(account=self.account, group=self.other_group)
+        self.assertEqual(accessible_group_ids(self.user), {self.group.pk, self.other_group.pk})
+        association.delete()
+        self.assertEqual(accessible_group_ids(self.user), {self.group.pk})
+        
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post('/api/ai/summaries/generate/', {'group_id': self.other_group.pk}, format='json')
+        self.assertEqual(response.status_code, 403)
+        
+        self.account.delete()
+        self.assertEqual(accessible_group_ids(self.user), set())
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='search', password='testpassword')
+        account = TelegramAccount.objects.create(user=self.user, phone_number='+7900', api_id='1', api_hash='hash')
+        self.group = TelegramGroup.objects.create(name='Search Group', group_id=1)
+        self.hidden_group = TelegramGroup.objects.create(name='Hidden Group', group_id=2)
+        AccountGroupAssociation.objects.create(account=account, group=self.group)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+    
+    def _ingest(self, group, texts):
+        ingestor = MessageIngestor(group)
+        for message_id, text in enumerate(texts, start=1):
+            ingestor.buffer.append({
+                'message_id': message_id, 'sender_name': 'Alice', 'text': text,
+                'message_type': 'TEXT', 'date': timezone.now() - timedelta(hours=message_id)
+            })
+        async_to_sync(ingestor.flush)()
+    
+    def test_search_messages_and_summaries(self):
+        """Test that ingested messages and summaries are searchable, ranked and scoped"""
+        self._ingest(self.group, [
+            'The release is planned for Friday',
+            'Release notes: release candidate builds are out',
+            'Lunch anyone?',
+        ])
+        self._ingest(self.hidden_group, ['Secret release plans'])
+        Summary.objects.create(
+            group=self.group, start_date=timezone.now() - timedelta(days=7), end_date=timezone.now(),
+            content='The team discussed the release schedule'
+        )
+        
+        response = self.api.get('/api/search/', {'q': 'release'})
+        self.assertEqual(response.status_code, 200)
+        messages = response.data['messages']
+        self.assertEqual([m['message_id'] for m in messages], [2, 1])
+        self.assertIn('<mark>release</mark>', messages[0]['snippet'].lower())
+        self.assertGreater(messages[0]['rank'], messages[1]['rank'])
+        self.assertEqual(len(response.data['summaries']), 1)
+        
+        # Edits are reindexed, deleted messages left out
+        TelegramMessage.objects.filter(group=self.group, message_id=3).update(text='Release lunch')
+        TelegramMessage.objects.filter(group=self.group, message_id=1).update(is_deleted=True)
+        response = self.api.get('/api/search/', {'q': 'release lunch', 'type': 'messages'})
+        self.assertEqual([m['message_id'] for m in response.data['messages']], [3])
+        self.assertNotIn('summaries', response.data)
+        
+        response = self.api.get('/api/search/', {
+            'q': 'release', 'since': (timezone.now() - timedelta(minutes=90)).isoformat()
+        })
+        self.assertEqual([m['message_id'] for m in response.data['messages']], [])
+        self.assertEqual(len(response.data['summaries']), 1)
+        
+        response = self.api.get('/api/search/', {'q': 'release', 'group_id': self.hidden_group.pk})
+        self.assertEqual(response.data['messages'], [])
+        self.assertEqual(self.api.get('/api/search/').status_code, 400)
+    
+    def test_triggers_restored_after_migrate(self):
+        """Test that search triggers dropped by a table rebuild are put back by post_migrate"""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER telegram_integration_telegrammessage_fts_insert')
+        self._ingest(self.group, ['Unindexed release'])
+        self.assertEqual(self.api.get('/api/search/', {'q': 'release'}).data['messages'], [])
+        
+        restore_sqlite_triggers()
+        self.assertEqual(len(self.api.get('/api/search/', {'q': 'release'}).data['messages']), 1)
+        TelegramMessage.objects.create(group=self.group, message_id=2, sender_name='Bob', text='Second release', date=timezone.now())
+        self.assertEqual(len(self.api.get('/api/search/', {'q': 'release'}).data['messages']), 2)
+    
+    def test_snippets_are_escaped(self):
+        """Test that message text in snippets cannot inject markup"""
+        self._ingest(self.group, ['Deploy <script>alert("x")</script> tonight'])
+        
+        response = self.api.get('/api/search/', {'q': 'deploy'})
+        snippet = response.data['messages'][0]['snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<mark>Deploy</mark>', snippet)
+
+class SemanticSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = override_settings(TELEGRAM_VECTOR_INDEX_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='semantic', password='testpassword')
+        account = TelegramAccount.objects.create(user=self.user, phone_number='+7950', api_id='1', api_hash='hash')
+        self.group = TelegramGroup.objects.create(name='Semantic Group', group_id=1)
+        AccountGroupAssociation.objects.create(account=account, group=self.group)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+    
+    def _ingest(self, texts, first_id):
+        ingestor = MessageIngestor(self.group)
+        for message_id, text in enumerate(texts, start=first_id):
+            ingestor.buffer.append({
+                'message_id': message_id, 'sender_name': 'Bob', 'text': text, 'message_type': 'TEXT',
+                'date': timezone.now() - timedelta(minutes=100 - message_id)
+            })
+        async_to_sync(ingestor.flush)()
+    
+    def test_related_messages(self):
+        """Test that the index is built, grows with the ingest and answers with context"""
+        url = f'/api/telegram/groups/{self.group.pk}/related/'
+        on_commit = mock.patch('telegram_integration.semantic.transaction.on_commit').start()
+        self.addCleanup(mock.patch.stopall)
+        self._ingest([
+            'The production server crashed during the deploy',
+            'Who wants pizza for lunch today',
+            'Rolling back the deploy fixed the server',
+            'The pasta place is closed for lunch',
+            'Database migrations slowed the deploy down',
+            'Weekend plans: hiking in the mountains',
+        ], first_id=1)
+        response = self.api.get(url, {'q': 'deploy'})
+        self.assertFalse(response.data['indexed'])
+        # One rebuild is queued, however many batches and requests ask for it
+        on_commit.assert_called_once()
+        
+        self.assertEqual(build_group_index(self.group), 6)
+        index = GroupVectorIndex(self.group.pk)
+        index.load()
+        # Ingest batches append to the index without reading it back
+        with mock.patch('telegram_integration.semantic.np.load', wraps=np.load) as load:
+            self._ingest(['Lunch at the pizza place again?'], first_id=7)
+        load.assert_not_called()
+        self.assertEqual(index.indexed_count(), 7)
+        self.assertEqual(len(index.load()[3]), 7)
+        
+        response = self.api.get(url, {'q': 'the server deploy failed', 'k': 3, 'context': 1})
+        self.assertTrue(response.data['indexed'])
+        results = response.data['results']
+        self.assertLessEqual(len(results), 3)
+        self.assertIn('deploy', results[0]['message']['text'])
+        self.assertGreater(results[0]['score'], 0)
+        first = TelegramMessage.objects.get(pk=results[0]['message']['id'])
+        self.assertEqual(len(results[0]['before']) + len(results[0]['after']),
+                         (first.message_id > 1) + (first.message_id < 7))
+        
+        lunch = TelegramMessage.objects.get(group=self.group, message_id=7)
+        response = self.api.get(url, {'message': lunch.pk, 'k': 2})
+        related = [result['message']['message_id'] for result in response.data['results']]
+        self.assertNotIn(7, related)
+        self.assertIn(related[0], [2, 4])
+        self.assertEqual(self.api.get(url).status_code, 400)
+    
+    def test_related_query_count(self):
+        """Test that matches, their context and their senders are fetched in a fixed number of queries"""
+        url = f'/api/telegram/groups/{self.group.pk}/related/'
+        mock.patch('telegram_integration.semantic.transaction.on_commit').start()
+        self.addCleanup(mock.patch.stopall)
+        sender = TelegramSender.objects.create(user_id=42, username='bob')
+        self._ingest([f'Deploy step {i} of the release' for i in range(1, 21)], first_id=1)
+        TelegramMessage.objects.filter(group=self.group).update(sender_profile=sender)
+        build_group_index(self.group)
+        
+        # Warm the cache of the user's groups
+        self.api.get(url, {'q': 'deploy release'})
+        # The group, the matches and the context
+        with self.assertNumQueries(3):
+            response = self.api.get(url, {'q': 'deploy release', 'k': 10, 'context': 3})
+        results = response.data['results']
+        self.assertEqual(len(results), 10)
+        for result in results:
+            message_id = result['message']['message_id']
+            self.assertEqual(result['message']['sender_username'], 'bob')
+            self.assertEqual([m['message_id'] for m in result['before']], list(range(max(1, message_id - 3), message_id)))
+            self.assertEqual([m['message_id'] for m in result['after']], list(range(message_id + 1, min(20, message_id + 3) + 1)))
+
+class MessageIngestTestCase(TestCase):
+    def setUp(self):
+        self.group = TelegramGroup.objects.create(
+            name='Ingest Group',
+            group_id=555,
+            is_active=True
+        )
+        TelegramMessage.objects.create(
+            group=self.group,
+            message_id=1,
+            sender_name='Existing',
+            text='Already stored',
+            date=timezone.now()
+        )
+    
+    def _message(self, message_id):
+        return {
+            'message_id': message_id,
+            'sender_id': 42,
+            'sender_name': 'Sender',
+            'sender_username': None,
+            'text': f'Message {message_id}',
+            'message_type': 'TEXT',
+            'date': timezone.now(),
+            'is_processed': False
+        }
+    
+    def test_batches_dedup_against_stored_ids(self):
+        """Test that each batch skips stored and repeated ids"""
+        ingestor = MessageIngestor(self.group, batch_size=3)
+        for message_id in [1, 2, 2, 3, 4]:
+            async_to_sync(ingestor.add)(self._message(message_id))
+        batches = async_to_sync(ingestor.close)()
+        
+        self.assertEqual(batches, [
+            {'received': 3, 'created': 1, 'skipped': 2},
+            {'received': 2, 'created': 2, 'skipped': 0},
+        ])
+        self.assertEqual(ingestor.created_count, 3)
+        self.assertEqual(TelegramMessage.objects.filter(group=self.group).count(), 4)
+    
+    def test_batch_query_count(self):
+        """Test that a full batch costs one lookup and one insert"""
+        ingestor = MessageIngestor(self.group, batch_size=50)
+        for message_id in range(2, 52):
+            ingestor.buffer.append(self._message(message_id))
+        with CaptureQueriesContext(connection) as context:
+            async_to_sync(ingestor.flush)()
+        # Savepoints aside
+        queries = [q['sql'] for q in context.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(queries), 2)
+    
+    def test_concurrent_insert_is_skipped(self):
+        """Test that messages stored by another collector after the check are skipped"""
+        ingestor = MessageIngestor(self.group)
+        for message_id in [1, 2, 3]:
+            ingestor.buffer.append(self._message(message_id))
+        new_messages = MessageIngestor._new_messages
+        calls = []
+        
+        def stale_check(ingestor, by_id):
+            # The first check misses the stored message 1
+            calls.append(by_id)
+            if len(calls) == 1:
+                return [TelegramMessage(group=self.group, **msg_data) for msg_data in by_id.values()]
+            return new_messages(ingestor, by_id)
+        
+        with mock.patch.object(MessageIngestor, '_new_messages', stale_check):
+            batch = async_to_sync(ingestor.flush)()
+        self.assertEqual(batch, {'received': 3, 'created': 2, 'skipped': 1})
+        self.assertEqual(TelegramMessage.objects.filter(group=self.group).count(), 3)
+
+class FakeSession(MemorySession):
+    """Session that knows the access hash of every peer"""
+    def get_entity_rows_by_id(self, id, exact=True):
+        return id, 1
+
+class FakeTelegramClient:
+    """Minimal stand-in for TelegramClient serving a fixed message history"""
+    def __init__(self, message_ids):
+        self.session = FakeSession()
+        self.messages = [
+            SimpleNamespace(
+                id=message_id,
+                date=timezone.now() - timedelta(minutes=1000 - message_id),
+                text=f'Message {message_id}',
+                media=None,
+                sender_id=42,
+                sender=TelethonUser(id=42, first_name='Test', last_name='Sender', username='sender')
+            )
+            for message_id in message_ids
+        ]
+        self.dialogs = []
+        self.requests = []
+        self.handlers = []
+    
+    def add_event_handler(self, callback, event):
+        self.handlers.append((callback, event))
+    
+    def remove_event_handler(self, callback, event):
+        self.handlers.remove((callback, event))
+    
+    async def is_user_authorized(self):
+        return True
+    
+    def is_connected(self):
+        return True
+    
+    async def disconnect(self):
+        pass
+    
+    async def get_entity(self, peer):
+        if isinstance(peer, list):
+            self.requests.append({'get_entity': sorted(peer)})
+            return [TelethonUser(id=user_id, first_name=f'User {user_id}') for user_id in peer]
+        return SimpleNamespace(id=peer.channel_id if hasattr(peer, 'channel_id') else peer, title='Fake')
+    
+    async def iter_messages(self, entity, limit=None, min_id=0, offset_id=0, reverse=False, offset_date=None, **kwargs):
+        request = {'limit': limit, 'min_id': min_id, 'reverse': reverse}
+        if offset_date:
+            request['offset_date'] = offset_date
+        self.requests.append(request)
+        messages = [m for m in self.messages if m.id > max(min_id, offset_id)]
+        if offset_date:
+            messages = [m for m in messages if (m.date > offset_date if reverse else m.date < offset_date)]
+        if not reverse:
+            messages = list(reversed(messages))
+        for message in messages[:limit]:
+            yield message
+    
+    async def iter_dialogs(self, limit=None, **kwargs):
+        for dialog in self.dialogs[:limit]:
+            yield dialog
+
+class CollectionCursorTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='collector', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+1000000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        self.group = TelegramGroup.objects.create(name='Cursor Group', group_id=777)
+        self.association = AccountGroupAssociation.objects.create(account=self.account, group=self.group)
+        self.manager = TelegramClientManager(self.account)
+    
+    def test_bootstrap_then_incremental(self):
+        """Test that later runs only request messages newer than the cursor"""
+        self.manager.client = FakeTelegramClient(range(1, 11))
+        count = async_to_sync(self.manager.collect_messages)(self.group, limit=5, association=self.association)
+        self.assertEqual(count, 5)
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 10)
+        
+        self.manager.client = FakeTelegramClient(range(1, 16))
+        count = async_to_sync(self.manager.collect_messages)(self.group, association=self.association, batch_size=2)
+        self.assertEqual(count, 5)
+        self.assertEqual(self.manager.client.requests, [{'limit': 1000, 'min_id': 10, 'reverse': True}])
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 15)
+    
+    def test_incremental_fetch_catches_up_in_chunks(self):
+        """Test that a group far behind is fetched chunk by chunk in one pass"""
+        self.association.last_message_id = 10
+        self.association.save()
+        self.manager.limiter.chunk_size = mock.AsyncMock(return_value=10)
+        self.manager.client = FakeTelegramClient(range(1, 36))
+        
+        count = async_to_sync(self.manager.collect_messages)(self.group, association=self.association)
+        self.assertEqual(count, 25)
+        self.assertEqual([request['min_id'] for request in self.manager.client.requests], [10, 20, 30])
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 35)
+    
+    def test_fetch_error_keeps_flushed_batches(self):
+        """Test that a failure mid-fetch is raised, with the cursor at the last stored batch"""
+        self.association.last_message_id = 10
+        self.association.save()
+        self.manager.client = FakeTelegramClient(range(1, 16))
+        fetch = self.manager.client.iter_messages
+        
+        async def failing_iter_messages(*args, **kwargs):
+            async for message in fetch(*args, **kwargs):
+                if message.id == 14:
+                    raise ConnectionError('connection lost')
+                yield message
+        self.manager.client.iter_messages = failing_iter_messages
+        
+        with self.assertRaises(ConnectionError):
+            async_to_sync(self.manager.collect_messages)(self.group, association=self.association, batch_size=2)
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 12)
+        self.assertEqual(TelegramMessage.objects.filter(group=self.group).count(), 2)
+    
+    def test_window_fetches_only_its_messages(self):
+        """Test that a date-bounded collection downloads the window and nothing older"""
+        self.manager.client = FakeTelegramClient(range(1, 21))
+        since = self.manager.client.messages[14].date - timedelta(seconds=1)
+        count = async_to_sync(self.manager.collect_messages)(
+            self.group, limit=None, association=self.association, since=since
+        )
+        self.assertEqual(count, 6)
+        self.assertEqual(self.manager.client.requests, [{'limit': None, 'min_id': 0, 'reverse': True, 'offset_date': since}])
+        self.assertEqual(
+            list(TelegramMessage.objects.filter(group=self.group).order_by('message_id').values_list('message_id', flat=True)),
+            list(range(15, 21))
+        )
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 20)
+        
+        # A window starting above the cursor leaves the gap to incremental collection
+        self.manager.client = FakeTelegramClient(range(1, 31))
+        since = self.manager.client.messages[24].date - timedelta(seconds=1)
+        count = async_to_sync(self.manager.collect_messages)(self.group, association=self.association, since=since)
+        self.assertEqual(count, 6)
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 20)
+    
+    def test_backfill_resumes_from_checkpoint(self):
+        """Test that a limited backfill checkpoints and a later run continues"""
+        self.manager.client = FakeTelegramClient(range(1, 26))
+        count = async_to_sync(self.manager.backfill_messages)(self.group, limit=10, chunk_size=4)
+        self.assertEqual(count, 10)
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.backfill_offset_id, 10)
+        self.assertIsNone(self.association.backfill_completed_at)
+        
+        count = async_to_sync(self.manager.backfill_messages)(self.group, chunk_size=4)
+        self.assertEqual(count, 15)
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.backfill_offset_id, 25)
+        self.assertIsNotNone(self.association.backfill_completed_at)
+        self.assertEqual(TelegramMessage.objects.filter(group=self.group).count(), 25)
+        
+        # Senders come from the batches, never from per-message lookups
+        self.assertEqual(TelegramSender.objects.count(), 1)
+        self.assertEqual(
+            TelegramMessage.objects.filter(group=self.group, sender_profile__user_id=42).count(), 25
+        )
+
+    def test_sync_dialogs_in_bulk(self):
+        """Test that dialogs are upserted with a fixed number of queries"""
+        def dialog(chat_id, title, is_group=True):
+            entity = SimpleNamespace(id=chat_id, title=title, username=None)
+            return SimpleNamespace(entity=entity, is_group=is_group, is_channel=False)
+        
+        self.manager.client = FakeTelegramClient([])
+        self.manager.client.dialogs = [dialog(777, 'Renamed Group'), dialog(42, 'Someone', is_group=False)]
+        self.manager.client.dialogs += [dialog(1000 + i, f'Group {i}') for i in range(50)]
+        
+        with self.assertNumQueries(7):
+            groups_added, total = async_to_sync(self.manager.sync_dialogs)()
+        self.assertEqual((groups_added, total), (50, 52))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.name, 'Renamed Group')
+        self.assertEqual(TelegramGroup.objects.count(), 51)
+        self.assertEqual(AccountGroupAssociation.objects.filter(account=self.account).count(), 51)
+        
+        # Nothing changed, nothing is written
+        with self.assertNumQueries(4):
+            self.assertEqual(async_to_sync(self.manager.sync_dialogs)(), (0, 52))
+
+class CollectorDaemonTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='daemon', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+3000000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        for group_id in (1, 2, 3):
+            group = TelegramGroup.objects.create(name=f'Group {group_id}', group_id=group_id)
+            AccountGroupAssociation.objects.create(account=self.account, group=group)
+    
+    def test_client_reused_across_groups_and_cycles(self):
+        """Test that one client per account serves every group and cycle"""
+        created = []
+        
+        async def fake_create_client(manager):
+            manager.client = FakeTelegramClient(range(1, 4))
+            created.append(manager)
+            return manager.client
+        
+        daemon = CollectorDaemon(interval=1)
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            first = async_to_sync(daemon.run_cycle)()
+            second = async_to_sync(daemon.run_cycle)()
+        
+        self.assertEqual(len(created), 1)
+        self.assertEqual(first['total_messages'], 9)
+        self.assertEqual(second['total_messages'], 0)
+        self.assertFalse(AccountGroupAssociation.objects.filter(last_collection__isnull=True).exists())
+        
+        # Deactivating the account releases its client on the next cycle
+        TelegramAccount.objects.filter(pk=self.account.pk).update(is_active=False)
+        async_to_sync(daemon.run_cycle)()
+        self.assertEqual(daemon.pool.managers, {})
+
+class TelegramBridgeTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bridge', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+3100000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        self.bridge = TelegramBridge(idle_timeout=600)
+        self.addCleanup(self.bridge.shutdown)
+    
+    def test_warm_client_reused_then_evicted(self):
+        """Test that calls share one connected client until it sits idle"""
+        created = []
+        
+        async def fake_create_client(manager):
+            manager.client = FakeTelegramClient(range(1, 4))
+            created.append(threading.get_ident())
+            return manager.client
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            for peer in (5, 6):
+                entity = self.bridge.call(self.account, lambda manager: manager.client.get_entity(peer))
+                self.assertEqual(entity.id, peer)
+        self.assertEqual(len(created), 1)
+        self.assertNotEqual(created[0], threading.get_ident())
+        
+        self.bridge.idle_timeout = 0
+        self.bridge.run(self.bridge.evict_idle())
+        self.assertEqual(self.bridge.pool.managers, {})
+    
+    def test_concurrent_calls_share_one_client(self):
+        """Test that simultaneous requests for an account connect a single client"""
+        created = []
+        
+        async def fake_create_client(manager):
+            await asyncio.sleep(0.05)
+            manager.client = FakeTelegramClient([])
+            created.append(manager)
+            return manager.client
+        
+        pool = ClientPool()
+        async def get_twice():
+            return await asyncio.gather(pool.get(self.account), pool.get(self.account))
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            first, second = async_to_sync(get_twice)()
+        self.assertEqual(len(created), 1)
+        self.assertIs(first, second)
+        self.assertIs(pool.managers[self.account.pk][0], first)
+    
+    def test_unauthorized_account(self):
+        """Test that an account without a session is reported, not pooled"""
+        async def fake_create_client(manager):
+            manager.client = FakeTelegramClient([])
+            manager.client.is_user_authorized = mock.AsyncMock(return_value=False)
+            return manager.client
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            with self.assertRaises(AccountNotAuthorized):
+                self.bridge.call(self.account, lambda manager: manager.client.get_entity(5))
+        self.assertEqual(self.bridge.pool.managers, {})
+
+class AsyncViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='asyncviews', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+3200000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        self.group = TelegramGroup.objects.create(name='Async Group', group_id=901)
+        self.association = AccountGroupAssociation.objects.create(account=self.account, group=self.group)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+    
+    def test_async_actions_dispatch(self):
+        """Test that async actions authenticate, look up objects and answer like sync ones"""
+        url = f'/api/telegram/groups/{self.group.pk}/collect_messages/'
+        payload = {'account_id': self.account.pk, 'collection_type': 'all'}
+        
+        with CollectionLock(self.group.pk):
+            response = self.api.post(url, payload, format='json')
+        self.assertEqual(response.status_code, 409)
+        
+        response = self.api.post(url, dict(payload, account_id=self.account.pk + 100), format='json')
+        self.assertEqual(response.status_code, 404)
+        
+        other_group = TelegramGroup.objects.create(name='Other Group', group_id=902)
+        response = self.api.post(f'/api/telegram/groups/{other_group.pk}/collect_messages/', payload, format='json')
+        self.assertEqual(response.status_code, 404)
+        
+        response = APIClient().post(url, payload, format='json')
+        self.assertIn(response.status_code, (401, 403))
+        
+        # Synchronous routes of the same viewset are untouched
+        response = self.api.get('/api/telegram/groups/')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_group_locked_across_accounts(self):
+        """Test that a group collected through one account cannot be collected through another"""
+        other_account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+3200000001',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        AccountGroupAssociation.objects.create(account=other_account, group=self.group)
+        
+        # e.g. the scheduler collecting the group through the first account
+        with CollectionLock(self.association.group_id):
+            response = self.api.post(
+                f'/api/telegram/groups/{self.group.pk}/collect_messages/',
+                {'account_id': other_account.pk, 'collection_type': 'all'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 409)
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobs', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+3300000000',
+            api_id='1',
+            api_hash='hash',
+            session_string='session',
+            is_active=True
+        )
+        self.group = TelegramGroup.objects.create(name='Job Group', group_id=951)
+        self.association = AccountGroupAssociation.objects.create(account=self.account, group=self.group)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+    
+    def test_sync_messages_runs_as_job(self):
+        """Test that a sync answers 202 at once and the job reports the outcome"""
+        with mock.patch.object(sync_messages_job, 'delay', return_value=SimpleNamespace(id='task-1')):
+            response = self.api.post(
+                f'/api/telegram/groups/{self.group.pk}/sync-messages/',
+                {'account_id': self.account.pk, 'collection_type': 'all'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual(job.task_id, 'task-1')
+        
+        async def fake_create_client(manager):
+            manager.client = FakeTelegramClient(range(1, 11))
+            return manager.client
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            self.assertEqual(sync_messages_job(job.pk), 'succeeded')
+        
+        response = self.api.get(response.data['url'])
+        self.assertEqual(response.data['status'], 'succeeded')
+        self.assertEqual(response.data['processed'], 10)
+        self.assertEqual(response.data['result']['count'], 10)
+        self.assertEqual(response.data['phase'], 'done')
+    
+    def test_sync_messages_waits_for_group_lock(self):
+        """Test that a sync job does not collect a group that is being collected elsewhere"""
+        job = Job.objects.create(user=self.user, kind='sync_messages', params={
+            'account_id': self.account.pk, 'group_id': self.group.pk
+        })
+        
+        with CollectionLock(self.group.pk):
+            with self.assertRaises(Retry):
+                sync_messages_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+        
+        async def fake_create_client(manager):
+            manager.client = FakeTelegramClient(range(1, 4))
+            return manager.client
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            self.assertEqual(sync_messages_job(job.pk), 'succeeded')
+        self.assertFalse(CollectionLock(self.group.pk).locked())
+    
+    def test_cancel_pending_and_running_jobs(self):
+        """Test that a pending job never runs and a running one stops at its next report"""
+        pending = Job.objects.create(user=self.user, kind='sync_messages', task_id='task-2', params={
+            'account_id': self.account.pk, 'group_id': self.group.pk
+        })
+        with mock.patch('telegram_integration.jobs.current_app') as app:
+            response = self.api.post(f'/api/telegram/jobs/{pending.pk}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'cancelled')
+        app.control.revoke.assert_called_once_with('task-2')
+        self.assertIsNone(sync_messages_job(pending.pk))
+        self.assertEqual(self.api.post(f'/api/telegram/jobs/{pending.pk}/cancel/').status_code, 409)
+        
+        TelegramMessage.objects.create(group=self.group, message_id=1, text='Hello', date=timezone.now())
+        job = Job.objects.create(user=self.user, kind='generate_summary', params={'group_id': self.group.pk, 'days': 7})
+        
+        async def cancel_while_summarizing(summarizer, *args):
+            response = await sync_to_async(self.api.post)(f'/api/telegram/jobs/{job.pk}/cancel/')
+            self.assertEqual(response.status_code, 202)
+            return 'Summary'
+        
+        with mock.patch.object(GeminiSummarizer, '__init__', return_value=None), \
+                mock.patch.object(GeminiSummarizer, 'generate_summary', cancel_while_summarizing):
+            self.assertEqual(generate_summary_job(job.pk), 'cancelled')
+        self.assertFalse(Summary.objects.exists())
+        
+        # Other users' jobs are not visible
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='testpassword'))
+        self.assertEqual(other.get(f'/api/telegram/jobs/{job.pk}/').status_code, 404)
+
+class MessageListenerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='listener', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+3000000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        self.group = TelegramGroup.objects.create(name='Live Group', group_id=555)
+        self.association = AccountGroupAssociation.objects.create(account=self.account, group=self.group)
+        self.manager = TelegramClientManager(self.account)
+        self.manager.client = FakeTelegramClient(range(1, 3))
+    
+    def message_event(self, message_id, text, edit_date=None):
+        message = SimpleNamespace(
+            id=message_id,
+            date=timezone.now(),
+            edit_date=edit_date,
+            text=text,
+            media=None,
+            sender_id=42,
+            sender=TelethonUser(id=42, first_name='Test')
+        )
+        return SimpleNamespace(chat_id=-1000000000555, message=message)
+    
+    def test_listen_edit_delete(self):
+        """Test that events are written in batches and advance the cursor"""
+        ingested = []
+        
+        def receiver(sender, group, messages, **kwargs):
+            ingested.append(sorted(m.message_id for m in messages))
+        messages_ingested.connect(receiver)
+        self.addCleanup(messages_ingested.disconnect, receiver)
+        
+        async def scenario():
+            listener = MessageListener(self.manager, [self.association], flush_size=3, flush_interval=60)
+            await listener.start()
+            self.assertEqual(len(self.manager.client.handlers), 3)
+            
+            await listener.on_new_message(self.message_event(3, 'third'))
+            await listener.on_new_message(self.message_event(4, 'fourth'))
+            # Not yet flushed: below the batch size and before the interval
+            self.assertEqual(ingested, [[1, 2]])
+            await listener.on_new_message(self.message_event(5, 'fifth'))
+            self.assertEqual(ingested, [[1, 2], [3, 4, 5]])
+            
+            await listener.on_message_edited(self.message_event(4, 'fourth, edited', edit_date=timezone.now()))
+            await listener.on_message_deleted(SimpleNamespace(chat_id=-1000000000555, deleted_ids=[5]))
+            await listener.stop()
+            self.assertEqual(self.manager.client.handlers, [])
+        
+        async_to_sync(scenario)()
+        
+        stored = {m.message_id: m for m in TelegramMessage.objects.filter(group=self.group)}
+        self.assertEqual(sorted(stored), [1, 2, 3, 4, 5])
+        self.assertEqual(stored[4].text, 'fourth, edited')
+        self.assertIsNotNone(stored[4].edited_at)
+        self.assertTrue(stored[5].is_deleted)
+        self.assertFalse(stored[3].is_deleted)
+        self.association.refresh_from_db()
+        self.assertEqual(self.association.last_message_id, 5)
+
+class UpdateCatchUpTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='catchup', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+5000000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        self.channel = TelegramGroup.objects.create(name='Stateful Channel', group_id=601)
+        self.other = TelegramGroup.objects.create(name='New Channel', group_id=602)
+        self.associations = [
+            AccountGroupAssociation.objects.create(account=self.account, group=group, last_message_id=1)
+            for group in (self.channel, self.other)
+        ]
+    
+    def test_handlers_registered_before_connect(self):
+        """Test that updates caught up on connect find the handlers in place"""
+        manager = TelegramClientManager(self.account, catch_up=True)
+        
+        async def handler(event):
+            pass
+        manager.add_event_handler(handler, events.NewMessage())
+        
+        seen = {}
+        async def fake_connect(client):
+            seen['handlers'] = len(client.list_event_handlers())
+            seen['catch_up'] = client._catch_up
+        
+        with mock.patch.object(RateLimitedTelegramClient, 'connect', fake_connect):
+            async_to_sync(manager.create_client)()
+        self.assertEqual(seen, {'handlers': 1, 'catch_up': True})
+    
+    def test_only_groups_without_state_are_polled(self):
+        """Test that channels with a saved pts are left to getChannelDifference"""
+        manager = TelegramClientManager(self.account, catch_up=True)
+        manager.client = FakeTelegramClient(range(1, 4))
+        manager.client.session.set_update_state(601, UpdateState(pts=10, qts=0, date=timezone.now(), seq=0, unread_count=0))
+        self.assertTrue(manager.has_update_state(self.channel))
+        self.assertFalse(manager.has_update_state(self.other))
+        
+        listener = MessageListener(manager, self.associations)
+        async_to_sync(listener.catch_up)()
+        
+        # One incremental fetch, for the channel without state
+        self.assertEqual(manager.client.requests, [{'limit': 1000, 'min_id': 1, 'reverse': True}])
+        self.assertEqual(listener._caught_up, {a.pk for a in self.associations})
+        self.assertFalse(TelegramClientManager(self.account).has_update_state(self.channel))
+
+class SlowTelegramClient(FakeTelegramClient):
+    """Fake client that records how many fetches run at the same time"""
+    def __init__(self, message_ids, tracker, delay=0.05):
+        super().__init__(message_ids)
+        self.tracker = tracker
+        self.delay = delay
+    
+    async def iter_messages(self, *args, **kwargs):
+        self.tracker['current'] += 1
+        self.tracker['peak'] = max(self.tracker['peak'], self.tracker['current'])
+        try:
+            await asyncio.sleep(self.delay)
+            async for message in super().iter_messages(*args, **kwargs):
+                yield message
+        finally:
+            self.tracker['current'] -= 1
+
+class CollectionSchedulerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='scheduler', password='testpassword')
+        for account_index in range(3):
+            account = TelegramAccount.objects.create(
+                user=self.user,
+                phone_number=f'+400000000{account_index}',
+                api_id='1',
+                api_hash='hash',
+                is_active=True
+            )
+            for group_index in range(3):
+                group = TelegramGroup.objects.create(
+                    name=f'Group {account_index}-{group_index}',
+                    group_id=account_index * 10 + group_index
+                )
+                AccountGroupAssociation.objects.create(account=account, group=group)
+    
+    def test_concurrency_caps_and_report(self):
+        """Test that accounts run in parallel within the global and per-account caps"""
+        tracker = {'current': 0, 'peak': 0}
+        
+        async def fake_create_client(manager):
+            manager.client = SlowTelegramClient(range(1, 3), tracker)
+            return manager.client
+        
+        scheduler = CollectionScheduler(max_concurrency=4, per_account_concurrency=2)
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            report = async_to_sync(scheduler.run)()
+        
+        self.assertEqual(tracker['peak'], 4)
+        self.assertEqual(report['total_messages'], 18)
+        self.assertEqual(report['groups'], {'succeeded': 9, 'failed': 0, 'skipped': 0})
+        self.assertEqual(len(report['accounts']), 3)
+        self.assertTrue(all(len(account['groups']) == 3 for account in report['accounts']))
+    
+    def test_locked_groups_are_skipped(self):
+        """Test that a group collected elsewhere is skipped, not collected twice"""
+        association = AccountGroupAssociation.objects.order_by('pk').first()
+        
+        async def fake_create_client(manager):
+            manager.client = FakeTelegramClient(range(1, 3))
+            return manager.client
+        
+        with CollectionLock(association.group_id) as acquired:
+            self.assertTrue(acquired)
+            self.assertFalse(CollectionLock(association.group_id).acquire())
+            with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+                report = async_to_sync(CollectionScheduler().run)()
+        
+        self.assertEqual(report['groups'], {'succeeded': 8, 'failed': 0, 'skipped': 1})
+        self.assertFalse(CollectionLock(association.group_id).locked())
+        self.assertEqual(merge_reports([report, report])['total_messages'], 32)
+    
+    def test_fan_out_per_account(self):
+        """Test that the periodic task dispatches one task per account in a chord"""
+        dispatched = {}
+        
+        def fake_chord(header):
+            dispatched['accounts'] = [signature.args[0] for signature in header]
+            def apply(callback):
+                dispatched['callback'] = callback.task
+                return SimpleNamespace(id='summary')
+            return apply
+        
+        with mock.patch('telegram_integration.tasks.chord', fake_chord):
+            result = collect_messages_from_all_groups()
+        
+        self.assertEqual(result, {'accounts': 3, 'summary_task_id': 'summary'})
+        self.assertEqual(dispatched['accounts'], sorted(TelegramAccount.objects.values_list('pk', flat=True)))
+        self.assertEqual(dispatched['callback'], summarize_collection.name)
+
+class CollectorElectionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='election', password='testpassword')
+        self.accounts = [
+            TelegramAccount.objects.create(
+                user=self.user,
+                phone_number=f'+600000000{index}',
+                api_id='1',
+                api_hash='hash',
+                is_active=True
+            )
+            for index in range(2)
+        ]
+        self.shared = TelegramGroup.objects.create(name='Shared Group', group_id=701)
+        self.first, self.second = [
+            AccountGroupAssociation.objects.create(account=account, group=self.shared)
+            for account in self.accounts
+        ]
+        # The first account collected the group so far
+        self.first.last_collection = timezone.now()
+        self.first.last_message_id = 5
+        self.first.save()
+    
+    def test_one_collector_per_group(self):
+        """Test that a shared group is collected once, spreading groups over healthy accounts"""
+        own = TelegramGroup.objects.create(name='Own Group', group_id=702)
+        own_association = AccountGroupAssociation.objects.create(account=self.accounts[0], group=own)
+        
+        plan = async_to_sync(CollectorElection(async_to_sync(load_active_associations)()).elect)()
+        self.assertEqual([a.pk for a in plan[self.accounts[0].pk]], [own_association.pk])
+        self.assertEqual([a.pk for a in plan[self.accounts[1].pk]], [self.second.pk])
+        
+        # Failing collections move the group back to the other subscriber,
+        # which starts from the group's newest cursor
+        AccountGroupAssociation.objects.filter(pk=self.second.pk).update(consecutive_failures=2, last_message_id=9)
+        election = CollectorElection(async_to_sync(load_active_associations)())
+        plan = async_to_sync(election.elect)()
+        self.assertNotIn(self.accounts[1].pk, plan)
+        elected = [a for a in plan[self.accounts[0].pk] if a.group_id == self.shared.pk][0]
+        self.assertEqual(elected.pk, self.first.pk)
+        self.assertEqual(elected.last_message_id, 9)
+        self.assertEqual([a.pk for a in election.standbys[self.shared.pk]], [self.second.pk])
+    
+    def test_failover_to_standby(self):
+        """Test that an unavailable collector hands the group to a standby account"""
+        clients = {}
+        
+        async def fake_create_client(manager):
+            if manager.account.pk == self.accounts[0].pk:
+                raise ConnectionError('unreachable')
+            manager.client = clients[manager.account.pk] = FakeTelegramClient(range(1, 9))
+            return manager.client
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            report = async_to_sync(CollectionScheduler().run)()
+        
+        self.assertEqual(report['failovers'], 1)
+        self.assertEqual(report['standby'], 1)
+        self.assertEqual(report['groups'], {'succeeded': 1, 'failed': 0, 'skipped': 1})
+        self.assertEqual(report['total_messages'], 3)
+        self.assertEqual(clients[self.accounts[1].pk].requests, [{'limit': 1000, 'min_id': 5, 'reverse': True}])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.consecutive_failures, 1)
+        self.assertEqual(self.first.last_error, 'account error')
+    
+    def test_unresolvable_group_fails_over(self):
+        """Test that a collector that cannot resolve the group records a failure and hands it over"""
+        clients = {}
+        
+        async def fake_create_client(manager):
+            manager.client = clients[manager.account.pk] = FakeTelegramClient(range(1, 9))
+            if manager.account.pk == self.accounts[0].pk:
+                # Neither cached nor among the dialogs of the account
+                manager.client.session = MemorySession()
+            return manager.client
+        
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            report = async_to_sync(CollectionScheduler().run)()
+        
+        self.assertEqual(report['groups'], {'succeeded': 1, 'failed': 1, 'skipped': 0})
+        self.assertEqual(report['failovers'], 1)
+        self.assertEqual(clients[self.accounts[0].pk].requests, [])
+        self.assertEqual(clients[self.accounts[1].pk].requests, [{'limit': 1000, 'min_id': 5, 'reverse': True}])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.consecutive_failures, 1)
+        self.assertIn('Could not resolve entity', self.first.last_error)
+    
+    def test_celery_collector_starts_from_shared_cursor(self):
+        """Test that a worker collecting through a newly elected account resumes at the group's cursor"""
+        AccountGroupAssociation.objects.filter(pk=self.first.pk).update(consecutive_failures=2)
+        dispatched = []
+        
+        def fake_chord(header):
+            dispatched.extend(signature.args for signature in header)
+            return lambda callback: SimpleNamespace(id='summary')
+        
+        with mock.patch('telegram_integration.tasks.chord', fake_chord):
+            collect_messages_from_all_groups()
+        self.assertEqual(dispatched, [(self.accounts[1].pk, [self.second.pk])])
+        
+        client = FakeTelegramClient(range(1, 9))
+        async def fake_create_client(manager):
+            manager.client = client
+            return manager.client
+        
+        # The worker reloads the association from the database
+        with mock.patch.object(TelegramClientManager, 'create_client', fake_create_client):
+            report = collect_account_messages(*dispatched[0])
+        self.assertEqual(report['total_messages'], 3)
+        self.assertEqual(client.requests, [{'limit': 1000, 'min_id': 5, 'reverse': True}])
+
+class GroupPollScheduleTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='polling', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+7000000000',
+            api_id='1',
+            api_hash='hash',
+            is_active=True
+        )
+        self.busy, self.quiet = [
+            TelegramGroup.objects.create(name=name, group_id=801 + index)
+            for index, name in enumerate(['Busy Group', 'Quiet Group'])
+        ]
+        for group in (self.busy, self.quiet):
+            AccountGroupAssociation.objects.create(account=self.account, group=group)
+    
+    def test_interval_follows_message_rate(self):
+        """Test that busy groups are polled often and quiet ones rarely, within bounds"""
+        self.assertEqual(poll_interval(0), 3600)
+        self.assertEqual(poll_interval(10000), 60)
+        self.assertEqual(poll_interval(120), 600)
+        
+        now = timezone.now()
+        record_poll(self.busy, 0, now=now)
+        self.assertEqual(GroupPollSchedule.objects.get(group=self.busy).interval, 3600)
+        
+        # 200 messages in 10 minutes, blended half and half with the idle rate
+        interval = record_poll(self.busy, 200, now=now + timedelta(minutes=10))
+        self.assertEqual(interval, 120)
+        schedule = GroupPollSchedule.objects.get(group=self.busy)
+        self.assertEqual(schedule.message_rate, 600)
+        
+        # The group calms down again, the interval grows back
+        interval = record_poll(self.busy, 0, now=now + timedelta(minutes=11))
+        self.assertEqual(interval, 240)
+        self.assertEqual(GroupPollSchedule.objects.get(group=self.busy).message_rate, 300)
+    
+    def test_dispatch_only_due_groups(self):
+        """Test that the dispatcher collects due groups once and leaves the others alone"""
+        now = timezone.now()
+        GroupPollSchedule.objects.create(
+            group=self.quiet, message_rate=0, interval=3600,
+            next_poll_at=now + timedelta(minutes=30)
+        )
+        dispatched = []
+        
+        def fake_chord(header):
+            dispatched.extend(signature.args[1] for signature in header)
+            return lambda callback: SimpleNamespace(id='summary')
+        
+        with mock.patch('telegram_integration.tasks.chord', fake_chord):
+            result = dispatch_due_collections()
+            self.assertEqual(result['groups'], 1)
+            # The claimed group is not dispatched again while it is collected
+            self.assertEqual(dispatch_due_collections(), {'accounts': 0, 'groups': 0})
+        
+        busy_association = AccountGroupAssociation.objects.get(group=self.busy)
+        self.assertEqual(dispatched, [[busy_association.pk]])
+        self.assertGreater(GroupPollSchedule.objects.get(group=self.busy).next_poll_at, now)
+    
+    def test_claim_groups_in_bulk(self):
+        """Test that claiming groups takes a fixed number of queries, however many there are"""
+        now = timezone.now()
+        groups = [TelegramGroup.objects.create(name=f'Claimed {index}', group_id=900 + index) for index in range(5)]
+        for group in groups[:2]:
+            GroupPollSchedule.objects.create(group=group, message_rate=0, interval=600, next_poll_at=now)
+        TelegramMessage.objects.create(group=groups[3], message_id=1, sender_name='A', text='Hi', date=now)
+        
+        # Read the schedules, push the existing ones, count the history, create the others
+        with self.assertNumQueries(4):
+            claim_groups(groups, now=now)
+        
+        schedules = {s.group_id: s for s in GroupPollSchedule.objects.filter(group__in=groups)}
+        self.assertEqual(len(schedules), 5)
+        self.assertEqual(schedules[groups[0].pk].next_poll_at, now + timedelta(seconds=600))
+        self.assertEqual(schedules[groups[3].pk].interval, poll_interval(1 / 24))
+        self.assertEqual(schedules[groups[4].pk].interval, 3600)
+
+class RateLimiterTestCase(TestCase):
+    def setUp(self):
+        self.backend = MemoryBucketBackend()
+        self.limiter = AccountRateLimiter(1, backend=self.backend, rate=1, burst=2, max_wait=10, max_chunk=1000)
+    
+    def test_burst_then_wait(self):
+        """Test that requests beyond the burst have to wait for a refill"""
+        acquire = async_to_sync(self.backend.acquire)
+        self.assertEqual(acquire(self.limiter.key, 1, 2), 0)
+        self.assertEqual(acquire(self.limiter.key, 1, 2), 0)
+        self.assertGreater(acquire(self.limiter.key, 1, 2), 0.5)
+    
+    def test_new_bucket_starts_full(self):
+        """Test that reading the chunk size first does not empty the bucket"""
+        async_to_sync(self.limiter.chunk_size)()
+        self.assertEqual(async_to_sync(self.backend.acquire)(self.limiter.key, 1, 2), 0)
+    
+    def test_flood_wait_blocks_and_shrinks_chunks(self):
+        """Test that a FloodWait blocks the account and adapts the chunk size"""
+        self.assertEqual(async_to_sync(self.limiter.chunk_size)(), 1000)
+        async_to_sync(self.limiter.penalize)(60)
+        
+        other = AccountRateLimiter(1, backend=self.backend, rate=1, burst=2, max_wait=10)
+        with self.assertRaises(telethon_errors.FloodWaitError):
+            async_to_sync(other.acquire)()
+        self.assertEqual(async_to_sync(other.chunk_size)(), 500)
+        
+        # The pass that hit the FloodWait does not grow the chunk again
+        async_to_sync(self.limiter.record_success)()
+        self.assertEqual(async_to_sync(self.limiter.chunk_size)(), 500)
+        async_to_sync(self.limiter.record_success)()
+        self.assertEqual(async_to_sync(self.limiter.chunk_size)(), 600)
+    
+    def test_client_retries_after_flood_wait(self):
+        """Test that the client records a FloodWait and retries the request"""
+        client = RateLimitedTelegramClient(StringSession(), 1, 'hash', limiter=self.limiter)
+        responses = [telethon_errors.FloodWaitError(request=None, capture=0), 'result']
+        
+        async def fake_call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        
+        with mock.patch.object(TelegramClient, '_call', fake_call):
+            result = async_to_sync(client._call)(None, None)
+        
+        self.assertEqual(result, 'result')
+        self.assertEqual(client.flood_sleep_threshold, 0)
+        self.assertGreater(self.backend._buckets[self.limiter.key]['blocked_until'], 0)
+
+class SenderCacheTestCase(TestCase):
+    def test_resolve_order(self):
+        """Test that observed users, stored rows and the network are used in turn"""
+        TelegramSender.objects.create(user_id=2, first_name='Stored')
+        cache = SenderCache()
+        cache.observe(TelethonUser(id=1, first_name='Observed', username='observed'))
+        client = FakeTelegramClient([])
+        
+        senders = async_to_sync(cache.resolve)([1, 2, 3, 4], client=client)
+        self.assertEqual(senders[1].username, 'observed')
+        self.assertEqual(senders[2].display_name, 'Stored')
+        self.assertEqual(senders[4].display_name, 'User 4')
+        self.assertEqual(client.requests, [{'get_entity': [3, 4]}])
+        self.assertEqual(TelegramSender.objects.count(), 4)
+        
+        with self.assertNumQueries(0):
+            async_to_sync(cache.resolve)([1, 2, 3, 4], client=client)
+    
+    def test_lru_and_ttl(self):
+        """Test that the cache evicts the least recently used and expired entries"""
+        cache = SenderCache(maxsize=2, ttl=60)
+        for user_id in [1, 2]:
+            cache.put(TelegramSender(user_id=user_id))
+        cache.get(1)
+        cache.put(TelegramSender(user_id=3))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(1))
+        
+        cache.ttl = -1
+        cache.put(TelegramSender(user_id=4))
+        self.assertIsNone(cache.get(4))
+
+class DjangoSessionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sessionuser', password='testpassword')
+        self.account = TelegramAccount.objects.create(
+            user=self.user,
+            phone_number='+2000000000',
+            api_id='1',
+            api_hash='hash',
+            session_string=self._session_string(),
+            is_active=True
+        )
+    
+    def _session_string(self):
+        session = StringSession()
+        session.set_dc(2, '149.154.167.51', 443)
+        session.auth_key = AuthKey(b'\x01' * 256)
+        return session.save()
+    
+    def test_entities_and_state_survive_reload(self):
+        """Test that access hashes and update state are read back from the database"""
+        session = DjangoSession(self.account, track_updates=True)
+        async_to_sync(session.load)()
+        session.process_entities([
+            InputPeerChannel(channel_id=321, access_hash=99),
+            TelethonUser(id=5, access_hash=7, username='Alice', first_name='Alice')
+        ])
+        session.set_update_state(0, UpdateState(pts=10, qts=2, date=timezone.now(), seq=3, unread_count=0))
+        async_to_sync(session.persist)()
+        
+        reloaded = DjangoSession(self.account, track_updates=True)
+        async_to_sync(reloaded.load)()
+        self.assertEqual(reloaded.get_input_entity(PeerChannel(321)), InputPeerChannel(321, 99))
+        self.assertEqual(reloaded.get_input_entity('alice').access_hash, 7)
+        self.assertEqual(reloaded.get_update_state(0).pts, 10)
+        
+        # Checkpoints re-save unchanged states, which must not be written again
+        reloaded.set_update_state(0, UpdateState(pts=10, qts=2, date=timezone.now(), seq=3, unread_count=0))
+        with self.assertNumQueries(0):
+            async_to_sync(reloaded.persist)()
+    
+    def test_other_clients_keep_the_listener_checkpoint(self):
+        """Test that a client not catching up leaves the saved update state alone"""
+        listener = DjangoSession(self.account, track_updates=True)
+        async_to_sync(listener.load)()
+        listener.set_update_state(601, UpdateState(pts=10, qts=0, date=timezone.now(), seq=0, unread_count=0))
+        async_to_sync(listener.persist)()
+        
+        # e.g. a scheduled collection, which gets the current state on connect
+        manager = TelegramClientManager(self.account)
+        async def fake_connect(client):
+            client.session.set_update_state(601, UpdateState(pts=50, qts=0, date=timezone.now(), seq=0, unread_count=0))
+            client.session.process_entities([InputPeerChannel(channel_id=601, access_hash=5)])
+        
+        with mock.patch.object(RateLimitedTelegramClient, 'connect', fake_connect), \
+                mock.patch.object(RateLimitedTelegramClient, 'disconnect', mock.AsyncMock()):
+            async_to_sync(manager.create_client)()
+            async_to_sync(manager.disconnect)()
+        
+        reloaded = DjangoSession(self.account, track_updates=True)
+        async_to_sync(reloaded.load)()
+        self.assertEqual(reloaded.get_update_state(601).pts, 10)
+        # Entities are still shared
+        self.assertEqual(reloaded.get_input_entity(PeerChannel(601)).access_hash, 5)
+
 class AISummarizationTestCase(TestCase):
     def setUp(self):
         # Create test user
@@ -160,6 +1540,81 @@ class AISummarizationTestCase(TestCase):
         # Test ordering
         summaries = Summary.objects.all().order_by('-end_date')
         self.assertEqual(summaries.first(), self.summary)
+    
+    def test_large_window_is_summarized_in_chunks(self):
+        """Test that a large window is summarized chunk by chunk, then combined"""
+        prompts = []
+        running = {'now': 0, 'max': 0}
+        failed = set()
+        sleep = asyncio.sleep
+        
+        async def generate_content_async(prompt):
+            prompts.append(prompt)
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            try:
+                await sleep(0.01)
+                part = re.search(r'summarizing (part \d+) of', prompt)
+                part = part and part.group(1)
+                if part == 'part 2' and part not in failed:
+                    failed.add(part)
+                    raise RuntimeError('Gemini unavailable')
+                return SimpleNamespace(text=f"notes on {part}" if part else 'final summary')
+            finally:
+                running['now'] -= 1
+        
+        summarizer = GeminiSummarizer.__new__(GeminiSummarizer)
+        summarizer.model = SimpleNamespace(generate_content_async=generate_content_async)
+        messages = [
+            {'sender_name': f'User {i}', 'date': self.start_date, 'text': 'x' * 400}
+            for i in range(12)
+        ]
+        
+        with override_settings(SUMMARY_CHUNK_TOKENS=500, SUMMARY_MAX_CONCURRENCY=2), \
+                mock.patch('ai_summarization.summarizer.asyncio.sleep', mock.AsyncMock()):
+            summary = async_to_sync(summarizer.generate_summary)(
+                messages, 'Test Group', self.start_date, self.end_date
+            )
+        
+        self.assertEqual(summary, 'final summary')
+        chunk_prompts = [p for p in prompts if 'summarizing part' in p]
+        # 3 chunks of 4 messages plus the retry of the failed one
+        self.assertEqual(len(chunk_prompts), 4)
+        self.assertEqual(sum(p.count('User ') for p in chunk_prompts), 12 + 4)
+        self.assertLessEqual(running['max'], 2)
+        # One call combines the notes of every chunk
+        self.assertEqual(len(prompts), 5)
+        self.assertIn('notes on part 2', prompts[-1])
+        self.assertIn('Notes 3:', prompts[-1])
+    
+    def test_chunks_keep_messages_whole(self):
+        """Test that multi-line messages stay in one chunk and long ones keep their sender"""
+        prompts = []
+        
+        async def generate_content_async(prompt):
+            prompts.append(prompt)
+            return SimpleNamespace(text='notes')
+        
+        summarizer = GeminiSummarizer.__new__(GeminiSummarizer)
+        summarizer.model = SimpleNamespace(generate_content_async=generate_content_async)
+        multi_line = 'first line\n' + 'b' * 100 + '\nthird line ' + 'c' * 100
+        messages = [
+            {'sender_name': 'Alice', 'date': self.start_date, 'text': 'a' * 300},
+            {'sender_name': 'Bob', 'date': self.start_date, 'text': multi_line},
+            {'sender_name': 'Carol', 'date': self.start_date, 'text': 'x' * 1000},
+        ]
+        
+        with override_settings(SUMMARY_CHUNK_TOKENS=100):
+            async_to_sync(summarizer.generate_summary)(messages, 'Test Group', self.start_date, self.end_date)
+        
+        chunk_prompts = [p for p in prompts if 'summarizing part' in p]
+        self.assertEqual(sum(multi_line in p for p in chunk_prompts), 1)
+        self.assertNotIn('first line', chunk_prompts[0])
+        # The long message is split, every piece attributed
+        carol = [line.strip() for p in chunk_prompts for line in p.splitlines() if 'xxx' in line]
+        self.assertGreater(len(carol), 1)
+        self.assertTrue(all('Carol: ' in line for line in carol))
+        self.assertEqual(sum(line.count('x') for line in carol), 1000)
 
 if __name__ == '__main__':
     unittest.main()
@@ -75,6 +75,21 @@ export const summaryAPI = {
     api.post('/feedback/', { summary: summaryId, rating, comment }),
 };
 
+// Background Job API (long syncs and summary generation answer with a job)
+export const jobAPI = {
+  getJob: (jobId) => 
+    api.get(`/telegram/jobs/${jobId}/`),
+  
+  cancelJob: (jobId) => 
+    api.post(`/telegram/jobs/${jobId}/cancel/`),
+};
+
+// Search API (full-text search over messages and summaries)
+export const searchAPI = {
+  search: (q, params = {}) => 
+    api.get('/search/', { params: { q, ...params } }),
+};
+
 // Request interceptor for adding auth token
 api.interceptors.request.use(
   (config) => {